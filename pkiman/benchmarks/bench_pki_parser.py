@@ -0,0 +1,220 @@
+"""Сравнение PKIObject и ParsedCertificate/ParsedCertificateRevocationList.
+
+Запуск из каталога проекта: python benchmarks/bench_pki_parser.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pkiman.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django_pkiman.tests.utils import make_crl, make_crt  # noqa: E402
+from cryptography import x509  # noqa: E402
+from cryptography.hazmat.primitives import hashes  # noqa: E402
+from django.utils.timezone import make_aware  # noqa: E402
+
+from django_pkiman.utils.pki_parser import oid2name, parse_x509  # noqa: E402
+
+# поля, которые читает CrtManager.get_from_pki
+CRT_FIELDS = ('subject_identifier', 'subject', 'subject_serial_number', 'issuer_identifier', 'issuer',
+              'issuer_serial_number', 'fingerprint', 'not_valid_before', 'not_valid_after', 'CA', 'is_root',
+              'cdp_info', 'auth_info')
+NUMBER = 2000
+
+
+class PKIObject:
+    """Исходный разбор x509 объекта в dict с доступом к полям через атрибуты - база для сравнения"""
+
+    def __init__(self, x509obj: 'x509.Certificate|x509.CertificateRevocationList|None' = None):
+        self.pki_type = None
+        self._object = x509obj
+        self._parsed = {}
+
+        if x509obj:
+            if isinstance(x509obj, x509.Certificate):
+                self.pki_type = 'crt'
+            elif isinstance(x509obj, x509.CertificateRevocationList):
+                self.pki_type = 'crl'
+            else:
+                raise ValueError('Неверный тип объекта')
+
+        if x509obj:
+            self.parse()
+
+    def __str__(self):
+        return f'PKI:<{self.subject_identifier}>'
+
+    def __getattribute__(self, item):
+        # проверка имен для предотвращения рекурсии
+        if item != '_parsed' and item in self._parsed:
+            return self._parsed.get(item)
+        return super().__getattribute__(item)
+
+    @property
+    def parsed(self):
+        return self._parsed
+
+    @property
+    def object(self):
+        return self._object
+
+    def parse(self):
+        """"""
+        if self._object is None:
+            raise ValueError('Объект x509 не определен или не загружен')
+        if self.pki_type == 'crt':
+            parser = self._parse_crt
+        elif self.pki_type == 'crl':
+            parser = self._parse_crl
+        else:
+            raise ValueError(f'Неопределенный тип объекта: {self.pki_type}')
+
+        self._parsed = parser(self._object)
+
+    @staticmethod
+    def _parse_crt(pki_obj):
+        """"""
+        subject_id = issuer_id = None
+        parsed = {
+            'version': {pki_obj.version.value: pki_obj.version.name},
+            'subject': {oid2name.get(obj_attr.oid, obj_attr.oid.dotted_string): obj_attr.value for obj_attr in
+                        pki_obj.subject},
+            'subject_identifier': None,
+            'subject_serial_number': str(pki_obj.serial_number) if pki_obj.serial_number else None,  # todo check for
+            # unsigned
+            'issuer': {oid2name.get(obj_attr.oid, obj_attr.oid.dotted_string): obj_attr.value for obj_attr in
+                       pki_obj.issuer},
+            'issuer_identifier': None,
+            'issuer_serial_number': None,
+            'not_valid_after': make_aware(pki_obj.not_valid_after),
+            'not_valid_before': make_aware(pki_obj.not_valid_before),
+            'CA': False,
+            'cdp_info': None,
+            'auth_info': None,
+            'fingerprint': pki_obj.fingerprint(algorithm=hashes.SHA1()).hex(),
+        }
+        #
+        for extension in pki_obj.extensions:
+            # CA=True or False
+            if extension.oid.dotted_string == '2.5.29.19':
+                parsed['CA'] = extension.value.ca
+            # SubjectKeyIdentifier
+            if extension.oid.dotted_string == '2.5.29.14':
+                parsed['subject_identifier'] = extension.value.key_identifier.hex()
+                subject_id = extension.value.key_identifier.hex()
+            #
+            if extension.oid.dotted_string == '1.3.6.1.4.1.311.20.2':
+                parsed['1.3.6.1.4.1.311.20.2'] = extension.value.value
+            # authorityKeyIdentifier
+            if extension.oid.dotted_string == '2.5.29.35':
+                # parsed['issuerKeyIdentifier'] = {
+                #     'authority_cert_serial_number': str(extension.value.authority_cert_serial_number),
+                #     'key_identifier': extension.value.key_identifier.hex()
+                # }
+                parsed['issuer_identifier'] = extension.value.key_identifier.hex()
+                parsed['issuer_serial_number'] = str(extension.value.authority_cert_serial_number)
+                issuer_id = extension.value.key_identifier.hex()
+            # CDP
+            if extension.oid.dotted_string == '2.5.29.31':
+                parsed['cdp_info'] = {num: [cdp.value for cdp in cdp_list.full_name] for num, cdp_list in
+                                      enumerate(extension.value)}
+            # authorityInfoAccess
+            if extension.oid.dotted_string == '1.3.6.1.5.5.7.1.1':
+                parsed['auth_info'] = {ia.access_method._name: ia.access_location.value for ia in
+                                       extension.value}
+
+        parsed['is_root'] = parsed['CA'] and (subject_id == issuer_id or parsed['subject'] == parsed['issuer'])
+        return parsed
+
+    @staticmethod
+    def _parse_crl(pki_obj):
+        """"""
+        parsed = {
+            'issuer': {oid2name.get(obj_attr.oid, obj_attr.oid.dotted_string): obj_attr.value for obj_attr in
+                       pki_obj.issuer},
+            'issuer_identifier': None,
+            'issuer_serial_number': None,
+            'crl_number': None,
+            'last_update': make_aware(pki_obj.last_update),
+            'next_update': make_aware(pki_obj.next_update),
+            'revoked_count': len(pki_obj),
+            'fingerprint': pki_obj.fingerprint(algorithm=hashes.SHA1()).hex(),
+        }
+        for extension in pki_obj.extensions:
+            # issuerKeyIdentifier
+            if extension.oid.dotted_string == '2.5.29.35':
+                parsed['issuer_identifier'] = extension.value.key_identifier.hex()
+                parsed['issuer_serial_number'] = extension.value.authority_cert_serial_number
+            # cRLNumber
+            if extension.oid.dotted_string == '2.5.29.20':
+                parsed['crl_number'] = str(extension.value.crl_number)
+        # список отозванных сертификатов не разбирается - записи выдаются генератором iter_revoked()
+        return parsed
+
+
+def read_fields(pki, fields):
+    for name in fields:
+        getattr(pki, name)
+
+
+def bench(title, stmt, number=NUMBER):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+    print(f'{title:<60} {seconds / number * 1e6:10.2f} us')
+
+
+def parsed_crt(crt):
+    pki = parse_x509(crt)
+    read_fields(pki, CRT_FIELDS)
+    return pki
+
+
+def allocated(factory, count=1000):
+    tracemalloc.start()
+    objects = [factory() for _ in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+
+def main():
+    ca, ca_key = make_crt('Bench CA', ca=True)
+    crt, _ = make_crt('Bench user', issuer_crt=ca, issuer_key=ca_key,
+                      cdp_urls=['http://pki.test/ca.crl'], aia_urls=['http://pki.test/ca.crt'])
+    crl = make_crl(ca, ca_key, revoked=range(1, 5001))
+
+    print('--- сертификат: создание и чтение полей get_from_pki')
+    bench('PKIObject(crt) + все поля', lambda: read_fields(PKIObject(crt), CRT_FIELDS))
+    bench('ParsedCertificate + все поля', lambda: read_fields(parse_x509(crt), CRT_FIELDS))
+
+    print('--- сертификат: чтение subject и serial (поиск дубликата)')
+    partial = ('subject', 'subject_serial_number')
+    bench('PKIObject(crt)', lambda: read_fields(PKIObject(crt), partial))
+    bench('ParsedCertificate', lambda: read_fields(parse_x509(crt), partial))
+
+    print('--- сертификат: повторное чтение разобранных полей x100')
+    pki_object, parsed = PKIObject(crt), parse_x509(crt)
+    read_fields(parsed, CRT_FIELDS)
+    bench('PKIObject', lambda: read_fields(pki_object, CRT_FIELDS * 100), number=200)
+    bench('ParsedCertificate', lambda: read_fields(parsed, CRT_FIELDS * 100), number=200)
+
+    print('--- список отзыва (5000 записей): заголовок и количество')
+    crl_fields = ('issuer', 'issuer_identifier', 'crl_number', 'last_update', 'next_update', 'revoked_count',
+                  'fingerprint')
+    bench('PKIObject(crl)', lambda: read_fields(PKIObject(crl), crl_fields), number=200)
+    bench('ParsedCertificateRevocationList', lambda: read_fields(parse_x509(crl), crl_fields), number=200)
+
+    print('--- память на объект после чтения всех полей')
+    print(f'{"PKIObject":<60} {allocated(lambda: PKIObject(crt)):10.0f} B')
+    print(f'{"ParsedCertificate":<60} {allocated(lambda: parsed_crt(crt)):10.0f} B')
+
+
+if __name__ == '__main__':
+    main()
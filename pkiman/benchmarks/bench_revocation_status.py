@@ -0,0 +1,61 @@
+"""Проверка статуса отзыва: поиск по индексу и по фильтру Блума с подтверждением по индексу.
+
+Запуск из каталога проекта: python benchmarks/bench_revocation_status.py [количество отозванных]
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pkiman.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django_pkiman.utils.bloom import BloomFilter  # noqa: E402
+from django_pkiman.utils.revocation_index import RevocationIndex, pack_serial, write_index  # noqa: E402
+
+REVOKED = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+BATCH = 1000
+REVOKED_SHARE = 0.01
+
+
+def bench(title, stmt, number=20, count=BATCH):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5)) / number
+    print(f'{title:<60} {seconds / count * 1e6:8.2f} us {count / seconds:12.0f} /s')
+
+
+def main():
+    rnd = random.Random(1)
+    revoked = sorted({rnd.getrandbits(64) for _ in range(REVOKED)})
+    date = datetime.datetime.now(datetime.timezone.utc)
+    batch = [rnd.getrandbits(64) for _ in range(BATCH)]
+    batch[:int(BATCH * REVOKED_SHARE)] = rnd.sample(revoked, int(BATCH * REVOKED_SHARE))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench.rsi')
+        write_index(path, [(serial, date, None) for serial in revoked])
+        index = RevocationIndex(path)
+        stamp, keys = index.keys()
+        bloom = BloomFilter.from_keys(keys)
+        print(f'отозвано {REVOKED}, индекс {os.path.getsize(path)} B, фильтр {len(bloom.bits)} B, '
+              f'пакет {BATCH}, отозванных в пакете {REVOKED_SHARE:.0%}')
+
+        def with_bloom():
+            packed = [pack_serial(serial) for serial in batch]
+            index.search_keys([key for key in packed if key in bloom])
+
+        bench('индекс: бинарный поиск каждого номера', lambda: index.get_many(batch))
+        bench('фильтр Блума + подтверждение по индексу', with_bloom)
+        bench('построение фильтра по индексу (на запись)', lambda: BloomFilter.from_keys(index.keys()[1]), number=1,
+              count=len(revoked))
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Поиск по индексу FTS5 на синтетическом реестре: префиксные запросы по DN, идентификатору ключа,
+серийному номеру и отпечатку. Время - выборка всех pk подзапроса поиска (search.match_subquery).
+
+Запуск из каталога проекта: python benchmarks/bench_search.py [количество сертификатов]
+"""
+import hashlib
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pkiman.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.test.runner import DiscoverRunner  # noqa: E402
+
+from django_pkiman.utils import search  # noqa: E402
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+REPEAT = 20
+SURNAMES = ('Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Smith', 'Johnson', 'Müller', 'Wójcik')
+ORGANIZATIONS = ('ООО Ромашка', 'АО Вектор', 'Example Corp', 'ПАО Связь', 'Test Bank')
+
+
+def rows(rnd: random.Random):
+    for pk in range(1, COUNT + 1):
+        serial = rnd.getrandbits(64)
+        digest = hashlib.sha256(serial.to_bytes(8, 'big')).hexdigest()
+        terms = [f'{rnd.choice(SURNAMES)} {pk}', rnd.choice(ORGANIZATIONS), 'RU', f'user{pk}@pki.test',
+                 digest[:40], digest[24:64], str(serial), f'{serial:x}', digest[:40], digest,
+                 digest[8:40]]
+        yield search.rowid(search.KIND_CRT, pk), ' '.join(terms)
+
+
+def bench(title, text):
+    subquery = search.match_subquery(search.KIND_CRT, search.query_tokens(text))
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(subquery.sql, subquery.params)
+            found = cursor.fetchall()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f'{title:<40} {text[:24]:<26} найдено {len(found):7}  '
+          f'медиана {timings[len(timings) // 2] * 1000:8.3f} ms  макс {timings[-1] * 1000:8.3f} ms')
+
+
+def main():
+    rnd = random.Random(1)
+    runner = DiscoverRunner(verbosity=0)
+    runner.setup_test_environment()
+    databases = runner.setup_databases()
+    started = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {search.SEARCH_TABLE} (rowid, terms) VALUES (%s, %s)', rows(rnd))
+        cursor.execute(f"INSERT INTO {search.SEARCH_TABLE} ({search.SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT terms FROM {search.SEARCH_TABLE} WHERE rowid = %s',
+                       [search.rowid(search.KIND_CRT, COUNT // 2)])
+        sample = cursor.fetchone()[0].split()
+    print(f'записей {COUNT}, индексирование {time.perf_counter() - started:.1f} с')
+
+    bench('фамилия и номер', f'{sample[0]} {sample[1]}')
+    bench('префикс фамилии (много совпадений)', 'иван')
+    bench('организация', 'ромашка')
+    bench('префикс организации', 'ромаш')
+    bench('email', sample[5])
+    bench('идентификатор ключа AA:BB:..', ':'.join(sample[6][num:num + 2] for num in range(0, 16, 2)))
+    bench('серийный номер (десятичный)', sample[8][:10])
+    bench('серийный номер 0x', f'0x{sample[9]}')
+    bench('префикс отпечатка SHA-256', sample[11][:12])
+    bench('нет совпадений', 'отсутствует')
+    runner.teardown_databases(databases)
+    runner.teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Нагрузочная проверка OCSP ответчика на localhost.
+
+Создает тестовую БД и временный MEDIA_ROOT, выпускает тестовый УЦ, список отзыва и сертификат ответчика,
+поднимает WSGI сервер на 127.0.0.1 и отправляет запросы из нескольких потоков.
+
+Запуск из каталога проекта: python benchmarks/load_ocsp.py [--requests N] [--concurrency N] [--revoked N]
+                                                           [--serials N] [--method get|post]
+"""
+import argparse
+import base64
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pkiman.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import requests  # noqa: E402
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.x509 import ocsp as x509_ocsp  # noqa: E402
+from django.core.servers.basehttp import (ThreadedWSGIServer, WSGIRequestHandler,  # noqa: E402
+                                          get_internal_wsgi_application)
+from django.test.runner import DiscoverRunner  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from django_pkiman import models  # noqa: E402
+from django_pkiman.tests.utils import as_upload, make_crl, make_crt  # noqa: E402
+from django_pkiman.utils.ocsp import OCSP_REQUEST_CONTENT_TYPE  # noqa: E402
+from django_pkiman.utils.pki_parser import read_x509  # noqa: E402
+
+
+class QuietHandler(WSGIRequestHandler):
+    def setup(self):
+        super().setup()
+        # заголовки и тело ответа пишутся отдельно, без TCP_NODELAY задержка ACK добавляет ~40 мс
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+
+def setup_pki(tmp_dir: str, revoked: int):
+    ca, ca_key = make_crt('Load CA', ca=True)
+    responder, responder_key = make_crt('Load OCSP', issuer_crt=ca, issuer_key=ca_key)
+    cert_path, key_path = os.path.join(tmp_dir, 'responder.crt'), os.path.join(tmp_dir, 'responder.key')
+    with open(cert_path, 'wb') as f:
+        f.write(responder.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(responder_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                            serialization.NoEncryption()))
+    models.Crt.objects.get_from_pki(read_x509(as_upload(ca)))
+    crl = make_crl(ca, ca_key, revoked=range(1, revoked + 1))
+    crl_object, _ = models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))
+    return ca, ca_key, crl_object, cert_path, key_path
+
+
+def make_requests(ca, ca_key, serials: int, revoked: int) -> list:
+    """DER запросы по номерам, половина - из списка отзыва"""
+    rnd = random.Random(1)
+    result = []
+    for num in range(serials):
+        serial = rnd.randint(1, revoked) if num % 2 and revoked else revoked + num + 1
+        crt, _ = make_crt(f'Load {serial}', key=ca_key, issuer_crt=ca, issuer_key=ca_key, serial=serial)
+        result.append((x509_ocsp.OCSPRequestBuilder()
+                       .add_certificate(crt, ca, hashes.SHA1())
+                       .build()
+                       .public_bytes(serialization.Encoding.DER)))
+    return result
+
+
+def run(base_url: str, ocsp_requests: list, count: int, concurrency: int, method: str) -> list:
+    local = threading.local()
+
+    def send(num):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        der = ocsp_requests[num % len(ocsp_requests)]
+        started = time.perf_counter()
+        if method == 'get':
+            response = session.get(f'{base_url}/ocsp/{base64.b64encode(der).decode()}')
+        else:
+            response = session.post(f'{base_url}/ocsp/', data=der,
+                                    headers={'Content-Type': OCSP_REQUEST_CONTENT_TYPE})
+        elapsed = time.perf_counter() - started
+        status = x509_ocsp.load_der_ocsp_response(response.content).response_status
+        return elapsed, status == x509_ocsp.OCSPResponseStatus.SUCCESSFUL
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(send, range(count)))
+
+
+def report(title: str, results: list, seconds: float):
+    latency = sorted(elapsed for elapsed, _ in results)
+    quantiles = statistics.quantiles(latency, n=100)
+    errors = sum(not ok for _, ok in results)
+    print(f'{title:<24} {len(results) / seconds:8.0f} req/s  p50 {quantiles[49] * 1000:7.2f} ms  '
+          f'p95 {quantiles[94] * 1000:7.2f} ms  p99 {quantiles[98] * 1000:7.2f} ms  ошибок {errors}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--revoked', type=int, default=10000)
+    parser.add_argument('--serials', type=int, default=200)
+    parser.add_argument('--method', choices=('get', 'post'), default='post')
+    options = parser.parse_args()
+
+    runner = DiscoverRunner(verbosity=0)
+    runner.setup_test_environment()
+    databases = runner.setup_databases()
+    with tempfile.TemporaryDirectory() as tmp_dir, override_settings(MEDIA_ROOT=tmp_dir, DEBUG=False):
+        ca, ca_key, crl_object, cert_path, key_path = setup_pki(tmp_dir, options.revoked)
+        with override_settings(PKIMAN_OCSP_RESPONDER_CERT=cert_path, PKIMAN_OCSP_RESPONDER_KEY=key_path):
+            server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+            server.set_app(get_internal_wsgi_application())
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            ocsp_requests = make_requests(ca, ca_key, options.serials, options.revoked)
+            print(f'отозвано {options.revoked}, номеров {options.serials}, запросов {options.requests}, '
+                  f'потоков {options.concurrency}, метод {options.method.upper()}')
+            for title in ('первый проход', 'повторный проход'):
+                started = time.perf_counter()
+                results = run(base_url, ocsp_requests, options.requests, options.concurrency, options.method)
+                report(title, results, time.perf_counter() - started)
+            server.shutdown()
+            server.server_close()
+    runner.teardown_databases(databases)
+    runner.teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
@@ -59,6 +59,9 @@ class CrtAdmin(PKIModelAdminMixin, admin.ModelAdmin):
                        'subject_dn_as_text_nl',
                        'subject_serial_number',
                        'fingerprint',
+                       'fingerprint_sha256',
+                       'fingerprint_md5',
+                       'fingerprint_gost',
                        'valid_after',
                        'valid_before',
                        'cdp_info',
@@ -117,6 +120,9 @@ class CrlAdmin(PKIModelAdminMixin, admin.ModelAdmin):
     list_display = ('issuer_name', 'issuer_subject_identifier', 'last_update', 'next_update', 'schedule', 'active')
     readonly_fields = ('issuer',
                        'fingerprint',
+                       'fingerprint_sha256',
+                       'fingerprint_md5',
+                       'fingerprint_gost',
                        'file',
                        'crl_number',
                        'revoked_count',
@@ -126,6 +132,8 @@ class CrlAdmin(PKIModelAdminMixin, admin.ModelAdmin):
                        'f_size',
                        'f_etag',
                        'f_sync',
+                       'next_check',
+                       'publish_interval',
                        )
     fieldsets = [
         ('Данные списка отзыва', {
@@ -133,6 +141,9 @@ class CrlAdmin(PKIModelAdminMixin, admin.ModelAdmin):
             'classes': ('wide',),
             'fields': ('issuer',
                        'fingerprint',
+                       'fingerprint_sha256',
+                       'fingerprint_md5',
+                       'fingerprint_gost',
                        'crl_number',
                        'file',
                        'revoked_count',
@@ -157,6 +168,8 @@ class CrlAdmin(PKIModelAdminMixin, admin.ModelAdmin):
                        'f_etag',
                        'f_size',
                        'f_sync',
+                       'next_check',
+                       'publish_interval',
                        )
             }),
         ]
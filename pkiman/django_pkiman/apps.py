@@ -7,6 +7,15 @@ class DjangoPkimanConfig(AppConfig):
     name = 'django_pkiman'
     verbose_name = 'PKI менеджер'
 
+    def ready(self):
+        from django_pkiman.signals import revoked_serials_changed
+        from django_pkiman.utils import ocsp, revocation_status
+
+        # разница загруженного списка отзыва передается кэшам статуса отзыва
+        revoked_serials_changed.connect(revocation_status.revoked_serials_changed_handler,
+                                        dispatch_uid='pkiman_revocation_status')
+        revoked_serials_changed.connect(ocsp.revoked_serials_changed_handler, dispatch_uid='pkiman_ocsp')
+
 
 class PKIAdminConfig(AdminConfig):
     default_site = "django_pkiman.admin.PKIAdminSite"
@@ -49,3 +49,12 @@ class PKIUrlContentTypeInvalid(PKIUrlError):
 
 class PKIUrlInvalid(PKIUrlError):
     message = 'Не валидный URL'
+
+
+class PKIUrlSizeError(PKIUrlError):
+    message = 'Размер загружаемого файла превышает допустимый'
+
+
+###
+class PKIOcspResponderError(PKIError):
+    message = 'Не настроен или не загружается ключ/сертификат OCSP ответчика'
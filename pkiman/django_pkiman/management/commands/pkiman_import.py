@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_pkiman import models
+from django_pkiman.utils import define_suffix
+from django_pkiman.utils.logger import logger
+from django_pkiman.utils.pki_parser import read_x509_path
+
+DEFAULT_STATE_FILE_NAME = '.pkiman-import.state'
+
+
+def parse_file(path: str) -> tuple:
+    """Разбор файла в процессе пула. Возвращает (путь, [ParsedPKI, ...], текст ошибки)"""
+    try:
+        return path, read_x509_path(path), None
+    except Exception as e:
+        return path, [], f'{e.__class__.__name__}: {e}'
+
+
+class Command(BaseCommand):
+    help = ('Загрузка сертификатов и списков отзыва из каталога. Файлы разбираются параллельно в пуле процессов, '
+            'запись в БД выполняется пакетами. Повторный запуск пропускает обработанные файлы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='каталог с файлами crt, cer, der, pem, p7b, crl')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='количество процессов разбора (по умолчанию - количество CPU)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='количество объектов в одной транзакции записи')
+        parser.add_argument('--state-file',
+                            help=f'файл состояния для продолжения загрузки (по умолчанию <path>/{DEFAULT_STATE_FILE_NAME})')
+        parser.add_argument('--restart', action='store_true', help='начать загрузку заново, игнорируя файл состояния')
+
+    def handle(self, *args, **options):
+        root = Path(options['path'])
+        if not root.is_dir():
+            raise CommandError(f'Каталог не найден: {root}')
+        self.workers = max(options['workers'], 1)
+        self.batch_size = max(options['batch_size'], 1)
+        self.verbosity = options['verbosity']
+        state_file = Path(options['state_file'] or root / DEFAULT_STATE_FILE_NAME)
+        if options['restart'] and state_file.exists():
+            state_file.unlink()
+        done = set(state_file.read_text().splitlines()) if state_file.exists() else set()
+
+        crt_files, crl_files = [], []
+        for path in sorted(root.rglob('*')):
+            suffix = define_suffix(path.name, None)
+            if suffix is None or str(path) in done or not path.is_file():
+                continue
+            (crl_files if suffix == 'crl' else crt_files).append(str(path))
+
+        self.stats = dict(files=0, skipped=len(done), created=0, exists=0, errors=0)
+        self.total = len(crt_files) + len(crl_files)
+        self.started = time.monotonic()
+        self.stdout.write(f'Файлов к загрузке: {self.total}, обработано ранее: {len(done)}, процессов: {self.workers}')
+
+        with state_file.open('a') as self.state:
+            # списки отзыва загружаются после сертификатов издателей
+            for files in (crt_files, crl_files):
+                if files:
+                    self.import_files(files)
+
+        elapsed = time.monotonic() - self.started
+        stats = self.stats
+        message = (f'Загрузка каталога {root}: файлов {stats["files"]}, создано {stats["created"]}, '
+                   f'загружено ранее {stats["exists"]}, ошибок {stats["errors"]}, время {elapsed:.1f} с, '
+                   f'{stats["files"] / elapsed if elapsed else 0:.1f} файл/с, '
+                   f'{(stats["created"] + stats["exists"]) / elapsed if elapsed else 0:.1f} объект/с')
+        logger.info(message)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def import_files(self, files: list):
+        """Разбор файлов в пуле процессов и запись результатов пакетами в текущем процессе"""
+        # соединения с БД не должны наследоваться процессами пула
+        connections.close_all()
+        chunksize = max(1, min(64, len(files) // (self.workers * 4)))
+        batch, batch_files = [], []
+        with multiprocessing.Pool(self.workers, initializer=django.setup) as pool:
+            for path, pki_list, error in pool.imap_unordered(parse_file, files, chunksize=chunksize):
+                if error:
+                    # файл не отмечается обработанным и разбирается повторно при следующем запуске
+                    self.stats['files'] += 1
+                    self.stats['errors'] += 1
+                    logger.error(f'Загрузка файла {path}: {error}')
+                    self.stderr.write(f'{path}: {error}')
+                    continue
+                batch.extend(pki_list)
+                batch_files.append(path)
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch, batch_files)
+                    batch, batch_files = [], []
+            if batch_files:
+                self.write_batch(batch, batch_files)
+
+    def write_batch(self, batch: list, batch_files: list):
+        result = models.get_from_pki_list(batch)
+        self.stats['files'] += len(batch_files)
+        self.stats['created'] += len(result.created)
+        self.stats['exists'] += len(result.exists)
+        self.stats['errors'] += len(result.errors)
+        if self.verbosity > 1:
+            for pki, error in result.errors:
+                self.stderr.write(f'{pki.pki_type}::{pki}: {error}')
+        # файлы отмечаются обработанными после фиксации транзакции пакета
+        self.state.write(''.join(f'{path}\n' for path in batch_files))
+        self.state.flush()
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'[{self.stats["files"]}/{self.total}] создано {self.stats["created"]}, '
+                          f'загружено ранее {self.stats["exists"]}, ошибок {self.stats["errors"]}, '
+                          f'{self.stats["files"] / elapsed:.1f} файл/с')
@@ -0,0 +1,36 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from django_pkiman.utils import download
+from django_pkiman.utils.scheduler import RefreshScheduler
+
+
+class Command(BaseCommand):
+    help = 'Обновление списков отзыва, время проверки которых наступило. С --loop - постоянная работа по очереди ' \
+           'времени проверки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='работать до прерывания (Ctrl+C, SIGTERM)')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            summary = download.update_handle()
+            self.stdout.write(str(summary) if summary else 'Нет списков отзыва для обновления')
+            return
+
+        def refresh(crl_list):
+            summary = download.refresh_crls(crl_list)
+            self.stdout.write(str(summary))
+            return summary
+
+        stop = threading.Event()
+        # SIGTERM (остановка службы) завершает цикл после текущего обновления
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        try:
+            RefreshScheduler(refresh).run(stop)
+        except KeyboardInterrupt:
+            stop.set()
+        finally:
+            signal.signal(signal.SIGTERM, previous)
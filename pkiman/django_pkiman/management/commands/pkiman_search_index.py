@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from django_pkiman import models
+from django_pkiman.utils import search
+
+
+class Command(BaseCommand):
+    help = 'Перестроение индекса полнотекстового поиска сертификатов и списков отзыва (SQLite FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='псевдоним БД')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        started = time.monotonic()
+        with transaction.atomic(using=using):
+            count = search.rebuild(models.Crt.objects.using(using),
+                                   models.Crl.objects.using(using).select_related('issuer'),
+                                   using)
+        if not search.is_available(using):
+            raise CommandError('БД не поддерживает индекс FTS5, поиск выполняется фильтрами по полям моделей')
+        self.stdout.write(f'Проиндексировано объектов: {count} за {time.monotonic() - started:.1f} с')
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:46
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_raw_digest(apps, schema_editor):
+    """Дайджест содержимого ранее загруженных файлов"""
+    for model_name in ('Crt', 'Crl'):
+        model = apps.get_model('django_pkiman', model_name)
+        for obj in model.objects.filter(raw_digest__isnull=True).only('pk', 'file').iterator():
+            try:
+                with obj.file.open('rb') as fobj:
+                    digest = hashlib.sha256(fobj.read()).hexdigest()
+            except (OSError, ValueError):
+                continue
+            model.objects.filter(pk=obj.pk).update(raw_digest=digest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_pkiman', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crl',
+            name='raw_digest',
+            field=models.CharField(db_index=True, max_length=64, null=True, verbose_name='дайджест файла'),
+        ),
+        migrations.AddField(
+            model_name='crt',
+            name='raw_digest',
+            field=models.CharField(db_index=True, max_length=64, null=True, verbose_name='дайджест файла'),
+        ),
+        migrations.RunPython(fill_raw_digest, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:47
+
+import hashlib
+
+from cryptography import x509
+from cryptography.hazmat.primitives.serialization import Encoding
+from django.db import migrations, models
+
+# копии функций разбора на момент миграции: изменения кода приложения не меняют результат миграции
+GOST_HASHLIB_NAMES = ('streebog256', 'md_gost12_256')
+
+
+def is_der(raw_data: bytes) -> bool:
+    if len(raw_data) < 2 or raw_data[:1] != b'\x30':
+        return False
+    return 0x81 <= raw_data[1] <= 0x84 or raw_data[1] < 0x80
+
+
+def load_x509(raw_data: bytes, suffix: str):
+    is_crl = suffix == 'crl'
+    if is_der(raw_data):
+        return x509.load_der_x509_crl(raw_data) if is_crl else x509.load_der_x509_certificate(raw_data)
+    return x509.load_pem_x509_crl(raw_data) if is_crl else x509.load_pem_x509_certificate(raw_data)
+
+
+def gost_hash():
+    for name in GOST_HASHLIB_NAMES:
+        try:
+            return hashlib.new(name)
+        except ValueError:
+            continue
+    try:
+        from pygost import gost34112012256
+    except ImportError:
+        return None
+    return gost34112012256.new()
+
+
+def fingerprints(der_data: bytes) -> dict:
+    hashers = {
+        'sha256': hashlib.sha256(),
+        'md5': hashlib.md5(),
+        'gost': gost_hash(),
+    }
+    for hasher in hashers.values():
+        if hasher is not None:
+            hasher.update(der_data)
+    return {name: hasher.hexdigest() if hasher is not None else None for name, hasher in hashers.items()}
+
+
+def fill_fingerprints(apps, schema_editor):
+    """Отпечатки ранее загруженных файлов"""
+    for model_name, suffix in (('Crt', 'crt'), ('Crl', 'crl')):
+        model = apps.get_model('django_pkiman', model_name)
+        for obj in model.objects.filter(fingerprint_sha256__isnull=True).only('pk', 'file').iterator():
+            try:
+                with obj.file.open('rb') as fobj:
+                    x509obj = load_x509(fobj.read(), suffix)
+            except (OSError, ValueError):
+                continue
+            values = fingerprints(x509obj.public_bytes(Encoding.DER))
+            model.objects.filter(pk=obj.pk).update(fingerprint_sha256=values['sha256'],
+                                                   fingerprint_md5=values['md5'],
+                                                   fingerprint_gost=values['gost'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_pkiman', '0002_raw_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crl',
+            name='fingerprint_gost',
+            field=models.CharField(db_index=True, max_length=64, null=True, verbose_name='отпечаток ГОСТ Р 34.11-2012'),
+        ),
+        migrations.AddField(
+            model_name='crl',
+            name='fingerprint_md5',
+            field=models.CharField(db_index=True, max_length=32, null=True, verbose_name='отпечаток MD5'),
+        ),
+        migrations.AddField(
+            model_name='crl',
+            name='fingerprint_sha256',
+            field=models.CharField(db_index=True, max_length=64, null=True, verbose_name='отпечаток SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='crt',
+            name='fingerprint_gost',
+            field=models.CharField(db_index=True, max_length=64, null=True, verbose_name='отпечаток ГОСТ Р 34.11-2012'),
+        ),
+        migrations.AddField(
+            model_name='crt',
+            name='fingerprint_md5',
+            field=models.CharField(db_index=True, max_length=32, null=True, verbose_name='отпечаток MD5'),
+        ),
+        migrations.AddField(
+            model_name='crt',
+            name='fingerprint_sha256',
+            field=models.CharField(db_index=True, max_length=64, null=True, verbose_name='отпечаток SHA-256'),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_pkiman', '0003_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedSerial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serial', models.CharField(max_length=64, verbose_name='серийный номер')),
+                ('revocation_date', models.DateTimeField(verbose_name='дата отзыва')),
+                ('reason', models.PositiveSmallIntegerField(choices=[(0, 'не указана'), (1, 'компрометация ключа'), (2, 'компрометация ключа УЦ'), (3, 'изменение принадлежности'), (4, 'замена сертификата'), (5, 'прекращение деятельности'), (6, 'приостановление действия'), (8, 'исключение из списка отзыва'), (9, 'отзыв полномочий'), (10, 'компрометация ключа AA')], null=True, verbose_name='причина отзыва')),
+                ('issuer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revoked_serials', to='django_pkiman.crt', verbose_name='издатель')),
+            ],
+            options={
+                'verbose_name': 'Отозванный сертификат',
+                'verbose_name_plural': 'Отозванные сертификаты',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='revokedserial',
+            constraint=models.UniqueConstraint(fields=('issuer', 'serial'), name='revoked_serial_issuer_serial_uniq'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.1 on 2026-10-17 02:03
+
+from django.db import migrations, models
+
+STEPLEN = 4
+BATCH_SIZE = 500
+CHAIN_STATUS_FIELDS = ('chain_revoked', 'chain_valid_after', 'chain_valid_before')
+
+
+def fill_chain_status(apps, schema_editor):
+    """Статус цепочки ранее загруженных сертификатов: обход дерева в порядке path"""
+    model = apps.get_model('django_pkiman', 'Crt')
+    nodes = {}
+    changed = []
+    for obj in model.objects.order_by('path').only('pk', 'path', 'valid_after', 'valid_before', 'revoked_date',
+                                                   *CHAIN_STATUS_FIELDS).iterator():
+        parent = nodes.get(obj.path[:-STEPLEN])
+        obj.chain_revoked = obj.revoked_date is not None or (parent is not None and parent.chain_revoked)
+        obj.chain_valid_after = max(obj.valid_after, parent.chain_valid_after) if parent else obj.valid_after
+        obj.chain_valid_before = min(obj.valid_before, parent.chain_valid_before) if parent else obj.valid_before
+        nodes[obj.path] = obj
+        changed.append(obj)
+        if len(changed) >= BATCH_SIZE:
+            model.objects.bulk_update(changed, CHAIN_STATUS_FIELDS)
+            changed = []
+    if changed:
+        model.objects.bulk_update(changed, CHAIN_STATUS_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_pkiman', '0004_revoked_serial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crt',
+            name='chain_revoked',
+            field=models.BooleanField(default=False, verbose_name='отозван сертификат цепочки'),
+        ),
+        migrations.AddField(
+            model_name='crt',
+            name='chain_valid_after',
+            field=models.DateTimeField(null=True, verbose_name='цепочка действительна с'),
+        ),
+        migrations.AddField(
+            model_name='crt',
+            name='chain_valid_before',
+            field=models.DateTimeField(null=True, verbose_name='цепочка действительна до'),
+        ),
+        migrations.RunPython(fill_chain_status, migrations.RunPython.noop),
+    ]
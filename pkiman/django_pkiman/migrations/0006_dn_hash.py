@@ -0,0 +1,85 @@
+# Generated by Django 4.2.1 on 2026-10-17 02:05
+
+import hashlib
+import json
+import unicodedata
+
+from django.db import migrations, models
+
+
+# копии функций на момент миграции: изменения кода приложения не меняют результат миграции
+def canonical_dn(dn: dict) -> str:
+    return json.dumps([[name, ' '.join(unicodedata.normalize('NFKC', str(value)).casefold().split())]
+                       for name, value in dn.items()], ensure_ascii=False, separators=(',', ':'))
+
+
+def dn_hash(dn: dict) -> str:
+    return hashlib.sha256(canonical_dn(dn).encode()).hexdigest()
+
+
+def fill_dn_hash(apps, schema_editor):
+    """Хеши DN ранее загруженных сертификатов"""
+    model = apps.get_model('django_pkiman', 'Crt')
+    changed = []
+    for obj in model.objects.only('pk', 'subject_dn', 'issuer_dn').iterator():
+        obj.subject_dn_hash = dn_hash(obj.subject_dn)
+        obj.issuer_dn_hash = dn_hash(obj.issuer_dn)
+        changed.append(obj)
+        if len(changed) >= 500:
+            model.objects.bulk_update(changed, ('subject_dn_hash', 'issuer_dn_hash'))
+            changed = []
+    if changed:
+        model.objects.bulk_update(changed, ('subject_dn_hash', 'issuer_dn_hash'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_pkiman', '0005_chain_status'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='crt',
+            name='crt_get_issuer_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='crt',
+            name='crt_filter_orphans_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='crt',
+            name='crl_get_issuer_crt',
+        ),
+        migrations.AlterUniqueTogether(
+            name='crt',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='crt',
+            name='issuer_dn_hash',
+            field=models.CharField(max_length=64, null=True, verbose_name='хеш DN издателя'),
+        ),
+        migrations.AddField(
+            model_name='crt',
+            name='subject_dn_hash',
+            field=models.CharField(max_length=64, null=True, verbose_name='хеш DN субъекта'),
+        ),
+        migrations.RunPython(fill_dn_hash, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='crt',
+            unique_together={('issuer_dn_hash', 'serial')},
+        ),
+        migrations.AddIndex(
+            model_name='crt',
+            index=models.Index(fields=['subject_dn_hash', 'subject_identifier'], name='crt_get_issuer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crt',
+            index=models.Index(fields=['issuer_dn_hash', 'issuer_identifier', 'issuer', 'is_root_ca'], name='crt_filter_orphans_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crt',
+            index=models.Index(fields=['subject_dn_hash', 'subject_identifier', 'serial'], name='crl_get_issuer_crt'),
+        ),
+    ]
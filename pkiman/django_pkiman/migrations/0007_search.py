@@ -0,0 +1,76 @@
+from django.db import DatabaseError, migrations
+
+# копии определений индекса на момент миграции: изменения кода приложения не меняют результат миграции
+SEARCH_TABLE = 'django_pkiman_search'
+CREATE_SQL = (f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(terms, detail=none, '
+              f'prefix=\'2 3 4\', tokenize="unicode61 remove_diacritics 2")')
+DROP_SQL = f'DROP TABLE IF EXISTS {SEARCH_TABLE}'
+KIND_CRT = 0
+KIND_CRL = 1
+BATCH_SIZE = 500
+
+
+def serial_terms(serial):
+    if not serial:
+        return []
+    return [serial, f'{int(serial):x}']
+
+
+def dn_terms(dn):
+    return [str(value) for value in (dn or {}).values()]
+
+
+def crt_terms(crt):
+    return ' '.join(filter(None, [*dn_terms(crt.subject_dn), crt.subject_identifier, crt.issuer_identifier,
+                                  *serial_terms(crt.serial), crt.fingerprint, crt.fingerprint_sha256,
+                                  crt.fingerprint_md5, crt.fingerprint_gost]))
+
+
+def crl_terms(crl):
+    issuer = crl.issuer
+    return ' '.join(filter(None, [*dn_terms(issuer.subject_dn), issuer.subject_identifier,
+                                  *serial_terms(issuer.serial), crl.crl_number, crl.fingerprint,
+                                  crl.fingerprint_sha256, crl.fingerprint_md5, crl.fingerprint_gost]))
+
+
+def create_search_index(apps, schema_editor):
+    """Индекс полнотекстового поиска (SQLite FTS5) по ранее загруженным сертификатам и спискам отзыва"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_SQL)
+    except DatabaseError:
+        # SQLite без FTS5 - поиск выполняется фильтрами ORM
+        return
+    using = connection.alias
+    for kind, terms, queryset in (
+            (KIND_CRT, crt_terms, apps.get_model('django_pkiman', 'Crt').objects.using(using)),
+            (KIND_CRL, crl_terms, apps.get_model('django_pkiman', 'Crl').objects.using(using).select_related('issuer')),
+    ):
+        rows = []
+        with connection.cursor() as cursor:
+            for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+                rows.append((obj.pk * 2 + kind, terms(obj)))
+                if len(rows) >= BATCH_SIZE:
+                    cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (%s, %s)', rows)
+                    rows = []
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (%s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_pkiman', '0006_dn_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.1 on 2026-10-17 02:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_pkiman', '0007_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='journal',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-17 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_pkiman', '0008_journal_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crl',
+            name='next_check',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='следующая проверка'),
+        ),
+        migrations.AddField(
+            model_name='crl',
+            name='publish_interval',
+            field=models.DurationField(blank=True, help_text='интервал между датами выпуска двух последних загруженных версий', null=True, verbose_name='интервал публикации'),
+        ),
+    ]
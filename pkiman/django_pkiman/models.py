@@ -1,20 +1,39 @@
 import datetime
+import itertools
+import json
 import os
+from collections import namedtuple
+from functools import partial
 
 from django.contrib import admin
 from django.core.exceptions import MultipleObjectsReturned
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.db.models.indexes import Index
-from django.db.models.signals import post_delete, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
+from treebeard.exceptions import PathOverflow
 from treebeard.mp_tree import MP_Node, MP_NodeManager
 
-from django_pkiman.errors import PKICrtDoesNotFoundError, PKICrtMultipleFoundError, PKIDuplicateError, PKIOldError
-from django_pkiman.utils import clean_file_name
-from django_pkiman.utils.pki_parser import PKIObject
+from django_pkiman.errors import PKICrtDoesNotFoundError, PKICrtMultipleFoundError, PKIDuplicateError, PKIError, \
+    PKIOldError, PKIParseError
+from django_pkiman.signals import revoked_serials_changed
+from django_pkiman.utils import clean_file_name, dn_hash, revocation_index, search
+from django_pkiman.utils.pki_parser import ParsedCertificate, ParsedCertificateRevocationList
 
 DEFAULT_JOURNAL_LAST_RECORDS = 50
+# размер пакета записи bulk_create и списка значений в запросах __in
+BULK_CREATE_BATCH_SIZE = 500
+BULK_QUERY_CHUNK_SIZE = 500
+CHAIN_STATUS_FIELDS = ('chain_revoked', 'chain_valid_after', 'chain_valid_before')
+# поля отпечатков по длине hex значения
+FINGERPRINT_FIELDS_BY_LENGTH = {
+    32: ('fingerprint_md5',),
+    40: ('fingerprint',),
+    64: ('fingerprint_sha256', 'fingerprint_gost'),
+}
 
 
 # todo - путь cdp вынести в настройки для возможности смены
@@ -22,40 +41,104 @@ def get_upload_file_path(instance, *args):
     return f'cdp/{instance.upload_file_path()}'
 
 
+def delete_stored_files(objects):
+    """Удаление файлов, записанных в хранилище при сохранении объектов, транзакция которых откатывается"""
+    for object in objects:
+        if object.file and object.file._committed:
+            object.file.delete(save=False)
+
+
 # Managers
-class CrtManager(MP_NodeManager):
+class RawDigestManagerMixin:
+    """Поиск дубликатов загружаемых файлов по дайджесту исходных байт"""
+
+    def check_raw_duplicate(self, digest: str):
+        if digest and self.filter(raw_digest=digest).exists():
+            raise PKIDuplicateError(value=f'sha256={digest}')
+
+
+class FingerprintManagerMixin:
+    """Поиск по отпечатку любого из поддерживаемых алгоритмов"""
+
+    def filter_fingerprint(self, value: str):
+        """Поле отпечатка выбирается по длине значения. Допускаются разделители ':' и пробелы"""
+        value = value.replace(':', '').replace(' ', '').lower()
+        fields = FINGERPRINT_FIELDS_BY_LENGTH.get(len(value))
+        if not fields:
+            return self.none()
+        query = models.Q()
+        for field in fields:
+            query |= models.Q(**{field: value})
+        return self.filter(query)
+
+
+def crt_data_from_pki(pki: 'ParsedCertificate') -> dict:
+    """Значения полей модели Crt из разобранного сертификата"""
+    return {
+        'subject_identifier': pki.subject_identifier,
+        'subject_dn': pki.subject,
+        'subject_dn_hash': dn_hash(pki.subject),
+        'serial': pki.subject_serial_number,
+        'issuer_identifier': pki.issuer_identifier,
+        'issuer_dn': pki.issuer,
+        'issuer_dn_hash': dn_hash(pki.issuer),
+        'issuer_serial': pki.issuer_serial_number,
+        'fingerprint': pki.fingerprint,
+        'fingerprint_sha256': pki.fingerprints['sha256'],
+        'fingerprint_md5': pki.fingerprints['md5'],
+        'fingerprint_gost': pki.fingerprints['gost'],
+        'raw_digest': pki.raw_digest,
+        'valid_after': pki.not_valid_before,
+        'valid_before': pki.not_valid_after,
+        'is_ca': pki.CA,
+        'is_root_ca': pki.is_root,
+        'cdp_info': pki.cdp_info,
+        'auth_info': pki.auth_info,
+        'file': pki.up_file
+        }
+
+
+def chain_status(valid_after, valid_before, revoked_date, parent: 'Crt|None' = None) -> dict:
+    """Статус цепочки сертификата по собственным датам, дате отзыва и статусу цепочки издателя:
+    отзыв любого сертификата цепочки и пересечение сроков действия
+    """
+    status = {
+        'chain_revoked': revoked_date is not None,
+        'chain_valid_after': valid_after,
+        'chain_valid_before': valid_before,
+        }
+    if parent is not None:
+        status['chain_revoked'] = status['chain_revoked'] or parent.chain_revoked
+        status['chain_valid_after'] = max(valid_after, parent.chain_valid_after or parent.valid_after)
+        status['chain_valid_before'] = min(valid_before, parent.chain_valid_before or parent.valid_before)
+    return status
+
+
+def dn_key(dn: dict) -> str:
+    """Ключ DN для сортировки в памяти. Совпадает с представлением JSONField в БД"""
+    return json.dumps(dn)
+
+
+class CrtManager(FingerprintManagerMixin, RawDigestManagerMixin, MP_NodeManager):
     """"""
 
     @transaction.atomic
-    def get_from_pki(self, pki: 'PKIObject') -> ('Crt', bool):
-        """Чтение данных из объекта PKIObject сертификата, чтение или создание нового,
+    def get_from_pki(self, pki: 'ParsedCertificate') -> ('Crt', bool):
+        """Чтение данных из объекта ParsedCertificate сертификата, чтение или создание нового,
         поиск родительских или дочерних и привязка
         """
         created = False
         try:
             object = self.get(
-                subject_dn=pki.subject,
+                subject_dn_hash=dn_hash(pki.subject),
                 serial=pki.subject_serial_number
                 )
 
         except self.model.DoesNotExist:
             created = True
-            pki_data = {
-                'subject_identifier': pki.subject_identifier,
-                'subject_dn': pki.subject,
-                'serial': pki.subject_serial_number,
-                'issuer_identifier': pki.issuer_identifier,
-                'issuer_dn': pki.issuer,
-                'issuer_serial': pki.issuer_serial_number,
-                'fingerprint': pki.fingerprint,
-                'valid_after': pki.not_valid_before,
-                'valid_before': pki.not_valid_after,
-                'is_ca': pki.CA,
-                'is_root_ca': pki.is_root,
-                'cdp_info': pki.cdp_info,
-                'auth_info': pki.auth_info,
-                'file': pki.up_file
-                }
+            pki_data = crt_data_from_pki(pki)
+
+            pki_data.update(chain_status(pki.not_valid_before, pki.not_valid_after, None))
 
             # корневой сертификат сам себе родитель
             if pki.is_root:
@@ -64,8 +147,9 @@ class CrtManager(MP_NodeManager):
                 try:
                     # если есть в БД сертификат subject == issuer добавляемого сертификата - присвоить его как родителя
                     issuer: Crt = self.get(
-                        subject_dn=pki.issuer,
+                        subject_dn_hash=dn_hash(pki.issuer),
                         subject_identifier=pki.issuer_identifier)
+                    pki_data.update(chain_status(pki.not_valid_before, pki.not_valid_after, None, issuer))
                     object: Crt = issuer.add_child(**pki_data)
                     object.issuer = issuer
                     object.save()
@@ -73,21 +157,221 @@ class CrtManager(MP_NodeManager):
                     # Иначе оставляем сертификат как сироту в корне
                     object = self.model.add_root(**pki_data)
 
-            # Найти "битые" сертификаты без родителя и установить издателя у сертификатов с таким же issuer_identifier
             if pki.CA:
-                orphans = self.filter(
-                    issuer_dn=pki.subject,
-                    issuer_identifier=pki.subject_identifier,
-                    issuer=None,
-                    is_root_ca=False)
-                if orphans.exists():
-                    for orphan in orphans.all():
-                        orphan.move(object, pos='sorted-child')
-                    object.refresh_from_db()
-                    orphans.update(issuer=object)
+                self.adopt_orphans(object)
 
         return object, created
 
+    def adopt_orphans(self, object: 'Crt'):
+        """Найти "битые" сертификаты без родителя и установить издателя у сертификатов с таким же issuer_identifier.
+        Каждое поддерево сироты переносится одним UPDATE с заменой префикса пути и сдвигом глубины,
+        перенесенные узлы добавляются последними среди дочерних узлов издателя
+        """
+        # предки удостоверяющего сертификата не перемещаются под него (взаимная кросс-сертификация)
+        ancestor_paths = [object.path[:pos] for pos in range(object.steplen, len(object.path) + 1, object.steplen)]
+        orphans = list(self.filter(
+            issuer_dn_hash=object.subject_dn_hash,
+            issuer_identifier=object.subject_identifier,
+            issuer=None,
+            is_root_ca=False).exclude(path__in=ancestor_paths).order_by('path').values_list('pk', 'path', 'depth'))
+        if not orphans:
+            return
+
+        model = self.model
+        last_child = object.get_last_child() if object.numchild else None
+        step = last_child._get_lastpos_in_path() + 1 if last_child else 1
+        depth = object.depth + 1
+        max_length = model._meta.get_field('path').max_length
+        moved = []
+        for pk, path, orphan_depth in orphans:
+            if moved and path.startswith(moved[-1][1]):
+                # узел уже перенесен вместе с поддеревом другой сироты
+                continue
+            new_path = model._get_path(object.path, depth, step)
+            subtree = self.filter(path__startswith=path)
+            if subtree.filter(depth__gt=orphan_depth + max_length // model.steplen - depth).exists():
+                raise PathOverflow(f'Превышена глубина дерева при переносе {path} в {object.path}')
+            subtree.update(path=Concat(Value(new_path), Substr('path', len(path) + 1)),
+                           depth=F('depth') + (depth - orphan_depth))
+            moved.append((pk, path, orphan_depth, new_path))
+            step += 1
+
+        # счетчики дочерних узлов прежних родителей сирот, не являющихся корневыми узлами
+        for _, path, orphan_depth, _ in moved:
+            if orphan_depth > 1:
+                self.filter(path=model._get_parent_path_from_path(path)).update(numchild=F('numchild') - 1)
+        self.filter(pk__in=[pk for pk, _, _, _ in moved]).update(issuer=object)
+        self.filter(pk=object.pk).update(numchild=F('numchild') + len(moved))
+        object.refresh_from_db(fields=['numchild'])
+        self.refresh_chain_status([new_path for _, _, _, new_path in moved])
+
+    def refresh_chain_status(self, paths):
+        """Пересчет статуса цепочки поддеревьев с корнями в узлах paths. Поддеревья читаются
+        в порядке path, статус узла вычисляется по уже вычисленному статусу родителя, в БД записываются
+        только изменившиеся узлы
+        """
+        roots = []
+        for path in sorted(set(paths)):
+            if not roots or not path.startswith(roots[-1]):
+                roots.append(path)
+        if not roots:
+            return
+
+        steplen = self.model.steplen
+        fields = ('pk', 'path', 'valid_after', 'valid_before', 'revoked_date', *CHAIN_STATUS_FIELDS)
+        nodes = {object.path: object for object in
+                 self.filter(path__in=[path[:-steplen] for path in roots if len(path) > steplen]).only(*fields)}
+        changed = []
+        for num in range(0, len(roots), BULK_QUERY_CHUNK_SIZE):
+            query = models.Q()
+            for path in roots[num:num + BULK_QUERY_CHUNK_SIZE]:
+                query |= models.Q(path__startswith=path)
+            for object in self.filter(query).order_by('path').only(*fields):
+                if object.set_chain_status(nodes.get(object.path[:-steplen])):
+                    changed.append(object)
+                nodes[object.path] = object
+        if changed:
+            self.bulk_update(changed, CHAIN_STATUS_FIELDS, batch_size=BULK_CREATE_BATCH_SIZE)
+
+    def set_revoked(self, issuer: 'Crt', revoked: dict):
+        """Дата отзыва загруженных сертификатов издателя. revoked - {серийный номер: дата отзыва}"""
+        serial_list = list(revoked)
+        paths = []
+        for num in range(0, len(serial_list), BULK_QUERY_CHUNK_SIZE):
+            objects = []
+            queryset = self.filter(issuer_dn_hash=issuer.subject_dn_hash,
+                                   serial__in=serial_list[num:num + BULK_QUERY_CHUNK_SIZE])
+            for object in queryset.only('pk', 'path', 'serial', 'issuer_identifier', 'revoked_date'):
+                if object.issuer_identifier and object.issuer_identifier != issuer.subject_identifier:
+                    continue
+                if object.revoked_date != revoked[object.serial]:
+                    object.revoked_date = revoked[object.serial]
+                    objects.append(object)
+            if objects:
+                self.bulk_update(objects, ['revoked_date'], batch_size=BULK_CREATE_BATCH_SIZE)
+                paths.extend(object.path for object in objects)
+        self.refresh_chain_status(paths)
+
+    @transaction.atomic
+    def bulk_create_from_pki(self, pki_list) -> ('list[Crt]', 'list[Crt]'):
+        """Пакетная загрузка сертификатов. Возвращает списки созданных и загруженных ранее сертификатов.
+        Издатели определяются в памяти по идентификатору ключа и DN, значения path, depth, numchild
+        вычисляются для всего набора, запись - bulk_create по уровням дерева.
+        Новые узлы добавляются последними среди дочерних узлов существующего издателя и среди корневых узлов
+        """
+        model = self.model
+        # загруженные ранее и повторы внутри пакета
+        unique = {}
+        for pki in pki_list:
+            unique.setdefault(pki.fingerprint, pki)
+        exists = []
+        fingerprint_list = list(unique)
+        for num in range(0, len(fingerprint_list), BULK_QUERY_CHUNK_SIZE):
+            for object in self.filter(fingerprint__in=fingerprint_list[num:num + BULK_QUERY_CHUNK_SIZE]):
+                exists.append(object)
+                del unique[object.fingerprint]
+        pki_list = list(unique.values())
+        if not pki_list:
+            return [], exists
+
+        # издатели внутри пакета
+        subjects = {(dn_hash(pki.subject), pki.subject_identifier): pki for pki in pki_list}
+        parents = {}
+        missing = []
+        for pki in pki_list:
+            if pki.is_root:
+                parents[pki.fingerprint] = None
+                continue
+            issuer = subjects.get((dn_hash(pki.issuer), pki.issuer_identifier))
+            if issuer is not None and issuer is not pki:
+                parents[pki.fingerprint] = issuer
+            else:
+                missing.append(pki)
+        # издатели в БД
+        issuer_ids = list({pki.issuer_identifier for pki in missing if pki.issuer_identifier})
+        db_issuers = {}
+        for num in range(0, len(issuer_ids), BULK_QUERY_CHUNK_SIZE):
+            for object in self.filter(subject_identifier__in=issuer_ids[num:num + BULK_QUERY_CHUNK_SIZE]):
+                db_issuers.setdefault((object.subject_dn_hash, object.subject_identifier), object)
+        for pki in missing:
+            parents[pki.fingerprint] = db_issuers.get((dn_hash(pki.issuer), pki.issuer_identifier))
+
+        # разрыв циклов (взаимная кросс-сертификация): сертификат в цикле остается корневым
+        for pki in pki_list:
+            seen = {pki.fingerprint}
+            parent = parents[pki.fingerprint]
+            while isinstance(parent, ParsedCertificate):
+                if parent.fingerprint in seen:
+                    parents[pki.fingerprint] = None
+                    break
+                seen.add(parent.fingerprint)
+                parent = parents[parent.fingerprint]
+
+        # дочерние узлы по родителю: None - корневые, Crt - существующий, fingerprint - новый в пакете
+        children = {}
+        for pki in pki_list:
+            parent = parents[pki.fingerprint]
+            key = parent.fingerprint if isinstance(parent, ParsedCertificate) else parent
+            children.setdefault(key, []).append(pki)
+        for child_list in children.values():
+            child_list.sort(key=lambda pki: dn_key(pki.subject))
+
+        # вычисление путей от существующих узлов и корня к новым узлам
+        nodes = {}
+        levels = {}
+
+        def add_subtree(parent_key, parent, parent_path, depth, first_step):
+            for step, pki in enumerate(children.get(parent_key, ()), start=first_step):
+                path = model._get_path(parent_path, depth, step)
+                if len(path) > model._meta.get_field('path').max_length:
+                    raise PathOverflow(f'Превышена глубина дерева: {pki}')
+                node = model(path=path, depth=depth, numchild=len(children.get(pki.fingerprint, ())),
+                             **crt_data_from_pki(pki))
+                node.set_chain_status(parent)
+                nodes[pki.fingerprint] = node
+                levels.setdefault(depth, []).append((node, parent_key))
+                add_subtree(pki.fingerprint, node, path, depth + 1, 1)
+
+        last_root = model.get_last_root_node()
+        add_subtree(None, None, '', 1, last_root._get_lastpos_in_path() + 1 if last_root else 1)
+        for parent in [key for key in children if isinstance(key, Crt)]:
+            last_child = parent.get_last_child() if parent.numchild else None
+            add_subtree(parent, parent, parent.path, parent.depth + 1,
+                        last_child._get_lastpos_in_path() + 1 if last_child else 1)
+
+        # запись по уровням: издатель сохраняется раньше дочерних узлов.
+        # Файлы записываются в хранилище при bulk_create (FileField.pre_save) и при откате транзакции
+        # удаляются, иначе повторная загрузка по одному запишет их под другими именами
+        try:
+            for depth in sorted(levels):
+                level = levels[depth]
+                for node, parent_key in level:
+                    if isinstance(parent_key, Crt):
+                        node.issuer_id = parent_key.pk
+                    elif parent_key is not None:
+                        node.issuer_id = nodes[parent_key].pk
+                created = self.bulk_create([node for node, _ in level], batch_size=BULK_CREATE_BATCH_SIZE)
+                if any(node.pk is None for node in created):
+                    # БД не возвращает первичные ключи при bulk_create
+                    pk_map = dict(self.filter(path__in=[node.path for node in created]).values_list('path', 'pk'))
+                    for node in created:
+                        node.pk = pk_map[node.path]
+            for parent in [key for key in children if isinstance(key, Crt)]:
+                self.filter(pk=parent.pk).update(numchild=F('numchild') + len(children[parent]))
+
+            # привязка сертификатов-сирот, загруженных ранее, к новым удостоверяющим сертификатам
+            created = [nodes[pki.fingerprint] for pki in pki_list]
+            # bulk_create не отправляет post_save
+            search.index_objects(search.KIND_CRT, created, self.db)
+            for object in created:
+                if object.is_ca:
+                    object.refresh_from_db()
+                    self.adopt_orphans(object)
+        except BaseException:
+            delete_stored_files(nodes.values())
+            raise
+        return created, exists
+
 
 # Models
 class Crt(MP_Node):
@@ -97,18 +381,28 @@ class Crt(MP_Node):
     issuer_identifier = models.CharField('идентификатор издателя',
                                          max_length=128, null=True)
     subject_dn = models.JSONField()
+    subject_dn_hash = models.CharField('хеш DN субъекта', max_length=64, null=True)
     serial = models.CharField('серийный номер', max_length=128)  # todo change to subject_serial_number
     issuer_dn = models.JSONField()
+    issuer_dn_hash = models.CharField('хеш DN издателя', max_length=64, null=True)
     issuer_serial = models.CharField(max_length=128, null=True)  # todo change to issuer_serial_number
     issuer = models.ForeignKey('self', verbose_name='привязка к издателю',
                                on_delete=models.SET_NULL, null=True, related_name='children')
     fingerprint = models.CharField('отпечаток', max_length=64, unique=True)
+    fingerprint_sha256 = models.CharField('отпечаток SHA-256', max_length=64, null=True, db_index=True)
+    fingerprint_md5 = models.CharField('отпечаток MD5', max_length=32, null=True, db_index=True)
+    fingerprint_gost = models.CharField('отпечаток ГОСТ Р 34.11-2012', max_length=64, null=True, db_index=True)
+    raw_digest = models.CharField('дайджест файла', max_length=64, null=True, db_index=True)
     file = models.FileField('ссылка на файл', upload_to=get_upload_file_path)
     valid_after = models.DateTimeField('Действителен с')
     valid_before = models.DateTimeField('Действителен до')
     is_ca = models.BooleanField('корневой', default=False)
     is_root_ca = models.BooleanField('удостоверяющий', default=False)
     revoked_date = models.DateTimeField('отозван', null=True)
+    # статус цепочки до корня дерева, пересчитывается CrtManager.refresh_chain_status
+    chain_revoked = models.BooleanField('отозван сертификат цепочки', default=False)
+    chain_valid_after = models.DateTimeField('цепочка действительна с', null=True)
+    chain_valid_before = models.DateTimeField('цепочка действительна до', null=True)
     cdp_info = models.JSONField('точки распространения СОС УЦ', null=True)
     auth_info = models.JSONField('точки распространения УЦ', null=True)
     created_at = models.DateTimeField('загружен', auto_now_add=True, editable=False)
@@ -119,15 +413,15 @@ class Crt(MP_Node):
     class Meta:
         verbose_name = 'Сертификат'
         verbose_name_plural = 'Сертификаты'
-        unique_together = ('issuer_dn', 'serial')  # RFC 5280 4.1.2.2
+        unique_together = ('issuer_dn_hash', 'serial')  # RFC 5280 4.1.2.2
         indexes = (
-            Index(name='crt_get_issuer_idx', fields=('subject_dn', 'subject_identifier')),
-            Index(name='crt_filter_orphans_idx', fields=('issuer_dn',
+            Index(name='crt_get_issuer_idx', fields=('subject_dn_hash', 'subject_identifier')),
+            Index(name='crt_filter_orphans_idx', fields=('issuer_dn_hash',
                                                          'issuer_identifier',
                                                          'issuer',
                                                          'is_root_ca',
                                                          )),
-            Index(name='crl_get_issuer_crt', fields=('subject_dn',
+            Index(name='crl_get_issuer_crt', fields=('subject_dn_hash',
                                                      'subject_identifier',
                                                      'serial'))
             )
@@ -171,21 +465,25 @@ class Crt(MP_Node):
         return self.valid_after < timezone.make_aware(datetime.datetime.now()) < self.valid_before
 
     def is_valid(self):
-        """Есть привязка к родительскому сертификату, не просрочен и не отозван"""
-        if self.is_root():
-            if not self.is_valid_date() or self.is_revoked():
-                return False
-        else:
-            if self.issuer and not self.issuer.is_valid():
-                return False
-            else:
-                if not self.issuer or not self.is_valid_date() or self.is_revoked():
-                    return False
-        return True
+        """Сертификаты цепочки до корня дерева не просрочены и не отозваны.
+        Статус цепочки хранится в полях chain_* и не требует чтения издателей
+        """
+        if self.chain_valid_after is None or self.chain_valid_before is None:
+            return self.is_valid_date() and not self.is_revoked()
+        return not self.chain_revoked and self.chain_valid_after < timezone.now() < self.chain_valid_before
+
+    def set_chain_status(self, parent: 'Crt|None') -> bool:
+        """Вычисление статуса цепочки по статусу издателя. Возвращает True при изменении"""
+        changed = False
+        for field, value in chain_status(self.valid_after, self.valid_before, self.revoked_date, parent).items():
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        return changed
 
     def is_bound(self):
         """Есть привязка к родительскому сертификату. Корневой привязан сам к себе"""
-        return self.is_root_ca or self.issuer is not None
+        return self.is_root_ca or self.issuer_id is not None
 
     def is_revoked(self):
         return self.revoked_date is not None
@@ -212,9 +510,16 @@ class Crt(MP_Node):
     # todo - add func для проверки наличия файла на диске
 
 
+@receiver(post_save, sender=Crt, weak=False)
+def index_crt_object(sender, instance: Crt, using, **kwargs):
+    """Обновление записи индекса поиска"""
+    search.index_objects(search.KIND_CRT, [instance], using)
+
+
 @receiver(post_delete, sender=Crt, weak=False)
-def delete_crt_object(sender, instance: Crt, **kwargs):
-    """Удаляет файл на диске после удаления объекта"""
+def delete_crt_object(sender, instance: Crt, using, **kwargs):
+    """Удаляет файл на диске и запись индекса поиска после удаления объекта"""
+    search.remove_objects(search.KIND_CRT, [instance.pk], using)
     fpath = instance.file.file.name
     if os.path.exists(fpath):
         try:
@@ -223,23 +528,35 @@ def delete_crt_object(sender, instance: Crt, **kwargs):
             pass
 
 
-class CrlManager(models.Manager):
+class CrlManager(FingerprintManagerMixin, RawDigestManagerMixin, models.Manager):
     """"""
 
+    def scheduled(self, now: 'datetime.datetime' = None):
+        """Списки отзыва, обновляемые планировщиком: с расписанием, в временной диапазон которого попадает now"""
+        tasks = CrlUpdateSchedule.objects.get_tasks(now)
+        return self.filter(schedule__in=tasks).distinct()
+
+    def due(self, now: 'datetime.datetime' = None):
+        """Списки отзыва, время проверки которых наступило (next_check) или не назначено"""
+        now = now or timezone.now()
+        return self.scheduled(now).filter(models.Q(next_check__isnull=True) | models.Q(next_check__lte=now))
+
     @transaction.atomic
-    def get_from_pki(self, pki):
+    def get_from_pki(self, pki: 'ParsedCertificateRevocationList') -> ('Crl', bool):
         """Возвращает новый или существующий Crl. Обновляет существующий"""
+        issuer_dn_hash = dn_hash(pki.issuer)
         try:
-            issuer = Crt.objects.get(subject_dn=pki.issuer,
+            issuer = Crt.objects.get(subject_dn_hash=issuer_dn_hash,
                                      subject_identifier=pki.issuer_identifier)
         except Crt.DoesNotExist:
-            # todo заменить после переработки класса PKIObject
             raise PKICrtDoesNotFoundError(value=pki.issuer_identifier)
 
         except MultipleObjectsReturned:
-            if pki.issuer_serial_number:
+            if not pki.issuer_serial_number:
+                raise PKICrtMultipleFoundError(value=pki.issuer_identifier)
+            else:
                 try:
-                    issuer = Crt.objects.get(subject_dn=pki.issuer,
+                    issuer = Crt.objects.get(subject_dn_hash=issuer_dn_hash,
                                              subject_identifier=pki.issuer_identifier,
                                              serial=pki.issuer_serial_number,
                                              )
@@ -253,14 +570,20 @@ class CrlManager(models.Manager):
             defaults={
                 'crl_number': pki.crl_number,
                 'fingerprint': pki.fingerprint,
+                'fingerprint_sha256': pki.fingerprints['sha256'],
+                'fingerprint_md5': pki.fingerprints['md5'],
+                'fingerprint_gost': pki.fingerprints['gost'],
+                'raw_digest': pki.raw_digest,
                 'last_update': pki.last_update,
                 'next_update': pki.next_update,
-                'revoked_count': len(pki.revoked_list),
+                'revoked_count': pki.revoked_count,
                 'file': pki.up_file,
                 }
             )
 
+        index_path = None
         if not created:
+            index_path = object.index_path()
             if pki.fingerprint == object.fingerprint:
                 raise PKIDuplicateError(value=f'fingerprint={pki.fingerprint}')
             if (pki.crl_number and object.crl_number >= pki.crl_number) or object.last_update >= pki.last_update:
@@ -269,12 +592,23 @@ class CrlManager(models.Manager):
             # update exists crl
             object.crl_number = pki.crl_number
             object.fingerprint = pki.fingerprint
+            object.fingerprint_sha256 = pki.fingerprints['sha256']
+            object.fingerprint_md5 = pki.fingerprints['md5']
+            object.fingerprint_gost = pki.fingerprints['gost']
+            object.raw_digest = pki.raw_digest
             object.last_update = pki.last_update
             object.next_update = pki.next_update
-            object.revoked_count = len(pki.revoked_list)
+            object.revoked_count = pki.revoked_count
             object.file = pki.up_file
             object.save()
 
+        new_index_path = object.index_path()
+        records = revoked_records(pki, os.path.dirname(new_index_path))
+        diff = RevokedSerial.objects.load_records(issuer, records, index_path)
+        # индекс без изменений не заменяется: читатели и фильтры Блума не перестраиваются
+        if diff.added or diff.removed or diff.changed or index_path != new_index_path or \
+                not object.index_matches(records.count):
+            transaction.on_commit(partial(object.replace_index, records))
         return object, created
 
 
@@ -282,6 +616,10 @@ class Crl(models.Model):
     """Списки отзыва"""
     issuer = models.OneToOneField('Crt', verbose_name='Сертификат', on_delete=models.CASCADE, related_name='crl')
     fingerprint = models.CharField('отпечаток', max_length=64, unique=True)
+    fingerprint_sha256 = models.CharField('отпечаток SHA-256', max_length=64, null=True, db_index=True)
+    fingerprint_md5 = models.CharField('отпечаток MD5', max_length=32, null=True, db_index=True)
+    fingerprint_gost = models.CharField('отпечаток ГОСТ Р 34.11-2012', max_length=64, null=True, db_index=True)
+    raw_digest = models.CharField('дайджест файла', max_length=64, null=True, db_index=True)
     file = models.FileField('ссылка на файл', upload_to=get_upload_file_path)
     crl_number = models.TextField('номер', null=True)
     last_update = models.DateTimeField('обновлен')
@@ -317,6 +655,11 @@ class Crl(models.Model):
     f_size = models.PositiveSmallIntegerField('размер файла', null=True)
     f_etag = models.CharField('хэш файла', max_length=128, null=True)
     f_sync = models.DateTimeField('дата последней синхронизации', null=True)
+    # планирование обновления
+    next_check = models.DateTimeField('следующая проверка', null=True, blank=True, db_index=True)
+    publish_interval = models.DurationField('интервал публикации', null=True, blank=True,
+                                            help_text='интервал между датами выпуска двух последних загруженных '
+                                                      'версий')
 
     objects = CrlManager()
 
@@ -348,10 +691,92 @@ class Crl(models.Model):
         ftype = 'crl'
         return f'{ftype}/{name}.{ftype}'
 
+    def index_path(self):
+        """Файл индекса отозванных сертификатов рядом с файлом списка отзыва"""
+        return f'{os.path.splitext(self.file.path)[0]}.{revocation_index.INDEX_SUFFIX}'
+
+    def index_matches(self, count: int) -> bool:
+        """Индекс создан и содержит count записей"""
+        try:
+            return revocation_index.index_count(self.index_path()) == count
+        except (OSError, revocation_index.RevocationIndexError):
+            return False
+
+    def replace_index(self, records: 'revocation_index.SortedRecords'):
+        """Замена индекса отозванных сертификатов отсортированным файлом revoked_records.
+        При ошибке индекс удаляется, поиск выполняется по БД
+        """
+        path = self.index_path()
+        try:
+            records.replace(path)
+        except OSError:
+            records.remove()
+            revocation_index.remove_index(path)
+
+    def get_revoked(self, serial: 'int|str') -> 'RevokedRecord|None':
+        """Запись отозванного сертификата по индексу, при отсутствии индекса - по БД"""
+        try:
+            entry = revocation_index.lookup(self.index_path(), serial)
+        except (OSError, revocation_index.RevocationIndexError):
+            values = RevokedSerial.objects.filter(issuer_id=self.issuer_id, serial=str(serial)).values_list(
+                'serial', 'revocation_date', 'reason').first()
+            return RevokedRecord(*values) if values else None
+        return RevokedRecord(str(entry.serial), *entry[1:]) if entry else None
+
+
+# результат пакетной загрузки: созданные объекты, загруженные ранее, ошибки [(pki, exception), ...]
+PKIBatchResult = namedtuple('PKIBatchResult', ('created', 'exists', 'errors'))
+
+
+@transaction.atomic
+def get_from_pki_list(pki_list) -> PKIBatchResult:
+    """Загрузка набора сертификатов и списков отзыва в одной транзакции.
+    Сертификаты записываются пакетно CrtManager.bulk_create_from_pki, при ошибке пакетной записи -
+    по одному, корневые и удостоверяющие - до конечных. Списки отзыва загружаются после сертификатов.
+    Ошибка загрузки отдельного объекта откатывает только этот объект
+    """
+    result = PKIBatchResult([], [], [])
+    crt_list = [pki for pki in pki_list if pki.pki_type == 'crt']
+    crl_list = [pki for pki in pki_list if pki.pki_type == 'crl']
+    try:
+        with transaction.atomic():
+            created, exists = Crt.objects.bulk_create_from_pki(crt_list)
+        result.created.extend(created)
+        result.exists.extend(exists)
+        crt_list = []
+    except (PKIError, IntegrityError, PathOverflow):
+        crt_list.sort(key=lambda pki: (not pki.is_root, not pki.CA))
+
+    for pki, manager in itertools.chain(((pki, Crt.objects) for pki in crt_list),
+                                        ((pki, Crl.objects) for pki in crl_list)):
+        try:
+            with transaction.atomic():
+                object, created = manager.get_from_pki(pki)
+        except (PKIError, IntegrityError) as e:
+            result.errors.append((pki, e))
+            continue
+        (result.created if created else result.exists).append(object)
+    return result
+
+
+def check_raw_duplicate(suffix: 'str|None', digest: str):
+    """Проверка наличия в БД файла с тем же содержимым до разбора x509. suffix - тип файла ('crt', 'crl')"""
+    model = Crl if suffix == 'crl' else Crt
+    model.objects.check_raw_duplicate(digest)
+
+
+@receiver(post_save, sender=Crl, weak=False)
+def index_crl_object(sender, instance: Crl, using, **kwargs):
+    """Обновление записи индекса поиска"""
+    search.index_objects(search.KIND_CRL, [instance], using)
+
 
 @receiver(post_delete, sender=Crl, weak=False)
-def delete_crl_object(sender, instance: Crl, **kwargs):
-    """Удаление файла на диске после удаления объекта"""
+def delete_crl_object(sender, instance: Crl, using, **kwargs):
+    """Удаление файлов на диске, записей отозванных сертификатов и индекса поиска после удаления объекта"""
+    search.remove_objects(search.KIND_CRL, [instance.pk], using)
+    RevokedSerial.objects.filter(issuer_id=instance.issuer_id).delete()
+    revocation_index.remove_index(instance.index_path())
     fpath = instance.file.file.name
     if os.path.exists(fpath):
         try:
@@ -376,18 +801,169 @@ def set_proxy_crl_object(sender, instance: Crl, **kwargs):
             pass
 
 
+# запись отозванного сертификата: serial - десятичная строка, reason - код RevocationReasonChoices
+RevokedRecord = namedtuple('RevokedRecord', ('serial', 'revocation_date', 'reason'))
+RevokedDiff = namedtuple('RevokedDiff', ('added', 'removed', 'changed'))
+
+
+class RevocationReasonChoices(models.IntegerChoices):
+    """Причины отзыва CRLReason (RFC 5280 5.3.1)"""
+    UNSPECIFIED = 0, 'не указана'
+    KEY_COMPROMISE = 1, 'компрометация ключа'
+    CA_COMPROMISE = 2, 'компрометация ключа УЦ'
+    AFFILIATION_CHANGED = 3, 'изменение принадлежности'
+    SUPERSEDED = 4, 'замена сертификата'
+    CESSATION_OF_OPERATION = 5, 'прекращение деятельности'
+    CERTIFICATE_HOLD = 6, 'приостановление действия'
+    REMOVE_FROM_CRL = 8, 'исключение из списка отзыва'
+    PRIVILEGE_WITHDRAWN = 9, 'отзыв полномочий'
+    AA_COMPROMISE = 10, 'компрометация ключа AA'
+
+
+# коды причин отзыва по значениям cryptography.x509.ReasonFlags
+REVOCATION_REASON_MAP = {
+    'unspecified': RevocationReasonChoices.UNSPECIFIED,
+    'keyCompromise': RevocationReasonChoices.KEY_COMPROMISE,
+    'cACompromise': RevocationReasonChoices.CA_COMPROMISE,
+    'affiliationChanged': RevocationReasonChoices.AFFILIATION_CHANGED,
+    'superseded': RevocationReasonChoices.SUPERSEDED,
+    'cessationOfOperation': RevocationReasonChoices.CESSATION_OF_OPERATION,
+    'certificateHold': RevocationReasonChoices.CERTIFICATE_HOLD,
+    'removeFromCRL': RevocationReasonChoices.REMOVE_FROM_CRL,
+    'privilegeWithdrawn': RevocationReasonChoices.PRIVILEGE_WITHDRAWN,
+    'aACompromise': RevocationReasonChoices.AA_COMPROMISE,
+}
+
+
+def revoked_records(pki: 'ParsedCertificateRevocationList', directory: str = None) -> 'revocation_index.SortedRecords':
+    """Записи списка отзыва, отсортированные по номеру внешней сортировкой во временный файл индекса
+    в каталоге directory. Записи разбираются потоком, в памяти - не более порции сортировки
+    """
+    packed = (revocation_index.pack_record(int(entry.serial), entry.revocation_date,
+                                           REVOCATION_REASON_MAP.get(entry.reason))
+              for entry in pki.iter_revoked())
+    try:
+        return revocation_index.sort_records(packed, directory)
+    except revocation_index.RevocationIndexError as e:
+        raise PKIParseError(value=str(e))
+
+
+def revoked_diff(stored, loaded) -> RevokedDiff:
+    """Разница двух отсортированных по серийному номеру последовательностей (serial, revocation_date, reason)"""
+    added, removed, changed = [], [], []
+    stored_iter, loaded_iter = iter(stored), iter(loaded)
+    old, new = next(stored_iter, None), next(loaded_iter, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            removed.append(RevokedRecord(str(old[0]), *old[1:]))
+            old = next(stored_iter, None)
+        elif old is None or new[0] < old[0]:
+            added.append(RevokedRecord(str(new[0]), *new[1:]))
+            new = next(loaded_iter, None)
+        else:
+            if old[1:] != new[1:]:
+                changed.append(RevokedRecord(str(new[0]), *new[1:]))
+            old, new = next(stored_iter, None), next(loaded_iter, None)
+    return RevokedDiff(added, removed, changed)
+
+
+class RevokedSerialManager(models.Manager):
+
+    def is_revoked(self, issuer: 'Crt', serial: 'str|int') -> bool:
+        return self.filter(issuer=issuer, serial=str(serial)).exists()
+
+    def load_from_pki(self, issuer: 'Crt', pki: 'ParsedCertificateRevocationList') -> RevokedDiff:
+        return self.load_records(issuer, revoked_records(pki))
+
+    def stored_records(self, issuer: 'Crt', index_path: str = None):
+        """Отсортированные по номеру сохраненные записи издателя (serial, revocation_date, reason).
+        Читаются потоком из индекса предыдущей версии списка отзыва, если количество записей в нем совпадает
+        с БД, иначе из БД с внешней сортировкой
+        """
+        if index_path:
+            try:
+                count = revocation_index.index_count(index_path)
+            except (OSError, revocation_index.RevocationIndexError):
+                count = None
+            if count is not None and count == self.filter(issuer=issuer).count():
+                return revocation_index.iter_index(index_path)
+        values = self.filter(issuer=issuer).values_list('serial', 'revocation_date', 'reason').iterator()
+        return revocation_index.sort_records(revocation_index.pack_record(int(serial), revocation_date, reason)
+                                             for serial, revocation_date, reason in values)
+
+    def load_records(self, issuer: 'Crt', loaded, index_path: str = None) -> RevokedDiff:
+        """Применение разницы между сохраненными записями издателя и отсортированными записями списка отзыва
+        (revoked_records). Обе стороны читаются потоком и сливаются за один проход в порядке номеров, в памяти
+        остается только разница, в БД записываются только добавленные, удаленные и измененные записи.
+        Разница передается сигналом revoked_serials_changed кэшам статуса отзыва.
+        index_path - индекс предыдущей версии списка отзыва.
+        Дата отзыва сертификата (Crt.revoked_date) устанавливается для добавленных и измененных записей.
+        Для исключенных из списка сертификатов она снимается, только если они были приостановлены
+        (certificateHold): отозванный сертификат остается отозванным и после удаления записи из списка
+        """
+        diff = revoked_diff(self.stored_records(issuer, index_path), loaded)
+        if not (diff.added or diff.removed or diff.changed):
+            return diff
+
+        for num in range(0, len(diff.removed), BULK_QUERY_CHUNK_SIZE):
+            self.filter(issuer=issuer,
+                        serial__in=[entry.serial for entry in diff.removed[num:num + BULK_QUERY_CHUNK_SIZE]]).delete()
+        self.bulk_create([self.model(issuer=issuer, **entry._asdict()) for entry in diff.added],
+                         batch_size=BULK_CREATE_BATCH_SIZE)
+        if diff.changed:
+            objects = {object.serial: object for object in
+                       self.filter(issuer=issuer, serial__in=[entry.serial for entry in diff.changed])}
+            for entry in diff.changed:
+                objects[entry.serial].revocation_date = entry.revocation_date
+                objects[entry.serial].reason = entry.reason
+            self.bulk_update(objects.values(), ['revocation_date', 'reason'], batch_size=BULK_CREATE_BATCH_SIZE)
+
+        revoked = {entry.serial: entry.revocation_date for entry in itertools.chain(diff.added, diff.changed)}
+        # исключенные из списка сертификаты считаются действующими только после снятия приостановления
+        revoked.update((entry.serial, None) for entry in diff.removed
+                       if entry.reason == RevocationReasonChoices.CERTIFICATE_HOLD)
+        Crt.objects.set_revoked(issuer, revoked)
+        revoked_serials_changed.send(sender=self.model, issuer=issuer, added=diff.added, removed=diff.removed,
+                                     changed=diff.changed)
+        return diff
+
+
+class RevokedSerial(models.Model):
+    """Отозванные сертификаты по данным списков отзыва"""
+    issuer = models.ForeignKey('Crt', verbose_name='издатель', on_delete=models.CASCADE,
+                               related_name='revoked_serials')
+    serial = models.CharField('серийный номер', max_length=64)
+    revocation_date = models.DateTimeField('дата отзыва')
+    reason = models.PositiveSmallIntegerField('причина отзыва', choices=RevocationReasonChoices.choices, null=True)
+
+    objects = RevokedSerialManager()
+
+    class Meta:
+        verbose_name = 'Отозванный сертификат'
+        verbose_name_plural = 'Отозванные сертификаты'
+        constraints = (
+            models.UniqueConstraint(name='revoked_serial_issuer_serial_uniq', fields=('issuer', 'serial')),
+            )
+
+    def __str__(self):
+        return f'{self.issuer_id}:{self.serial}'
+
+
 ###
 
 class CrlUpdateSchedulerManager(models.Manager):
-    def get_tasks(self):
-        nowday = timezone.datetime.now()
-        # weekday = nowday.isoweekday()
-        return self.filter(crl_list__isnull=False,
-                           is_active=True,
-                           # dow__contains=weekday,
-                           std__lte=nowday,
-                           etd__gte=nowday,
-                           )
+    def get_tasks(self, now: 'datetime.datetime' = None):
+        """Активные расписания, в диапазон которых (день недели, время) попадает now.
+        Диапазон с началом позже конца переходит через полночь
+        """
+        now = timezone.localtime(now)
+        time_now = now.time()
+        in_range = models.Q(std__lte=time_now, etd__gte=time_now) | \
+            models.Q(std__gt=F('etd')) & (models.Q(std__lte=time_now) | models.Q(etd__gte=time_now))
+        # dow - JSON список, поиск по элементам поддерживается не всеми БД
+        pk_list = [pk for pk, dow in self.filter(in_range, is_active=True).values_list('pk', 'dow')
+                   if not dow or now.isoweekday() in dow]
+        return self.filter(pk__in=pk_list)
 
 
 class CrlUpdateSchedule(models.Model):
@@ -508,7 +1084,8 @@ class JournalTypeChoices(models.TextChoices):
 
 
 class Journal(models.Model):
-    created_at = models.DateTimeField(auto_now=True, editable=False, db_index=True)
+    # время события, а не записи в БД: записи журнала могут записываться пакетами (utils.logger.JournalWriter)
+    created_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
     level = models.CharField(max_length=1, choices=JournalTypeChoices.choices,
                              default=JournalTypeChoices.INFO, db_index=True)
     message = models.TextField()
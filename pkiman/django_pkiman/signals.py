@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# изменение записей отозванных сертификатов издателя после загрузки списка отзыва.
+# Аргументы: issuer - Crt издателя, added, removed, changed - списки models.RevokedRecord
+revoked_serials_changed = Signal()
@@ -0,0 +1,57 @@
+import io
+import shutil
+import tempfile
+from pathlib import Path
+
+from cryptography.hazmat.primitives.serialization import Encoding
+from django.core.management import call_command
+
+from django_pkiman import models
+from django_pkiman.tests.test_models import PKIStoreTestCase
+from django_pkiman.tests.utils import make_crl, make_crt
+
+
+class TestImportCommand(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.import_dir = Path(tempfile.mkdtemp())
+        root, root_key = make_crt('Test root', ca=True)
+        sub, sub_key = make_crt('Test sub CA', ca=True, issuer_crt=root, issuer_key=root_key)
+        leaf_list = [make_crt(f'Test user {num}', issuer_crt=sub, issuer_key=sub_key)[0] for num in range(5)]
+        (cls.import_dir / 'nested').mkdir()
+        (cls.import_dir / 'root.crt').write_bytes(root.public_bytes(Encoding.DER))
+        (cls.import_dir / 'nested' / 'sub.cer').write_bytes(sub.public_bytes(Encoding.PEM))
+        (cls.import_dir / 'leaf.pem').write_bytes(b''.join(crt.public_bytes(Encoding.PEM) for crt in leaf_list))
+        (cls.import_dir / 'sub.crl').write_bytes(make_crl(sub, sub_key, revoked=[1, 2]).public_bytes(Encoding.DER))
+        (cls.import_dir / 'broken.crt').write_bytes(b'not a certificate')
+        (cls.import_dir / 'readme.txt').write_text('skip')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.import_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def run_import(self, *args):
+        stdout = io.StringIO()
+        call_command('pkiman_import', str(self.import_dir), '--workers', '2', '--batch-size', '3', *args,
+                     stdout=stdout, stderr=io.StringIO())
+        return stdout.getvalue()
+
+    def test_import_and_resume(self):
+        output = self.run_import()
+        self.assertIn('создано 8', output)
+        self.assertEqual(models.Crt.objects.count(), 7)
+        self.assertEqual(models.Crt.objects.filter(depth=3).count(), 5)
+        self.assertEqual(models.Crl.objects.get().revoked_count, 2)
+
+        # файл с ошибкой разбора не отмечается обработанным
+        state = (self.import_dir / '.pkiman-import.state').read_text()
+        self.assertNotIn('broken.crt', state)
+        self.assertIn('root.crt', state)
+        output = self.run_import()
+        self.assertIn('Файлов к загрузке: 1', output)
+
+        output = self.run_import('--restart')
+        self.assertIn('загружено ранее 7', output)
+        self.assertEqual(models.Crt.objects.count(), 7)
@@ -1,10 +1,30 @@
+import datetime
+import os
 import random
+import shutil
 import string
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-from django.test import TestCase
+from cryptography import x509
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
 from django_pkiman import models
+from django_pkiman.errors import PKIDuplicateError
 from django_pkiman.models import Journal, JournalTypeChoices
+from django_pkiman.signals import revoked_serials_changed
+from django_pkiman.tests.utils import as_upload, make_crl, make_crt
+from django_pkiman.utils import canonical_dn, dn_hash, logger, revocation_index, search
+from django_pkiman.utils.logger import JournalWriter, journal_clean
+from django_pkiman.utils.pki_parser import parse_x509, read_x509
+from django_pkiman.utils.revocation_index import remove_index
 
 
 class TestJournalModel(TestCase):
@@ -52,6 +72,96 @@ class TestJournalModel(TestCase):
         self.assertTrue(first.created_at < median.created_at < last.created_at)
 
 
+@override_settings(PKIMAN_JOURNAL_SYNC=True, PKIMAN_JOURNAL_STORE_PERIOD=30, PKIMAN_JOURNAL_CLEAN_PAUSE=0)
+class TestJournalClean(TestCase):
+
+    def test_chunks(self):
+        for num in range(30):
+            Journal.objects.create_record(JournalTypeChoices.INFO, f'record {num}')
+        Journal.objects.filter(pk__in=list(Journal.objects.values_list('pk', flat=True)[:25])).update(
+            created_at=timezone.now() - datetime.timedelta(days=31))
+        with CaptureQueriesContext(connection) as queries:
+            stats = journal_clean(chunk_size=10)
+        self.assertEqual(stats.deleted, 25)
+        self.assertGreater(stats.per_second, 0)
+        deletes = [query for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(Journal.objects.count(), 6)
+        self.assertIn('Удалено записей: 25', Journal.objects.latest('created_at').message)
+
+    def test_empty(self):
+        Journal.objects.create_record(JournalTypeChoices.INFO, 'record')
+        self.assertEqual(journal_clean().deleted, 0)
+        self.assertEqual(Journal.objects.count(), 1)
+
+
+@override_settings(PKIMAN_JOURNAL_SYNC=False, PKIMAN_JOURNAL_BUFFER_SIZE=3, PKIMAN_JOURNAL_FLUSH_INTERVAL=60)
+class TestJournalWriter(TransactionTestCase):
+
+    def setUp(self):
+        self.writer = JournalWriter()
+
+    def tearDown(self):
+        self.writer.flush()
+
+    def test_sync(self):
+        with override_settings(PKIMAN_JOURNAL_SYNC=True):
+            self.writer.write(JournalTypeChoices.INFO, 'sync')
+        self.assertEqual(Journal.objects.count(), 1)
+        self.assertEqual(self.writer.pending(), 0)
+
+    def test_buffer_size(self):
+        started = timezone.now()
+        for num in range(2):
+            self.writer.write(JournalTypeChoices.INFO, f'record {num}')
+        self.assertEqual(Journal.objects.count(), 0)
+        self.assertEqual(self.writer.pending(), 2)
+        self.writer.write(JournalTypeChoices.ERROR, 'record 2')
+        # запись фоновым потоком по заполнению буфера
+        deadline = time.monotonic() + 5
+        while Journal.objects.count() < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(list(Journal.objects.order_by('created_at').values_list('message', flat=True)),
+                         ['record 0', 'record 1', 'record 2'])
+        self.assertTrue(all(record.created_at >= started for record in Journal.objects.all()))
+
+    def test_outside_transaction(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.writer.write(JournalTypeChoices.ERROR, 'rollback')
+            raise ValueError
+        self.assertEqual(self.writer.flush(), 1)
+        self.assertTrue(Journal.objects.filter(message='rollback').exists())
+
+    def test_write_error(self):
+        with mock.patch.object(Journal.objects, 'bulk_create', side_effect=RuntimeError):
+            self.writer.write(JournalTypeChoices.INFO, 'record 0')
+            self.assertEqual(self.writer.flush(), 0)
+        # записи сохраняются до успешной записи, буфер ограничен
+        self.assertEqual(self.writer.pending(), 1)
+        with mock.patch.object(logger, 'JOURNAL_MAX_PENDING', 2):
+            for num in range(1, 4):
+                self.writer.write(JournalTypeChoices.INFO, f'record {num}')
+            self.assertEqual(self.writer.pending(), 2)
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(list(Journal.objects.order_by('created_at').values_list('message', flat=True)),
+                         ['record 2', 'record 3'])
+
+    def test_thread_restart(self):
+        self.writer.write(JournalTypeChoices.INFO, 'record 0')
+        thread = self.writer._thread
+        with mock.patch.object(self.writer, 'flush', side_effect=RuntimeError):
+            self.writer._event.set()
+            thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        # поток, завершившийся по другой причине, запускается заново
+        self.writer._thread = threading.Thread(target=lambda: None)
+        self.writer._thread.start()
+        self.writer._thread.join()
+        self.writer.write(JournalTypeChoices.INFO, 'record 1')
+        self.assertIsNot(self.writer._thread, thread)
+        self.assertTrue(self.writer._thread.is_alive())
+
+
 class TestProxyModel(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -76,3 +186,454 @@ class TestProxyModel(TestCase):
     def test_get_default_proxy(self):
         url = models.Proxy.objects.get_default_proxy_url()
         self.assertEqual(url, 'http://proxy.server.ltd')
+
+
+class PKIStoreTestCase(TestCase):
+    """Тесты с записью файлов во временный MEDIA_ROOT. Журнал записывается синхронно, в транзакции теста"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root, PKIMAN_JOURNAL_SYNC=True)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class TestRawDigestDuplicate(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test CA', ca=True)
+        cls.crl = make_crl(cls.ca, cls.ca_key, revoked=[1, 2])
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crt_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(cls.ca)))
+        cls.crl_obj, _ = models.Crl.objects.get_from_pki(read_x509(as_upload(cls.crl)))
+
+    def test_raw_digest_stored(self):
+        self.assertEqual(self.crt_obj.raw_digest, read_x509(as_upload(self.ca)).raw_digest)
+        self.assertEqual(self.crl_obj.raw_digest, read_x509(as_upload(self.crl)).raw_digest)
+
+    def test_duplicate_rejected_before_parse(self):
+        for obj in (self.ca, self.crl):
+            with self.assertNumQueries(1), self.assertRaises(PKIDuplicateError):
+                read_x509(as_upload(obj), use_cache=False, precheck=models.check_raw_duplicate)
+
+    def test_other_encoding_passes(self):
+        pki = read_x509(as_upload(self.ca, pem=True), precheck=models.check_raw_duplicate)
+        object, created = models.Crt.objects.get_from_pki(pki)
+        self.assertFalse(created)
+        self.assertEqual(object.pk, self.crt_obj.pk)
+
+
+class TestFingerprintLookup(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, _ = make_crt('Test CA', ca=True)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crt_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(cls.ca)))
+
+    def test_filter_fingerprint(self):
+        pki = read_x509(as_upload(self.ca))
+        for value in (pki.fingerprints['sha1'], pki.fingerprints['sha256'], pki.fingerprints['md5'],
+                      ':'.join(pki.fingerprints['sha256'][i:i + 2] for i in range(0, 64, 2)).upper()):
+            self.assertEqual(list(models.Crt.objects.filter_fingerprint(value)), [self.crt_obj])
+
+    def test_filter_fingerprint_unknown(self):
+        self.assertFalse(models.Crt.objects.filter_fingerprint('abc').exists())
+        self.assertFalse(models.Crl.objects.filter_fingerprint('0' * 40).exists())
+
+
+class TestPKIBatch(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root, cls.root_key = make_crt('Test root', ca=True)
+        cls.sub, cls.sub_key = make_crt('Test sub CA', ca=True, issuer_crt=cls.root, issuer_key=cls.root_key)
+        cls.leaf, _ = make_crt('Test user', issuer_crt=cls.sub, issuer_key=cls.sub_key)
+        cls.crl = make_crl(cls.sub, cls.sub_key, revoked=[1, 2, 3])
+        super().setUpClass()
+
+    def batch(self, *objects):
+        pki_list = []
+        for obj in objects:
+            pki = parse_x509(obj)
+            pki.up_file = as_upload(obj)
+            pki_list.append(pki)
+        return models.get_from_pki_list(pki_list)
+
+    def test_chain_any_order(self):
+        result = self.batch(self.crl, self.leaf, self.sub, self.root)
+        self.assertEqual((len(result.created), len(result.exists), result.errors), (4, 0, []))
+        leaf = models.Crt.objects.get(subject_identifier=parse_x509(self.leaf).subject_identifier)
+        self.assertEqual(leaf.issuer.issuer.subject_identifier, parse_x509(self.root).subject_identifier)
+        self.assertEqual(leaf.depth, 3)
+        self.assertEqual(leaf.issuer.crl.revoked_count, 3)
+
+    @override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+    def test_bulk_rollback_files(self):
+        index_objects = search.index_objects
+        calls = []
+
+        def fail_first(*args, **kwargs):
+            # ошибка пакетной записи после записи файлов в хранилище
+            calls.append(args)
+            if len(calls) == 1:
+                raise IntegrityError('test')
+            return index_objects(*args, **kwargs)
+
+        def stored():
+            return {str(path.relative_to(self.media_root)) for path in Path(self.media_root).rglob('*.crt')}
+
+        before = stored()
+        with mock.patch.object(search, 'index_objects', side_effect=fail_first):
+            result = self.batch(self.leaf, self.sub, self.root)
+        self.assertEqual(len(result.created), 3)
+        # после отката пакетной записи в хранилище только файлы объектов, сохраненных по одному
+        self.assertEqual(stored() - before, set(models.Crt.objects.values_list('file', flat=True)))
+
+    def test_errors_and_exists(self):
+        self.batch(self.root)
+        result = self.batch(self.root, self.crl)
+        self.assertEqual(len(result.exists), 1)
+        self.assertEqual(len(result.errors), 1)
+        self.assertEqual(models.Crt.objects.count(), 1)
+
+
+class CrtChainTestCase(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root, cls.root_key = make_crt('Test root', ca=True)
+        cls.sub, cls.sub_key = make_crt('Test sub CA', ca=True, issuer_crt=cls.root, issuer_key=cls.root_key)
+        cls.other_sub, cls.other_sub_key = make_crt('Test other sub CA', ca=True, issuer_crt=cls.root,
+                                                    issuer_key=cls.root_key)
+        cls.leaf_list = [make_crt(f'Test user {num}', issuer_crt=cls.sub, issuer_key=cls.sub_key)[0]
+                         for num in range(4)]
+        cls.other_leaf, _ = make_crt('Test other user', issuer_crt=cls.other_sub, issuer_key=cls.other_sub_key)
+        super().setUpClass()
+
+    def pki_list(self, *objects):
+        result = []
+        for obj in objects:
+            pki = parse_x509(obj)
+            pki.up_file = as_upload(obj)
+            result.append(pki)
+        return result
+
+    def assertTreeValid(self):
+        self.assertEqual(models.Crt.find_problems(), ([], [], [], [], []))
+        for crt in models.Crt.objects.all():
+            parent = crt.get_parent()
+            self.assertEqual(crt.issuer_id, parent.pk if parent else None, crt)
+            # статус цепочки совпадает с проверкой всех сертификатов до корня
+            chain = [crt, *crt.get_ancestors()]
+            self.assertEqual(crt.chain_revoked, any(item.is_revoked() for item in chain), crt)
+            self.assertEqual(crt.chain_valid_after, max(item.valid_after for item in chain), crt)
+            self.assertEqual(crt.chain_valid_before, min(item.valid_before for item in chain), crt)
+
+
+class TestCrtBulkCreate(CrtChainTestCase):
+
+    def test_bulk_forest(self):
+        created, exists = models.Crt.objects.bulk_create_from_pki(
+                self.pki_list(*self.leaf_list, self.sub, self.root, self.other_sub, self.other_leaf))
+        self.assertEqual((len(created), len(exists)), (8, 0))
+        self.assertTreeValid()
+        root = models.Crt.objects.get(depth=1)
+        self.assertEqual(root.numchild, 2)
+        self.assertEqual(models.Crt.objects.filter(depth=3).count(), 5)
+
+    def test_bulk_existing_parent_and_orphan(self):
+        # в БД: корневой с дочерним, конечный сертификат без издателя
+        models.get_from_pki_list(self.pki_list(self.root, self.other_sub, self.leaf_list[0]))
+        created, exists = models.Crt.objects.bulk_create_from_pki(
+                self.pki_list(self.sub, *self.leaf_list[1:], self.root))
+        self.assertEqual((len(created), len(exists)), (4, 1))
+        self.assertTreeValid()
+        sub = models.Crt.objects.get(subject_identifier=parse_x509(self.sub).subject_identifier)
+        self.assertEqual(sub.depth, 2)
+        self.assertEqual(sub.numchild, 4)
+        self.assertEqual(models.Crt.objects.get(depth=1).numchild, 2)
+
+    def test_bulk_repeat(self):
+        models.Crt.objects.bulk_create_from_pki(self.pki_list(self.root, self.sub))
+        created, exists = models.Crt.objects.bulk_create_from_pki(self.pki_list(self.root, self.sub, self.root))
+        self.assertEqual((len(created), len(exists)), (0, 2))
+
+
+class TestAdoptOrphans(CrtChainTestCase):
+
+    def test_adopt_subtree(self):
+        models.get_from_pki_list(self.pki_list(self.sub, *self.leaf_list, self.other_leaf))
+        self.assertEqual(models.Crt.objects.filter(depth=1).count(), 2)
+        # сирота с поддеревом переносится одним запросом независимо от количества узлов поддерева
+        with self.assertNumQueries(18):
+            models.Crt.objects.get_from_pki(self.pki_list(self.root)[0])
+        self.assertTreeValid()
+        root = models.Crt.objects.get(is_root_ca=True)
+        self.assertEqual((root.depth, root.numchild), (1, 1))
+        self.assertEqual(models.Crt.objects.filter(depth=3).count(), 4)
+        self.assertEqual(models.Crt.objects.filter(depth=1).count(), 2)
+
+        models.Crt.objects.get_from_pki(self.pki_list(self.other_sub)[0])
+        self.assertTreeValid()
+        self.assertEqual(models.Crt.objects.filter(depth=3).count(), 5)
+        self.assertEqual(models.Crt.objects.get(is_root_ca=True).numchild, 2)
+
+
+class TestChainStatus(CrtChainTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.short_sub, cls.short_sub_key = make_crt('Test short sub CA', ca=True, issuer_crt=cls.root,
+                                                    issuer_key=cls.root_key, days=30, serial=2001)
+        cls.short_leaf, _ = make_crt('Test short user', issuer_crt=cls.short_sub, issuer_key=cls.short_sub_key)
+
+    def test_chain_dates(self):
+        models.get_from_pki_list(self.pki_list(self.root, self.short_sub, self.short_leaf))
+        self.assertTreeValid()
+        leaf = models.Crt.objects.get(subject_dn__commonName='Test short user')
+        sub = models.Crt.objects.get(subject_dn__commonName='Test short sub CA')
+        self.assertEqual(leaf.chain_valid_before, sub.valid_before)
+        self.assertTrue(leaf.is_valid())
+
+    def test_adopt(self):
+        for pki in self.pki_list(self.short_leaf, self.short_sub, self.root):
+            models.Crt.objects.get_from_pki(pki)
+        self.assertTreeValid()
+
+    def test_revoke_subtree(self):
+        models.get_from_pki_list(self.pki_list(self.root, self.short_sub, self.short_leaf, self.sub))
+        crl = make_crl(self.root, self.root_key, revoked=[(2001, x509.ReasonFlags.certificate_hold)])
+        models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))
+        self.assertTreeValid()
+        leaf = models.Crt.objects.get(subject_dn__commonName='Test short user')
+        self.assertTrue(leaf.chain_revoked)
+        self.assertFalse(leaf.is_valid())
+        self.assertTrue(models.Crt.objects.get(subject_dn__commonName='Test sub CA').is_valid())
+
+        crl = make_crl(self.root, self.root_key, crl_number=2,
+                       last_update=datetime.datetime.utcnow() + datetime.timedelta(minutes=1))
+        models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))
+        self.assertTreeValid()
+        self.assertTrue(models.Crt.objects.get(subject_dn__commonName='Test short user').is_valid())
+
+
+class TestRegistry(CrtChainTestCase):
+
+    def test_registry_queries(self):
+        models.get_from_pki_list(self.pki_list(self.root, self.sub))
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('pkiman:index'), {'pki': 'crt'})
+        models.get_from_pki_list(self.pki_list(*self.leaf_list, self.other_sub, self.other_leaf))
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('pkiman:index'), {'pki': 'crt'})
+        # на странице только корневые узлы, поддеревья загружаются по запросу
+        self.assertEqual([item.depth for item in response.context['object_list']], [1])
+        self.assertEqual(len(large), len(small))
+
+        sub = models.Crt.objects.get(subject_identifier=parse_x509(self.sub).subject_identifier)
+        with CaptureQueriesContext(connection) as children:
+            response = self.client.get(reverse('pkiman:crt_children', args=[sub.pk]))
+        self.assertEqual(len(response.context['object_list']), 4)
+        self.assertEqual(len(children), 2)
+
+        crl = make_crl(self.sub, self.sub_key)
+        models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))
+        response = self.client.get(reverse('pkiman:index'), {'pki': 'crl'})
+        self.assertEqual([item.issuer_id for item in response.context['object_list']], [sub.pk])
+
+    @override_settings(PKIMAN_REESTR_PAGE_SIZE=2)
+    def test_keyset_pages(self):
+        # конечные сертификаты без издателей - корневые узлы дерева
+        models.get_from_pki_list(self.pki_list(*self.leaf_list, self.other_leaf))
+        paths = list(models.Crt.get_root_nodes().values_list('path', flat=True))
+        pages, params = [], {'pki': 'crt'}
+        while True:
+            page = self.client.get(reverse('pkiman:index'), params).context['page']
+            pages.append([item.path for item in page])
+            if not page.has_next:
+                break
+            params = {'pki': 'crt', 'after': page.next_cursor}
+        self.assertEqual(pages, [paths[:2], paths[2:4], paths[4:]])
+
+        page = self.client.get(reverse('pkiman:index'), {'pki': 'crt', 'before': page.previous_cursor}).context['page']
+        self.assertEqual([item.path for item in page], paths[2:4])
+        self.assertTrue(page.has_previous)
+        self.assertTrue(page.has_next)
+
+    @override_settings(PKIMAN_REESTR_PAGE_SIZE=3)
+    def test_children_pages(self):
+        models.get_from_pki_list(self.pki_list(self.root, self.sub, *self.leaf_list))
+        sub = models.Crt.objects.get(subject_identifier=parse_x509(self.sub).subject_identifier)
+        url = reverse('pkiman:crt_children', args=[sub.pk])
+        response = self.client.get(url)
+        page = response.context['page']
+        self.assertEqual(len(page), 3)
+        self.assertContains(response, 'data-more')
+        response = self.client.get(url, {'after': page.next_cursor})
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertNotContains(response, 'data-more')
+
+
+class TestRevokedSerial(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test CA', ca=True)
+        cls.crt, _ = make_crt('Test user', issuer_crt=cls.ca, issuer_key=cls.ca_key, serial=1001)
+        cls.other, _ = make_crt('Test other', issuer_crt=cls.ca, issuer_key=cls.ca_key, serial=1003)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ca_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(cls.ca)))
+        cls.crt_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(cls.crt)))
+        cls.other_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(cls.other)))
+
+    def load_crl(self, revoked, crl_number):
+        last_update = datetime.datetime.utcnow() - datetime.timedelta(hours=10 - crl_number)
+        crl = make_crl(self.ca, self.ca_key, revoked=revoked, crl_number=crl_number, last_update=last_update,
+                       revocation_date=datetime.datetime(2023, 1, 1))
+        return models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))[0]
+
+    def test_load(self):
+        self.load_crl([(1001, x509.ReasonFlags.key_compromise), 1002], 1)
+        self.assertTrue(models.RevokedSerial.objects.is_revoked(self.ca_obj, 1001))
+        self.assertTrue(models.RevokedSerial.objects.is_revoked(self.ca_obj, '1002'))
+        self.assertFalse(models.RevokedSerial.objects.is_revoked(self.ca_obj, 1003))
+        entry = models.RevokedSerial.objects.get(serial='1001')
+        self.assertEqual(entry.reason, models.RevocationReasonChoices.KEY_COMPROMISE)
+        self.assertIsNone(models.RevokedSerial.objects.get(serial='1002').reason)
+        self.crt_obj.refresh_from_db()
+        self.other_obj.refresh_from_db()
+        self.assertEqual(self.crt_obj.revoked_date, entry.revocation_date)
+        self.assertTrue(self.crt_obj.is_revoked())
+        self.assertIsNone(self.other_obj.revoked_date)
+
+    def test_update(self):
+        self.load_crl([1001], 1)
+        self.load_crl([1003], 2)
+        self.assertEqual(list(models.RevokedSerial.objects.values_list('serial', flat=True)), ['1003'])
+        self.other_obj.refresh_from_db()
+        self.assertIsNotNone(self.other_obj.revoked_date)
+        # отозванный сертификат остается отозванным после исключения из списка
+        self.crt_obj.refresh_from_db()
+        self.assertIsNotNone(self.crt_obj.revoked_date)
+
+    def test_diff(self):
+        self.load_crl([1001, (1003, x509.ReasonFlags.certificate_hold), 1004], 1)
+        events = []
+
+        def handler(sender, issuer, added, removed, changed, **kwargs):
+            events.append((issuer, added, removed, changed))
+
+        revoked_serials_changed.connect(handler)
+        self.addCleanup(revoked_serials_changed.disconnect, handler)
+        with self.assertNumQueries(19):
+            self.load_crl([(1001, x509.ReasonFlags.key_compromise), 1004, 1005], 2)
+        (issuer, added, removed, changed), = events
+        self.assertEqual(issuer, self.ca_obj)
+        self.assertEqual([entry.serial for entry in added], ['1005'])
+        self.assertEqual([(entry.serial, entry.reason) for entry in removed],
+                         [('1003', models.RevocationReasonChoices.CERTIFICATE_HOLD)])
+        self.assertEqual([(entry.serial, entry.reason) for entry in changed],
+                         [('1001', models.RevocationReasonChoices.KEY_COMPROMISE)])
+        self.assertCountEqual(models.RevokedSerial.objects.values_list('serial', flat=True), ['1001', '1004', '1005'])
+        self.other_obj.refresh_from_db()
+        self.assertIsNone(self.other_obj.revoked_date)
+
+    def test_diff_unchanged(self):
+        self.load_crl([1001, 1002], 1)
+        events = []
+        revoked_serials_changed.connect(events.append)
+        self.addCleanup(revoked_serials_changed.disconnect, events.append)
+        self.load_crl([1001, 1002], 2)
+        self.assertEqual(events, [])
+
+    def test_revoked_diff(self):
+        stored = [(1, 'd', None), (2, 'd', None), (10, 'd', 1)]
+        loaded = [(2, 'd', None), (3, 'd', None), (10, 'd', 4)]
+        diff = models.revoked_diff(stored, loaded)
+        self.assertEqual(diff.added, [models.RevokedRecord('3', 'd', None)])
+        self.assertEqual(diff.removed, [models.RevokedRecord('1', 'd', None)])
+        self.assertEqual(diff.changed, [models.RevokedRecord('10', 'd', 4)])
+
+    def test_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            crl_obj = self.load_crl([(1001, x509.ReasonFlags.key_compromise), 1002], 1)
+        self.assertTrue(os.path.exists(crl_obj.index_path()))
+        self.assertEqual(crl_obj.get_revoked(1001),
+                         models.RevokedRecord('1001', models.RevokedSerial.objects.get(serial='1001').revocation_date,
+                                              models.RevocationReasonChoices.KEY_COMPROMISE))
+        self.assertIsNone(crl_obj.get_revoked(1003))
+        with self.captureOnCommitCallbacks(execute=True):
+            crl_obj = self.load_crl([1003], 2)
+        self.assertIsNone(crl_obj.get_revoked(1001))
+        self.assertEqual(crl_obj.get_revoked('1003').serial, '1003')
+
+    def test_stored_from_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            crl_obj = self.load_crl([(1001, x509.ReasonFlags.certificate_hold), 1002], 1)
+        expected = [(int(serial), revocation_date, reason) for serial, revocation_date, reason in
+                    models.RevokedSerial.objects.order_by('serial').values_list('serial', 'revocation_date', 'reason')]
+        # сохраненные записи читаются из индекса, из БД - только количество
+        with self.assertNumQueries(1):
+            stored = list(models.RevokedSerial.objects.stored_records(self.ca_obj, crl_obj.index_path()))
+        self.assertEqual(stored, expected)
+        models.RevokedSerial.objects.filter(serial='1002').delete()
+        with self.assertNumQueries(2):
+            stored = list(models.RevokedSerial.objects.stored_records(self.ca_obj, crl_obj.index_path()))
+        self.assertEqual(stored, expected[:1])
+        with self.captureOnCommitCallbacks(execute=True):
+            crl_obj = self.load_crl([1002, 1004], 2)
+        self.assertEqual([entry.serial for entry in revocation_index.iter_index(crl_obj.index_path())], [1002, 1004])
+        self.assertCountEqual(models.RevokedSerial.objects.values_list('serial', flat=True), ['1002', '1004'])
+        self.crt_obj.refresh_from_db()
+        self.assertIsNone(self.crt_obj.revoked_date)
+
+    def test_index_missing(self):
+        crl_obj = self.load_crl([1001], 1)
+        remove_index(crl_obj.index_path())
+        self.assertEqual(crl_obj.get_revoked(1001).serial, '1001')
+        self.assertIsNone(crl_obj.get_revoked(1002))
+
+    def test_delete_crl(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            crl_obj = self.load_crl([1001, 1002], 1)
+        crl_obj.delete()
+        self.assertFalse(models.RevokedSerial.objects.exists())
+        self.assertFalse(os.path.exists(crl_obj.index_path()))
+
+
+class TestDnHash(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test CA', ca=True)
+        cls.crt, _ = make_crt('Test user', issuer_crt=cls.ca, issuer_key=cls.ca_key)
+        # тот же ключ, DN отличается регистром и пробелами
+        cls.ca_alias, _ = make_crt(' test  ca ', key=cls.ca_key, ca=True)
+        super().setUpClass()
+
+    def test_canonical_dn(self):
+        self.assertEqual(canonical_dn({'commonName': ' Test  CA'}), canonical_dn({'commonName': 'test ca '}))
+        self.assertNotEqual(dn_hash({'commonName': 'A', 'organizationName': 'B'}),
+                            dn_hash({'organizationName': 'B', 'commonName': 'A'}))
+        self.assertEqual(len(dn_hash({})), 64)
+
+    def test_lookup_by_hash(self):
+        crt_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(self.crt)))
+        ca_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(self.ca)))
+        crt_obj.refresh_from_db()
+        self.assertEqual(crt_obj.issuer_id, ca_obj.pk)
+        self.assertEqual(crt_obj.issuer_dn_hash, ca_obj.subject_dn_hash)
+        crl_obj, _ = models.Crl.objects.get_from_pki(read_x509(as_upload(make_crl(self.ca_alias, self.ca_key))))
+        self.assertEqual(crl_obj.issuer_id, ca_obj.pk)
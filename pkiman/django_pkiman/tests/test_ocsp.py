@@ -0,0 +1,136 @@
+import base64
+import datetime
+import os
+from unittest import mock
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509 import ocsp as x509_ocsp
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+
+from django_pkiman import models
+from django_pkiman.tests.test_models import PKIStoreTestCase
+from django_pkiman.tests.utils import as_upload, make_crl, make_crt
+from django_pkiman.utils import ocsp
+from django_pkiman.utils.pki_parser import read_x509
+
+
+class TestOCSPResponder(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test CA', ca=True)
+        cls.good, _ = make_crt('Test good', issuer_crt=cls.ca, issuer_key=cls.ca_key, serial=1003)
+        cls.revoked, _ = make_crt('Test revoked', issuer_crt=cls.ca, issuer_key=cls.ca_key, serial=1001)
+        cls.other_ca, cls.other_key = make_crt('Test other CA', ca=True)
+        cls.unknown, _ = make_crt('Test unknown', issuer_crt=cls.other_ca, issuer_key=cls.other_key, serial=1001)
+        cls.responder, cls.responder_key = make_crt('Test OCSP', issuer_crt=cls.ca, issuer_key=cls.ca_key)
+        cls.crl = make_crl(cls.ca, cls.ca_key, revoked=[(1001, x509.ReasonFlags.key_compromise)])
+        super().setUpClass()
+        cert_path = os.path.join(cls.media_root, 'responder.crt')
+        key_path = os.path.join(cls.media_root, 'responder.key')
+        with open(cert_path, 'wb') as f:
+            f.write(cls.responder.public_bytes(serialization.Encoding.PEM))
+        with open(key_path, 'wb') as f:
+            f.write(cls.responder_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                                    serialization.NoEncryption()))
+        cls.responder_override = override_settings(PKIMAN_OCSP_RESPONDER_CERT=cert_path,
+                                                   PKIMAN_OCSP_RESPONDER_KEY=key_path)
+        cls.responder_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.responder_override.disable()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        models.Crt.objects.get_from_pki(read_x509(as_upload(cls.ca)))
+        with cls.captureOnCommitCallbacks(execute=True):
+            models.Crl.objects.get_from_pki(read_x509(as_upload(cls.crl)))
+
+    def setUp(self):
+        ocsp.clear()
+        cache.clear()
+
+    def ocsp_request(self, crt, issuer, algorithm=hashes.SHA1()) -> bytes:
+        return (x509_ocsp.OCSPRequestBuilder()
+                .add_certificate(crt, issuer, algorithm)
+                .build()
+                .public_bytes(serialization.Encoding.DER))
+
+    def post(self, der: bytes) -> x509_ocsp.OCSPResponse:
+        response = self.client.post(reverse('pkiman:ocsp'), der, content_type=ocsp.OCSP_REQUEST_CONTENT_TYPE)
+        self.assertEqual(response['Content-Type'], ocsp.OCSP_RESPONSE_CONTENT_TYPE)
+        return x509_ocsp.load_der_ocsp_response(response.content)
+
+    def test_good(self):
+        response = self.post(self.ocsp_request(self.good, self.ca))
+        self.assertEqual(response.response_status, x509_ocsp.OCSPResponseStatus.SUCCESSFUL)
+        self.assertEqual(response.certificate_status, x509_ocsp.OCSPCertStatus.GOOD)
+        self.assertEqual(response.serial_number, 1003)
+        self.responder.public_key().verify(response.signature, response.tbs_response_bytes,
+                                           ec.ECDSA(response.signature_hash_algorithm))
+
+    def test_revoked(self):
+        response = self.post(self.ocsp_request(self.revoked, self.ca, hashes.SHA256()))
+        self.assertEqual(response.certificate_status, x509_ocsp.OCSPCertStatus.REVOKED)
+        self.assertEqual(response.revocation_reason, x509.ReasonFlags.key_compromise)
+        self.assertIsInstance(response.hash_algorithm, hashes.SHA256)
+
+    def test_unknown_issuer(self):
+        response = self.post(self.ocsp_request(self.unknown, self.other_ca))
+        self.assertEqual(response.response_status, x509_ocsp.OCSPResponseStatus.UNAUTHORIZED)
+
+    def test_malformed(self):
+        response = self.post(b'not a request')
+        self.assertEqual(response.response_status, x509_ocsp.OCSPResponseStatus.MALFORMED_REQUEST)
+
+    def test_get_cached(self):
+        data = base64.b64encode(self.ocsp_request(self.revoked, self.ca)).decode()
+        first = self.client.get(reverse('pkiman:ocsp', args=[data]))
+        self.assertIn('max-age=', first['Cache-Control'])
+        with self.assertNumQueries(1):
+            second = self.client.get(reverse('pkiman:ocsp', args=[data]))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(x509_ocsp.load_der_ocsp_response(second.content).certificate_status,
+                         x509_ocsp.OCSPCertStatus.REVOKED)
+
+    def test_revoked_serials_changed(self):
+        der = self.ocsp_request(self.good, self.ca)
+        self.assertEqual(self.post(der).certificate_status, x509_ocsp.OCSPCertStatus.GOOD)
+        crl = make_crl(self.ca, self.ca_key, revoked=[(1001, x509.ReasonFlags.key_compromise), 1003], crl_number=2,
+                       last_update=datetime.datetime.utcnow() + datetime.timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))
+        self.assertEqual(self.post(der).certificate_status, x509_ocsp.OCSPCertStatus.REVOKED)
+
+    def test_not_configured(self):
+        with override_settings(PKIMAN_OCSP_RESPONDER_KEY=None):
+            response = self.post(self.ocsp_request(self.good, self.ca))
+        self.assertEqual(response.response_status, x509_ocsp.OCSPResponseStatus.INTERNAL_ERROR)
+
+    def test_stub_certificate(self):
+        for serial in (1, 127, 128, 255, 1003, 1 << 100, (1 << 159) - 1):
+            stub = ocsp._stub_certificate(serial)
+            self.assertEqual(stub.serial_number, serial)
+            # подпись заглушки действительна
+            stub.public_key().verify(stub.signature, stub.tbs_certificate_bytes,
+                                     ec.ECDSA(stub.signature_hash_algorithm))
+        for serial in (0, -1, 1 << 159):
+            with self.assertRaises(ValueError):
+                ocsp._stub_certificate(serial)
+
+    @override_settings(PKIMAN_OCSP_ISSUER_TTL=0)
+    def test_issuer_table(self):
+        request = x509_ocsp.load_der_ocsp_request(self.ocsp_request(self.good, self.ca))
+        args = (request.hash_algorithm.name, request.issuer_name_hash, request.issuer_key_hash)
+        with mock.patch.object(ocsp, 'load_x509', wraps=ocsp.load_x509) as load_x509:
+            self.assertEqual(ocsp.get_issuer(*args)[0], self.ca)
+            # перестроение устаревшей таблицы без повторного чтения сертификатов издателей
+            self.assertEqual(ocsp.get_issuer(*args)[0], self.ca)
+        self.assertEqual(load_x509.call_count, 1)
+        models.Crl.objects.all().delete()
+        self.assertIsNone(ocsp.get_issuer(*args))
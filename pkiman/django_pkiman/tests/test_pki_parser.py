@@ -0,0 +1,224 @@
+import hashlib
+import pickle
+import types
+import unittest
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import Encoding, pkcs7
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from django_pkiman.tests.utils import as_upload, make_crl, make_crt
+from django_pkiman.utils.parse_cache import ParseCache, parse_cache
+from django_pkiman.utils.pki_parser import ENROLL_CERTTYPE_OID, ParsedCertificate, ParsedCertificateRevocationList, \
+    ParsedPKI, fingerprints, is_der, iter_x509, iter_x509_file, parse_x509, read_x509
+
+
+class TestParsedCrlRevoked(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test CA', ca=True)
+        cls.revoked = [(1001, x509.ReasonFlags.key_compromise), 1002, (1003, x509.ReasonFlags.superseded)]
+        cls.crl = make_crl(cls.ca, cls.ca_key, revoked=cls.revoked, crl_number=5)
+
+    def test_read_crl_header(self):
+        pki = read_x509(as_upload(self.crl), use_cache=False)
+        self.assertEqual(pki.pki_type, 'crl')
+        self.assertEqual(pki.crl_number, '5')
+        self.assertEqual(pki.revoked_count, 3)
+        self.assertNotIn('revoked_list', pki.parsed)
+
+    def test_iter_revoked(self):
+        pki = parse_x509(self.crl)
+        revoked = pki.iter_revoked()
+        self.assertIsInstance(revoked, types.GeneratorType)
+        entries = {entry.serial: entry for entry in revoked}
+        self.assertEqual(set(entries), {'1001', '1002', '1003'})
+        self.assertEqual(entries['1001'].reason, 'keyCompromise')
+        self.assertIsNone(entries['1002'].reason)
+        self.assertIsNotNone(entries['1003'].revocation_date.tzinfo)
+
+    def test_iter_revoked_crt(self):
+        self.assertFalse(hasattr(parse_x509(self.ca), 'iter_revoked'))
+
+
+class TestParsedCertificate(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test CA', ca=True)
+        cls.crt, _ = make_crt('Test user', issuer_crt=cls.ca, issuer_key=cls.ca_key,
+                              cdp_urls=['http://pki.test/ca.crl'], aia_urls=['http://pki.test/ca.crt'])
+
+    def test_slots(self):
+        pki = parse_x509(self.crt)
+        self.assertIsInstance(pki, ParsedCertificate)
+        self.assertFalse(hasattr(pki, '__dict__'))
+
+    def test_lazy_fields(self):
+        pki = parse_x509(self.crt)
+        self.assertFalse(hasattr(pki, '_cdp_info'))
+        self.assertEqual(pki.cdp_info, {0: ['http://pki.test/ca.crl']})
+        self.assertTrue(hasattr(pki, '_cdp_info'))
+        self.assertEqual(pki.auth_info, {'caIssuers': 'http://pki.test/ca.crt'})
+
+    def test_parsed(self):
+        parsed = parse_x509(self.crt).parsed
+        self.assertEqual(set(parsed), set(ParsedCertificate.fields))
+        self.assertEqual(parsed['subject']['commonName'], 'Test user')
+        self.assertEqual(parsed['issuer']['commonName'], 'Test CA')
+        self.assertEqual(parsed['fingerprint'], self.crt.fingerprint(hashes.SHA1()).hex())
+        self.assertEqual(parsed['subject_serial_number'], str(self.crt.serial_number))
+        self.assertEqual(parsed['version'], {2: 'v3'})
+        self.assertFalse(parsed['CA'])
+        self.assertFalse(parsed['is_root'])
+
+    def test_enroll_cert_type(self):
+        value = b'\x1e\x0a\x00U\x00s\x00e\x00r'
+        crt = (x509.CertificateBuilder()
+               .subject_name(self.crt.subject)
+               .issuer_name(self.ca.subject)
+               .public_key(self.crt.public_key())
+               .serial_number(x509.random_serial_number())
+               .not_valid_before(self.crt.not_valid_before)
+               .not_valid_after(self.crt.not_valid_after)
+               .add_extension(x509.UnrecognizedExtension(ENROLL_CERTTYPE_OID, value), critical=False)
+               .sign(self.ca_key, hashes.SHA256()))
+        pki = parse_x509(crt)
+        self.assertEqual(pki.enroll_cert_type, value)
+        self.assertEqual(pki.parsed['1.3.6.1.4.1.311.20.2'], value)
+        self.assertEqual(pickle.loads(pickle.dumps(pki)).enroll_cert_type, value)
+        self.assertNotIn('1.3.6.1.4.1.311.20.2', parse_x509(self.crt).parsed)
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            ParsedPKI(self.crt)
+
+    def test_read_x509(self):
+        up_file = as_upload(self.ca, pem=True)
+        pki = read_x509(up_file)
+        self.assertIsInstance(pki, ParsedCertificate)
+        self.assertIs(pki.up_file, up_file)
+        self.assertTrue(pki.CA)
+        self.assertTrue(pki.is_root)
+
+    def test_pickle(self):
+        pki = parse_x509(self.crt).evaluate()
+        pki.raw_digest = 'digest'
+        restored = pickle.loads(pickle.dumps(pki))
+        self.assertEqual(restored.raw_digest, 'digest')
+        self.assertEqual(restored.parsed, pki.parsed)
+        self.assertEqual(restored.fingerprints, pki.fingerprints)
+        # вычисленные поля восстанавливаются без загрузки x509 из DER
+        self.assertIsNone(restored._x509)
+        self.assertEqual(restored.object, self.crt)
+
+    def test_read_x509_crl(self):
+        crl = make_crl(self.ca, self.ca_key, revoked=[7, 8])
+        pki = read_x509(as_upload(crl))
+        self.assertIsInstance(pki, ParsedCertificateRevocationList)
+        self.assertEqual(pki.revoked_count, 2)
+        self.assertEqual(pki.issuer_identifier, parse_x509(self.ca).subject_identifier)
+        self.assertEqual(set(pki.parsed), set(ParsedCertificateRevocationList.fields))
+        self.assertEqual(pki.parsed['fingerprint'], crl.fingerprint(hashes.SHA1()).hex())
+
+
+class TestParseCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = ParseCache(maxsize=2, max_bytes=100)
+        cache.put('a', 1, 10)
+        cache.put('b', 2, 10)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3, 10)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        info = cache.info()
+        self.assertEqual((info.hits, info.misses, info.evictions, info.currsize), (1, 0, 1, 2))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.info().misses, 1)
+
+    def test_bytes_bound(self):
+        cache = ParseCache(maxsize=10, max_bytes=100)
+        cache.put('a', 1, 60)
+        cache.put('b', 2, 60)
+        self.assertEqual(list(cache._data), ['b'])
+        cache.put('c', 3, 101)
+        self.assertNotIn('c', cache)
+        self.assertEqual(cache.info().currbytes, 60)
+
+    def test_read_x509_cached(self):
+        ca, _ = make_crt('Test CA', ca=True)
+        parse_cache.clear()
+        first_file, second_file = as_upload(ca), as_upload(ca)
+        first = read_x509(first_file)
+        second = read_x509(second_file)
+        self.assertEqual(parse_cache.info().misses, 1)
+        self.assertEqual(parse_cache.info().hits, 1)
+        self.assertIs(first.object, second.object)
+        self.assertIs(second.up_file, second_file)
+        self.assertEqual(first.raw_digest, second.raw_digest)
+        self.assertEqual(first.parsed, second.parsed)
+
+    def test_read_x509_cached_copy(self):
+        crt, _ = make_crt('Test user', cdp_urls=['http://pki.test/ca.crl'])
+        parse_cache.clear()
+        cached = read_x509(as_upload(crt))
+        # поля, вычисленные в объекте кэша, не изменяются через копии
+        entry = parse_cache.get(('crt', cached.raw_digest))
+        self.assertEqual(entry.subject['commonName'], 'Test user')
+        self.assertEqual(entry.cdp_info, {0: ['http://pki.test/ca.crl']})
+        first = read_x509(as_upload(crt))
+        first.subject['commonName'] = 'changed'
+        first.cdp_info[0].append('http://changed.test/ca.crl')
+        second = read_x509(as_upload(crt))
+        self.assertEqual(second.subject['commonName'], 'Test user')
+        self.assertEqual(second.cdp_info, {0: ['http://pki.test/ca.crl']})
+
+
+class TestFingerprints(unittest.TestCase):
+
+    def test_fingerprints(self):
+        ca, _ = make_crt('Test CA', ca=True)
+        der = ca.public_bytes(Encoding.DER)
+        values = fingerprints(der)
+        self.assertEqual(values['sha1'], ca.fingerprint(hashes.SHA1()).hex())
+        self.assertEqual(values['sha256'], ca.fingerprint(hashes.SHA256()).hex())
+        self.assertEqual(values['md5'], hashlib.md5(der).hexdigest())
+        self.assertIn('gost', values)
+        self.assertEqual(parse_x509(ca).fingerprint, values['sha1'])
+
+    def test_fingerprints_chunks(self):
+        data = bytes(range(256)) * 1000
+        self.assertEqual(fingerprints(data)['sha256'], hashlib.sha256(data).hexdigest())
+
+
+class TestBundle(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test CA', ca=True)
+        cls.crt_list = [make_crt(f'Test user {num}', issuer_crt=cls.ca, issuer_key=cls.ca_key)[0] for num in range(3)]
+        cls.crl = make_crl(cls.ca, cls.ca_key, revoked=[1])
+
+    def test_is_der(self):
+        self.assertTrue(is_der(self.ca.public_bytes(Encoding.DER)))
+        self.assertTrue(is_der(b'\x30\x10' + b'\x00' * 16))
+        self.assertFalse(is_der(self.ca.public_bytes(Encoding.PEM)))
+        self.assertFalse(is_der(b'\x30'))
+
+    def test_pem_bundle(self):
+        raw_data = b'\n'.join(obj.public_bytes(Encoding.PEM) for obj in [self.ca, *self.crt_list, self.crl])
+        objects = list(iter_x509(raw_data, 'pem'))
+        self.assertEqual(objects, [self.ca, *self.crt_list, self.crl])
+
+    def test_p7b(self):
+        for encoding in (Encoding.DER, Encoding.PEM):
+            raw_data = pkcs7.serialize_certificates([self.ca, *self.crt_list], encoding)
+            self.assertCountEqual(list(iter_x509(raw_data, 'p7b')), [self.ca, *self.crt_list])
+
+    def test_iter_x509_file(self):
+        raw_data = b''.join(obj.public_bytes(Encoding.PEM) for obj in (self.ca, self.crl))
+        up_file = SimpleUploadedFile('bundle.pem', raw_data, 'application/octet-stream')
+        crt, crl = iter_x509_file(up_file)
+        self.assertEqual((crt.pki_type, crl.pki_type), ('crt', 'crl'))
+        self.assertEqual(crt.up_file.read(), self.ca.public_bytes(Encoding.DER))
+        self.assertEqual(crl.raw_digest, hashlib.sha256(self.crl.public_bytes(Encoding.DER)).hexdigest())
@@ -0,0 +1,198 @@
+import datetime
+import gc
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from cryptography.hazmat.primitives import serialization
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.test import override_settings
+
+from django_pkiman import models
+from django_pkiman.errors import PKIUrlSizeError
+from django_pkiman.tests.test_models import PKIStoreTestCase
+from django_pkiman.tests.utils import as_upload, make_crl, make_crt
+from django_pkiman.utils import download
+from django_pkiman.utils.pki_parser import read_x509
+
+
+class CrlServer(ThreadingHTTPServer):
+    """Сервер списков отзыва с задержкой ответа и учетом одновременных запросов по заголовку Host"""
+    daemon_threads = True
+    delay = 0.1
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), CrlHandler)
+        self.files = {}
+        self.failures = {}
+        self.methods = []
+        self.active = {}
+        self.max_active = {}
+        self.lock = threading.Lock()
+
+
+class CrlHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def respond(self, body: bool):
+        server = self.server
+        host = self.headers['host'].split(':')[0]
+        with server.lock:
+            server.methods.append(self.command)
+            server.active[host] = server.active.get(host, 0) + 1
+            server.max_active[host] = max(server.max_active.get(host, 0), server.active[host])
+        try:
+            time.sleep(server.delay)
+            # /stream/<путь> - ответ без content-length, конец тела - закрытие соединения
+            stream = self.path.startswith('/stream/')
+            data = server.files.get(self.path[len('/stream'):] if stream else self.path)
+            # failures[путь] - количество ответов 503 до успешного
+            with server.lock:
+                failures = server.failures.get(self.path, 0)
+                server.failures[self.path] = max(failures - 1, 0)
+            if failures:
+                self.send_error(503)
+                return
+            if data is None:
+                self.send_error(404)
+                return
+            etag = f'"{len(data)}-{self.path}"'
+            if self.headers['if-none-match'] == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pkix-crl')
+            if not stream:
+                self.send_header('Content-Length', str(len(data)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+            self.end_headers()
+            if body:
+                self.wfile.write(data)
+        finally:
+            with server.lock:
+                server.active[host] -= 1
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def do_GET(self):
+        self.respond(True)
+
+
+class TestRefreshCrls(PKIStoreTestCase):
+    count = 6
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = CrlServer()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        port = cls.server.server_port
+        last_update = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        cls.pki = []
+        for num in range(cls.count):
+            ca, ca_key = make_crt(f'Test refresh CA {num}', ca=True)
+            host = '127.0.0.1' if num % 2 else 'localhost'
+            url = f'http://{host}:{port}/{num}.crl'
+            cls.server.files[f'/{num}.crl'] = make_crl(ca, ca_key, crl_number=2).public_bytes(
+                serialization.Encoding.DER)
+            cls.pki.append((ca, make_crl(ca, ca_key, crl_number=1, last_update=last_update), url))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crl_list = []
+        for ca, crl, url in cls.pki:
+            models.Crt.objects.get_from_pki(read_x509(as_upload(ca)))
+            crl_obj, _ = models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))
+            crl_obj.urls = url
+            crl_obj.save()
+            cls.crl_list.append(crl_obj)
+
+    def test_refresh(self):
+        summary = download.refresh_crls(self.crl_list, workers=8, limit=download.ConnectionLimiter(per_host=2))
+        self.assertEqual(summary.counts[download.REFRESH_UPDATED], self.count)
+        self.assertEqual(self.server.max_active, {'127.0.0.1': 2, 'localhost': 2})
+        self.assertEqual(set(models.Crl.objects.values_list('crl_number', flat=True)), {'2'})
+        self.assertLess(summary.seconds, self.count * 2 * CrlServer.delay)
+        self.assertEqual(set(summary.latency()), {'p50', 'p95', 'max'})
+        self.assertTrue(models.Journal.objects.filter(message__startswith='Обновление списков отзыва').exists())
+        self.assertEqual(self.server.methods, ['GET'] * self.count)
+        crl = models.Crl.objects.get(pk=self.crl_list[0].pk)
+        self.assertGreater(crl.publish_interval, datetime.timedelta(minutes=50))
+        self.assertGreater(crl.next_check, crl.f_sync)
+        self.assertEqual(crl.f_etag, f'"{len(self.server.files["/0.crl"])}-/0.crl"')
+        self.assertEqual(crl.f_date, datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(download.conditional_headers(crl), {'If-None-Match': crl.f_etag,
+                                                             'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+        # повторный запрос - 304 без загрузки файла
+        summary = download.refresh_crls(models.Crl.objects.all())
+        self.assertEqual(summary.counts[download.REFRESH_UNCHANGED], self.count)
+        self.assertGreater(models.Crl.objects.get(pk=crl.pk).f_sync, crl.f_sync)
+
+    def setUp(self):
+        self.server.methods.clear()
+
+    def test_release_fetched(self):
+        store_crl = download.store_crl
+        live = []
+
+        def store(fetched):
+            # загруженные и записанные ранее файлы не удерживаются
+            live.append(sum(1 for obj in gc.get_objects()
+                            if isinstance(obj, download.CrlFetch) and obj.pki is not None))
+            return store_crl(fetched)
+
+        with mock.patch.object(download, 'store_crl', store):
+            summary = download.refresh_crls(self.crl_list, workers=1)
+        self.assertEqual(summary.counts[download.REFRESH_UPDATED], self.count)
+        self.assertEqual(live[-1], 1)
+
+    def test_stream(self):
+        data = self.server.files['/0.crl']
+        url = self.crl_list[0].urls
+        for path in ('/0.crl', '/stream/0.crl'):
+            with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=100):
+                up_file, _ = download.get_from_url(url.replace('/0.crl', path))
+            self.assertIsInstance(up_file, TemporaryUploadedFile)
+            self.assertEqual(up_file.size, len(data))
+            self.assertEqual(up_file.read(), data)
+            self.assertEqual(up_file.raw_digest, hashlib.sha256(data).hexdigest())
+            up_file.close()
+            with override_settings(PKIMAN_DOWNLOAD_MAX_SIZE=100), self.assertRaises(PKIUrlSizeError):
+                download.get_from_url(url.replace('/0.crl', path))
+        up_file, _ = download.get_from_url(url)
+        self.assertIsInstance(up_file, InMemoryUploadedFile)
+        self.assertEqual(read_x509(up_file).raw_digest, up_file.raw_digest)
+
+    def test_session_pool(self):
+        self.assertIs(download.session_pool.get(None), download.session_pool.get({}))
+        proxy = 'http://proxy.server.ltd:3128'
+        session = download.session_pool.get(proxy)
+        self.assertIsNot(session, download.session_pool.get(None))
+        self.assertEqual(session.proxies, {'http': proxy, 'https': proxy})
+        # повтор запроса после ответа 503
+        self.server.failures['/1.crl'] = 1
+        up_file, _ = download.get_from_url(self.crl_list[1].urls)
+        self.assertEqual(up_file.read(), self.server.files['/1.crl'])
+        self.assertEqual(self.server.methods, ['GET', 'GET'])
+
+    def test_error(self):
+        crl = self.crl_list[0]
+        crl.urls = crl.urls.replace('/0.crl', '/missing.crl')
+        crl.save()
+        summary = download.refresh_crls([crl])
+        self.assertEqual(summary.counts[download.REFRESH_ERROR], 1)
+        self.assertIsInstance(summary.results[0].error, download.PKIUrlConnectionError)
+        self.assertTrue(models.Journal.objects.filter(message__contains='missing.crl').exists())
+        self.assertIsNotNone(models.Crl.objects.get(pk=crl.pk).next_check)
@@ -0,0 +1,97 @@
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from django_pkiman.utils import revocation_index
+from django_pkiman.utils.revocation_index import IndexEntry, RevocationIndex, RevocationIndexError, write_index
+
+REVOCATION_DATE = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class TestRevocationIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'test.rsi')
+
+    def records(self, *serials):
+        return sorted((serial, REVOCATION_DATE, serial % 3 or None) for serial in serials)
+
+    def test_lookup(self):
+        serials = [-5, 0, 1, 255, 256, 1 << 100, (1 << 159) - 1, *range(1000, 3000, 7)]
+        write_index(self.path, self.records(*serials))
+        index = RevocationIndex(self.path)
+        self.addCleanup(index.close)
+        for serial in serials:
+            self.assertEqual(index.get(serial), IndexEntry(serial, REVOCATION_DATE, serial % 3 or None))
+        self.assertEqual(index.count, len(serials))
+        self.assertEqual(index.get_many([2, '1000', 1001]), [None, index.get(1000), None])
+
+    def test_iter_index(self):
+        serials = [-5, 0, 1, (1 << 159) - 1, *range(1000, 1100, 7)]
+        packed = [revocation_index.pack_record(*record) for record in self.records(*serials)]
+        self.assertEqual(packed, sorted(packed))
+        revocation_index.write_packed_index(self.path, packed)
+        self.assertEqual(revocation_index.index_count(self.path), len(serials))
+        expected = [IndexEntry(*record) for record in self.records(*serials)]
+        for chunk_records in (1, 4, 1000):
+            self.assertEqual(list(revocation_index.iter_index(self.path, chunk_records)), expected)
+        with open(self.path, 'ab') as f:
+            f.write(b'\0')
+        with self.assertRaises(RevocationIndexError):
+            revocation_index.index_count(self.path)
+
+    def test_sort_records(self):
+        serials = list(range(-50, 1000, 3))
+        random.Random(1).shuffle(serials)
+        packed = [revocation_index.pack_record(*record) for record in self.records(*serials)]
+        expected = [IndexEntry(*record) for record in self.records(*serials)]
+        random.Random(2).shuffle(packed)
+        for chunk_records in (7, 100000):
+            records = revocation_index.sort_records(iter(packed), self.tmp_dir, chunk_records)
+            self.assertEqual(records.count, len(serials))
+            self.assertEqual(list(records), expected)
+            # временные порции удалены, остается файл отсортированных записей
+            self.assertEqual(os.listdir(self.tmp_dir), [os.path.basename(records.path)])
+            del records
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+        records = revocation_index.sort_records(iter(packed), self.tmp_dir)
+        records.replace(self.path)
+        del records
+        self.assertEqual(os.listdir(self.tmp_dir), ['test.rsi'])
+        index = RevocationIndex(self.path)
+        self.addCleanup(index.close)
+        self.assertEqual(index.get(997), expected[-1])
+
+    def test_empty(self):
+        write_index(self.path, [])
+        self.assertIsNone(RevocationIndex(self.path).get(1))
+
+    def test_replace(self):
+        write_index(self.path, self.records(1))
+        index = RevocationIndex(self.path)
+        self.addCleanup(index.close)
+        self.assertIsNotNone(index.get(1))
+        write_index(self.path, self.records(2))
+        self.assertIsNone(index.get(1))
+        self.assertIsNotNone(index.get(2))
+        os.unlink(self.path)
+        with self.assertRaises(FileNotFoundError):
+            index.get(2)
+
+    def test_write_error(self):
+        write_index(self.path, self.records(1))
+        with self.assertRaises(RevocationIndexError):
+            write_index(self.path, self.records(1, 1 << 160))
+        self.assertEqual(os.listdir(self.tmp_dir), ['test.rsi'])
+        self.assertIsNotNone(revocation_index.lookup(self.path, 1))
+
+    def test_bad_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not an index file')
+        with self.assertRaises(RevocationIndexError):
+            RevocationIndex(self.path).get(1)
@@ -0,0 +1,115 @@
+import datetime
+import json
+import unittest
+
+from cryptography import x509
+from django.test import override_settings
+from django.urls import reverse
+
+from django_pkiman import models
+from django_pkiman.tests.test_models import PKIStoreTestCase
+from django_pkiman.tests.utils import as_upload, make_crl, make_crt
+from django_pkiman.utils import revocation_status
+from django_pkiman.utils.bloom import BloomFilter
+from django_pkiman.utils.pki_parser import read_x509
+from django_pkiman.utils.revocation_index import pack_serial, remove_index
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_membership(self):
+        keys = [pack_serial(serial) for serial in range(0, 20000, 2)]
+        bloom = BloomFilter.from_keys(keys, error_rate=0.01)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(pack_serial(serial) in bloom for serial in range(1, 20000, 2))
+        self.assertLess(false_positives, 300)
+
+    def test_empty(self):
+        self.assertNotIn(pack_serial(1), BloomFilter.from_keys([]))
+
+
+@override_settings(PKIMAN_STATUS_API_TOKENS=['test-token'])
+class TestRevocationStatusView(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test CA', ca=True)
+        cls.crl = make_crl(cls.ca, cls.ca_key, revoked=[(1001, x509.ReasonFlags.key_compromise), 1002])
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ca_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(cls.ca)))
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crl_obj, _ = models.Crl.objects.get_from_pki(read_x509(as_upload(self.crl)))
+        revocation_status.clear()
+        revocation_status.stats.clear()
+        self.addCleanup(revocation_status.clear)
+
+    def post(self, items, **headers):
+        headers.setdefault('HTTP_AUTHORIZATION', 'Bearer test-token')
+        return self.client.post(reverse('pkiman:status'), json.dumps({'items': items}),
+                                content_type='application/json', **headers)
+
+    def test_status(self):
+        issuer = self.ca_obj.subject_identifier
+        response = self.post([{'issuer': issuer, 'serial': 1001},
+                              {'issuer': issuer.upper(), 'serial': '1003'},
+                              {'issuer': issuer, 'serial': hex(1002)},
+                              {'issuer': 'ff' * 20, 'serial': 1}])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['revoked', 'good', 'revoked', 'unknown'])
+        self.assertEqual(results[0]['reason'], 'key_compromise')
+        self.assertIsNone(results[2]['reason'])
+        self.assertEqual(results[2]['serial'], '1002')
+        self.assertEqual(response.json()['stats']['count'], 4)
+
+        stats = self.client.get(reverse('pkiman:status'), HTTP_AUTHORIZATION='Bearer test-token').json()['stats']
+        self.assertEqual((stats['requests'], stats['items'], stats['filter_builds']), (1, 4, 1))
+        self.assertEqual(stats['index_lookups'] + stats['bloom_negatives'], 3)
+
+    def test_revoked_serials_changed(self):
+        issuer = self.ca_obj.subject_identifier
+        self.post([{'issuer': issuer, 'serial': 1001}])
+
+        def load(crl_number, revoked):
+            crl = make_crl(self.ca, self.ca_key, revoked=revoked, crl_number=crl_number,
+                           last_update=datetime.datetime.utcnow() + datetime.timedelta(minutes=crl_number))
+            with self.captureOnCommitCallbacks(execute=True):
+                models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))
+            results = self.post([{'issuer': issuer, 'serial': serial} for serial in (1001, 1003)]).json()['results']
+            return [result['status'] for result in results]
+
+        # добавленные номера вносятся в фильтр без перестроения
+        self.assertEqual(load(2, [1001, 1002, 1003]), ['revoked', 'revoked'])
+        self.assertEqual(revocation_status.stats.filter_builds, 1)
+        # удаленные номера - перестроение фильтра
+        self.assertEqual(load(3, [1003]), ['good', 'revoked'])
+        self.assertEqual(revocation_status.stats.filter_builds, 2)
+
+    def test_status_without_index(self):
+        remove_index(self.crl_obj.index_path())
+        issuer = self.ca_obj.subject_identifier
+        results = self.post([{'issuer': issuer, 'serial': 1001}, {'issuer': issuer, 'serial': 1003}]).json()['results']
+        self.assertEqual([result['status'] for result in results], ['revoked', 'good'])
+
+    def test_bad_request(self):
+        for body in ('not json', json.dumps({'items': [{'issuer': 'aa'}]}),
+                     json.dumps({'items': [{'issuer': 'aa', 'serial': 'x'}]})):
+            response = self.client.post(reverse('pkiman:status'), body, content_type='application/json',
+                                        HTTP_AUTHORIZATION='Bearer test-token')
+            self.assertEqual(response.status_code, 400)
+
+    def test_access(self):
+        items = [{'issuer': self.ca_obj.subject_identifier, 'serial': 1001}]
+        for headers in ({'HTTP_AUTHORIZATION': ''}, {'HTTP_AUTHORIZATION': 'Bearer wrong-token'},
+                        {'HTTP_AUTHORIZATION': 'Basic test-token'}):
+            self.assertEqual(self.post(items, **headers).status_code, 403)
+        self.assertEqual(self.client.get(reverse('pkiman:status')).status_code, 403)
+        # доступ по адресу клиента без токена
+        with override_settings(PKIMAN_STATUS_ALLOWED_IPS=['127.0.0.0/8']):
+            self.assertEqual(self.post(items, HTTP_AUTHORIZATION='').status_code, 200)
+        with override_settings(PKIMAN_STATUS_ALLOWED_IPS=['10.0.0.1']):
+            self.assertEqual(self.post(items, HTTP_AUTHORIZATION='').status_code, 403)
@@ -0,0 +1,136 @@
+import datetime
+import io
+import os
+import signal
+import threading
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from django_pkiman import models
+from django_pkiman.tests.test_models import PKIStoreTestCase
+from django_pkiman.tests.utils import as_upload, make_crl, make_crt
+from django_pkiman.utils.pki_parser import read_x509
+from django_pkiman.utils.scheduler import RefreshScheduler, plan_next_check
+
+HOUR = datetime.timedelta(hours=1)
+
+
+class TestScheduler(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pki = []
+        for num in range(3):
+            ca, ca_key = make_crt(f'Test schedule CA {num}', ca=True)
+            cls.pki.append((ca, make_crl(ca, ca_key)))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schedule = models.CrlUpdateSchedule.objects.create(name='always', dow=[], std=datetime.time(0),
+                                                               etd=datetime.time(23, 59, 59))
+        cls.crl_list = []
+        for num, (ca, crl) in enumerate(cls.pki):
+            models.Crt.objects.get_from_pki(read_x509(as_upload(ca)))
+            crl_obj, _ = models.Crl.objects.get_from_pki(read_x509(as_upload(crl)))
+            crl_obj.urls = f'http://cdp.test/{num}.crl'
+            crl_obj.active = True
+            crl_obj.schedule = cls.schedule
+            crl_obj.save()
+            cls.crl_list.append(crl_obj)
+
+    @override_settings(PKIMAN_REFRESH_JITTER=0)
+    def test_plan(self):
+        now = timezone.now()
+        crl = models.Crl(last_update=now - HOUR, next_update=now + 7 * 24 * HOUR)
+        self.assertEqual(plan_next_check(crl, now), now + 24 * HOUR)
+        crl.next_update = now + 3 * HOUR
+        self.assertEqual(plan_next_check(crl, now), now + 2 * HOUR)
+        # новая версия ожидается по интервалу публикации
+        crl.publish_interval = 1.5 * HOUR
+        self.assertEqual(plan_next_check(crl, now), now + HOUR / 2)
+        crl.publish_interval = HOUR / 2
+        self.assertEqual(plan_next_check(crl, now), now + datetime.timedelta(seconds=900))
+        self.assertEqual(plan_next_check(crl, now, failed=True), now + datetime.timedelta(seconds=900))
+
+    def test_plan_jitter(self):
+        now = timezone.now()
+        crl = models.Crl(last_update=now - HOUR, next_update=now + 11 * HOUR)
+        checks = {plan_next_check(crl, now) for _ in range(20)}
+        self.assertGreater(len(checks), 1)
+        for next_check in checks:
+            self.assertTrue(now + 9 * HOUR <= next_check <= now + 10 * HOUR)
+
+    def test_get_tasks(self):
+        monday = timezone.make_aware(datetime.datetime(2024, 1, 1, 23, 30))
+        models.CrlUpdateSchedule.objects.filter(pk=self.schedule.pk).update(is_active=False)
+        night = models.CrlUpdateSchedule.objects.create(name='night', dow=[1], std=datetime.time(22),
+                                                        etd=datetime.time(6))
+        day = models.CrlUpdateSchedule.objects.create(name='day', dow=[], std=datetime.time(9),
+                                                      etd=datetime.time(18))
+        self.assertEqual(list(models.CrlUpdateSchedule.objects.get_tasks(monday)), [night])
+        self.assertEqual(list(models.CrlUpdateSchedule.objects.get_tasks(monday + HOUR)), [])
+        self.assertEqual(list(models.CrlUpdateSchedule.objects.get_tasks(monday + 10 * HOUR)), [day])
+        # расписание ограничивает обновление временным диапазоном
+        crl = self.crl_list[0]
+        crl.schedule = day
+        crl.save()
+        self.assertNotIn(crl, models.Crl.objects.scheduled(monday))
+        self.assertIn(crl, models.Crl.objects.scheduled(monday + 10 * HOUR))
+        # без расписания список отзыва планировщиком не обновляется
+        crl.schedule = None
+        crl.save()
+        self.assertNotIn(crl, models.Crl.objects.scheduled(monday + 10 * HOUR))
+
+    def test_due(self):
+        now = timezone.now()
+        first, second, third = self.crl_list
+        models.Crl.objects.filter(pk=first.pk).update(next_check=now - HOUR)
+        models.Crl.objects.filter(pk=second.pk).update(next_check=now + HOUR)
+        self.assertEqual(set(models.Crl.objects.due(now)), {first, third})
+        models.Crl.objects.filter(pk=third.pk).update(schedule=None)
+        self.assertEqual(set(models.Crl.objects.due(now)), {first})
+
+    def test_refresh_scheduler(self):
+        now = timezone.now()
+        first, second, third = self.crl_list
+        for crl, delay in ((first, 2 * HOUR), (second, -HOUR), (third, -2 * HOUR)):
+            models.Crl.objects.filter(pk=crl.pk).update(next_check=now + delay)
+        refreshed = []
+
+        def refresh(crl_list):
+            refreshed.append({crl.pk for crl in crl_list})
+            models.Crl.objects.filter(pk__in=[crl.pk for crl in crl_list]).update(next_check=now + 3 * HOUR)
+
+        scheduler = RefreshScheduler(refresh)
+        scheduler.load(now)
+        self.assertEqual(scheduler.next_time(), now - 2 * HOUR)
+        scheduler.run_pending(now)
+        self.assertEqual(refreshed, [{second.pk, third.pk}])
+        self.assertEqual(scheduler.next_time(), now + 2 * HOUR)
+        self.assertIsNone(scheduler.run_pending(now + HOUR))
+        scheduler.run_pending(now + 2 * HOUR)
+        self.assertEqual(refreshed[-1], {first.pk})
+        self.assertEqual(len(scheduler), 3)
+
+    def test_command(self):
+        models.Crl.objects.update(next_check=timezone.now() + HOUR)
+        stdout = io.StringIO()
+        call_command('pkiman_refresh', stdout=stdout)
+        self.assertIn('Нет списков отзыва для обновления', stdout.getvalue())
+
+    def test_command_sigterm(self):
+        started = threading.Event()
+
+        def run(scheduler, stop):
+            started.set()
+            os.kill(os.getpid(), signal.SIGTERM)
+            self.assertTrue(stop.wait(5))
+
+        previous = signal.getsignal(signal.SIGTERM)
+        with mock.patch.object(RefreshScheduler, 'run', run):
+            call_command('pkiman_refresh', loop=True, stdout=io.StringIO())
+        self.assertTrue(started.is_set())
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous)
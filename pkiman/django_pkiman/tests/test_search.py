@@ -0,0 +1,114 @@
+import io
+import unittest
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+
+from django_pkiman import models
+from django_pkiman.tests.test_models import PKIStoreTestCase
+from django_pkiman.tests.utils import as_upload, make_crl, make_crt
+from django_pkiman.utils import search
+from django_pkiman.utils.pki_parser import parse_x509, read_x509
+
+
+class TestQueryTokens(unittest.TestCase):
+
+    def test_hex(self):
+        self.assertEqual(search.query_tokens('AB:cd:01 0x1F2e'), ['ABcd01', '1F2e'])
+        self.assertEqual(search.query_tokens('ab cd'), ['ab', 'cd'])
+        self.assertEqual(search.query_tokens('ab cd ef 01'), ['abcdef01'])
+
+    def test_words(self):
+        self.assertEqual(search.query_tokens('Иванов, user_01@pki.test'), ['Иванов', 'user', '01', 'pki', 'test'])
+        self.assertEqual(search.match_expression(['a"b', 'c']), '"a""b"* AND "c"*')
+        self.assertEqual(search.match_expression(['иванов', 'ив', 'петр']), '"иванов" AND "ив"* AND "петр"*')
+        self.assertEqual(search.match_expression(['иванов', 'петр'], prefix=False), '"иванов" AND "петр"')
+
+
+class TestSearch(PKIStoreTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ca, cls.ca_key = make_crt('Test Удостоверяющий центр', ca=True)
+        cls.crt, _ = make_crt('Test user Иванов', issuer_crt=cls.ca, issuer_key=cls.ca_key, serial=0x1A2B3C)
+        cls.other_list = [make_crt(f'Test other {num}', issuer_crt=cls.ca, issuer_key=cls.ca_key)[0]
+                          for num in range(3)]
+        cls.crl = make_crl(cls.ca, cls.ca_key, crl_number=77)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ca_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(cls.ca)))
+        cls.crt_obj, _ = models.Crt.objects.get_from_pki(read_x509(as_upload(cls.crt)))
+        cls.crl_obj, _ = models.Crl.objects.get_from_pki(read_x509(as_upload(cls.crl)))
+        pki_list = [parse_x509(crt) for crt in cls.other_list]
+        for pki, crt in zip(pki_list, cls.other_list):
+            pki.up_file = as_upload(crt)
+        cls.other_objects, _ = models.Crt.objects.bulk_create_from_pki(pki_list)
+
+    def find(self, text, kind=search.KIND_CRT):
+        model = models.Crt if kind == search.KIND_CRT else models.Crl
+        return set(search.search_queryset(model.objects.all(), kind, text).values_list('pk', flat=True))
+
+    def test_available(self):
+        self.assertTrue(search.is_available())
+
+    def test_crt(self):
+        self.assertEqual(self.find('иван'), {self.crt_obj.pk})
+        self.assertEqual(self.find('удостоверяющий цент'), {self.ca_obj.pk})
+        self.assertEqual(self.find('test user'), {self.crt_obj.pk})
+        self.assertEqual(self.find(str(0x1A2B3C)), {self.crt_obj.pk})
+        self.assertEqual(self.find('0x1a2b3c'), {self.crt_obj.pk})
+        self.assertEqual(self.find(':'.join(self.crt_obj.subject_identifier[num:num + 2].upper()
+                                            for num in range(0, 8, 2))), {self.crt_obj.pk})
+        self.assertEqual(self.find(self.crt_obj.fingerprint_sha256[:12]), {self.crt_obj.pk})
+        self.assertEqual(self.find('test other'), {obj.pk for obj in self.other_objects})
+        self.assertEqual(self.find('missing'), set())
+        self.assertEqual(self.find('  '), set())
+
+    def test_crl(self):
+        self.assertEqual(self.find('центр', search.KIND_CRL), {self.crl_obj.pk})
+        self.assertEqual(self.find('77', search.KIND_CRL), {self.crl_obj.pk})
+        self.assertEqual(self.find('иванов', search.KIND_CRL), set())
+
+    def test_delete(self):
+        self.crt_obj.delete()
+        self.assertEqual(self.find('иванов'), set())
+        self.crl_obj.delete()
+        self.assertEqual(self.find('центр', search.KIND_CRL), set())
+
+    def test_fallback(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            self.assertEqual(self.find('test other'), {obj.pk for obj in self.other_objects})
+            self.assertEqual(self.find('0x1a2b3c'), {self.crt_obj.pk})
+            self.assertEqual(self.find(self.crt_obj.fingerprint[:10]), {self.crt_obj.pk})
+            self.assertEqual(self.find('77', search.KIND_CRL), {self.crl_obj.pk})
+
+    def test_rebuild(self):
+        search.drop_index(connection)
+        self.assertFalse(search.is_available())
+        stdout = io.StringIO()
+        call_command('pkiman_search_index', stdout=stdout)
+        self.assertIn('Проиндексировано объектов: 6', stdout.getvalue())
+        self.assertEqual(self.find('иванов'), {self.crt_obj.pk})
+
+    def test_view(self):
+        response = self.client.get(reverse('pkiman:index'), {'pki': 'crt', 'q': 'иванов'})
+        self.assertEqual([item.pk for item in response.context['object_list']], [self.crt_obj.pk])
+        response = self.client.get(reverse('pkiman:index'), {'pki': 'crl', 'q': 'missing'})
+        self.assertContains(response, 'Ничего не найдено')
+
+    @override_settings(PKIMAN_REESTR_PAGE_SIZE=2)
+    def test_view_pages(self):
+        # постраничный вывод по всем найденным объектам
+        found, params = [], {'pki': 'crt', 'q': 'test'}
+        while True:
+            page = self.client.get(reverse('pkiman:index'), params).context['page']
+            found.extend(item.pk for item in page)
+            if not page.has_next:
+                break
+            params['after'] = page.next_cursor
+        self.assertEqual(found, list(models.Crt.objects.order_by('path').values_list('pk', flat=True)))
+        self.assertEqual(len(found), 5)
@@ -0,0 +1,83 @@
+import datetime
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+CRT_CONTENT_TYPE = 'application/x-x509-ca-cert'
+CRL_CONTENT_TYPE = 'application/pkix-crl'
+
+
+def make_key():
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+def make_name(cn: str) -> x509.Name:
+    return x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, 'RU'),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, 'PKIMAN TEST'),
+        x509.NameAttribute(NameOID.COMMON_NAME, cn),
+    ])
+
+
+def make_crt(cn: str, key=None, issuer_crt=None, issuer_key=None, ca=False, serial=None, days=365,
+             cdp_urls=None, aia_urls=None):
+    """Выпуск тестового сертификата. Без издателя выпускается самоподписанный корневой"""
+    key = key or make_key()
+    now = datetime.datetime.utcnow()
+    subject = make_name(cn)
+    issuer_name = issuer_crt.subject if issuer_crt else subject
+    signing_key = issuer_key or key
+    authority_key = issuer_crt.public_key() if issuer_crt else key.public_key()
+    builder = (x509.CertificateBuilder()
+               .subject_name(subject)
+               .issuer_name(issuer_name)
+               .public_key(key.public_key())
+               .serial_number(serial or x509.random_serial_number())
+               .not_valid_before(now - datetime.timedelta(days=1))
+               .not_valid_after(now + datetime.timedelta(days=days))
+               .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+               .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+               .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(authority_key), critical=False))
+    if cdp_urls:
+        builder = builder.add_extension(x509.CRLDistributionPoints([
+            x509.DistributionPoint([x509.UniformResourceIdentifier(url) for url in cdp_urls], None, None, None)
+        ]), critical=False)
+    if aia_urls:
+        builder = builder.add_extension(x509.AuthorityInformationAccess([
+            x509.AccessDescription(x509.AuthorityInformationAccessOID.CA_ISSUERS, x509.UniformResourceIdentifier(url))
+            for url in aia_urls
+        ]), critical=False)
+    return builder.sign(signing_key, hashes.SHA256()), key
+
+
+def make_crl(issuer_crt, issuer_key, revoked=(), crl_number=1, last_update=None, days=7, revocation_date=None):
+    """Выпуск тестового списка отзыва. revoked - список серийных номеров или пар (серийный номер, причина)"""
+    last_update = last_update or datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+    revocation_date = revocation_date or last_update - datetime.timedelta(days=1)
+    builder = (x509.CertificateRevocationListBuilder()
+               .issuer_name(issuer_crt.subject)
+               .last_update(last_update)
+               .next_update(last_update + datetime.timedelta(days=days))
+               .add_extension(x509.CRLNumber(crl_number), critical=False)
+               .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(issuer_crt.public_key()),
+                              critical=False))
+    for item in revoked:
+        serial, reason = item if isinstance(item, tuple) else (item, None)
+        revoked_builder = (x509.RevokedCertificateBuilder()
+                           .serial_number(serial)
+                           .revocation_date(revocation_date))
+        if reason:
+            revoked_builder = revoked_builder.add_extension(x509.CRLReason(reason), critical=False)
+        builder = builder.add_revoked_certificate(revoked_builder.build())
+    return builder.sign(issuer_key, hashes.SHA256())
+
+
+def as_upload(obj, name: str = None, pem: bool = False) -> SimpleUploadedFile:
+    """Обертка x509 объекта в загружаемый файл"""
+    encoding = serialization.Encoding.PEM if pem else serialization.Encoding.DER
+    if isinstance(obj, x509.CertificateRevocationList):
+        return SimpleUploadedFile(name or 'test.crl', obj.public_bytes(encoding), CRL_CONTENT_TYPE)
+    return SimpleUploadedFile(name or 'test.crt', obj.public_bytes(encoding), CRT_CONTENT_TYPE)
@@ -9,9 +9,13 @@ urlpatterns = [
     path('management/', views.ManagementView.as_view(), name='management'),
     path('reestr/', views.ManagementReestrView.as_view(), name='reestr'),
     path('crl/<str:pk>/update/', views.ManagementUpdateCrl.as_view(), name='update_crl'),
+    path('crt/<str:pk>/children/', views.CrtChildrenView.as_view(), name='crt_children'),
     path('crt/<str:pk>/parent/get/', views.ManagementGetParentCrt.as_view(), name='get_parent_crt'),
     path('uploads/', views.ManagementUploadsView.as_view(), name='uploads'),
     path('schedule/', views.ManagementScheduleView.as_view(), name='schedule'),
     path('journal/', views.ManagementJournalView.as_view(), name='journal'),
+    path('api/status/', views.RevocationStatusView.as_view(), name='status'),
+    path('ocsp/', views.OCSPView.as_view(), name='ocsp'),
+    path('ocsp/<path:data>', views.OCSPView.as_view(), name='ocsp'),
     path('docs/', views.DocsView.as_view(), name='docs'),
 ]
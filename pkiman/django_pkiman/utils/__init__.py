@@ -1,13 +1,45 @@
+import hashlib
+import json
+import mimetypes
 import re
+import unicodedata
 
 mime_content_type_map = {
     'application/pkix-cert': 'crt',
     'application/x-x509-ca-cert': 'crt',
     'application/pkix-crl': 'crl',
-    # 'application/x-pkcs7-certificates': 'p7b'
+    'application/x-pkcs7-certificates': 'p7b',
+    'application/pkcs7-mime': 'p7b',
+    'application/x-pem-file': 'pem',
+    'application/pem-certificate-chain': 'pem',
     }
-# todo add ('pem', 'p7b') after adding proper functional
-mime_content_type_extensions = extensions = ('crt', 'cer', 'crl', 'der')
+mime_content_type_extensions = extensions = ('crt', 'cer', 'crl', 'der', 'pem', 'p7b', 'p7c')
+# тип содержимого по расширению файла, если тип не передан или не известен
+mime_extension_map = {
+    'crt': 'crt',
+    'cer': 'crt',
+    'der': 'crt',
+    'crl': 'crl',
+    'pem': 'pem',
+    'p7b': 'p7b',
+    'p7c': 'p7b',
+    }
+# файлы, которые могут содержать несколько сертификатов и списков отзыва
+bundle_suffixes = ('pem', 'p7b')
+
+# регистрация типов, отсутствующих в mimetypes некоторых систем
+for _content_type, _extension in (('application/x-x509-ca-cert', '.der'),
+                                  ('application/x-pkcs7-certificates', '.p7b'),
+                                  ):
+    mimetypes.add_type(_content_type, _extension)
+
+
+def define_suffix(name: 'str|None', content_type: 'str|None') -> 'str|None':
+    """Тип содержимого файла ('crt', 'crl', 'pem', 'p7b') по mime типу или расширению имени файла"""
+    suffix = mime_content_type_map.get(content_type)
+    if suffix is None and name:
+        suffix = mime_extension_map.get(name.lower().rsplit('.', 1)[-1])
+    return suffix
 
 
 def clean_file_name(string: str) -> str:
@@ -18,3 +50,16 @@ def clean_file_name(string: str) -> str:
     string = re.sub(r'\s', space_replace, string)
 
     return string.strip()
+
+
+def canonical_dn(dn: dict) -> str:
+    """Каноническое представление DN для сравнения (RFC 5280 7.1): порядок атрибутов сохраняется,
+    значения приводятся к NFKC, без учета регистра, с удалением крайних и схлопыванием внутренних пробелов
+    """
+    return json.dumps([[name, ' '.join(unicodedata.normalize('NFKC', str(value)).casefold().split())]
+                       for name, value in dn.items()], ensure_ascii=False, separators=(',', ':'))
+
+
+def dn_hash(dn: dict) -> str:
+    """SHA-256 канонического представления DN, hex"""
+    return hashlib.sha256(canonical_dn(dn).encode()).hexdigest()
@@ -0,0 +1,43 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Фильтр Блума для байтовых ключей. Индексы битов вычисляются двойным хешированием blake2b"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _hashes(self, key: bytes) -> tuple:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, key: bytes):
+        h1, h2 = self._hashes(key)
+        for num in range(self.hash_count):
+            position = (h1 + num * h2) % self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        # отсутствующий ключ обычно отсекается на первых проверках
+        h1, h2 = self._hashes(key)
+        bits, size = self.bits, self.size
+        for num in range(self.hash_count):
+            position = (h1 + num * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @classmethod
+    def from_keys(cls, keys: list, error_rate: float = 0.001, capacity: int = None) -> 'BloomFilter':
+        """Фильтр по ключам. capacity - с запасом для последующих add, по умолчанию - по количеству ключей"""
+        bloom = cls(max(capacity or 0, len(keys)), error_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
@@ -1,26 +1,103 @@
 # Загрузка файла из сети по URL
-import itertools
+import hashlib
 import mimetypes
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import datetime
+from email.utils import parsedate_to_datetime
 from io import BytesIO
 from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
 from django.core.validators import URLValidator
 from django.db import transaction
 from django.utils import timezone
+from django.utils.http import http_date
 
-from django_pkiman.errors import PKIDuplicateError, PKIUrlConnectionError, PKIUrlContentTypeInvalid, PKIUrlError, \
-    PKIUrlInvalid
-from django_pkiman.models import Crl, CrlUpdateSchedule
+from django_pkiman.errors import PKIDuplicateError, PKIError, PKIUrlConnectionError, PKIUrlContentTypeInvalid, \
+    PKIUrlError, PKIUrlInvalid, PKIUrlSizeError
+from django_pkiman.models import Crl, JournalTypeChoices, check_raw_duplicate
 from django_pkiman.utils import mime_content_type_map
 from django_pkiman.utils.logger import logger
-from django_pkiman.utils.pki_parser import PKIObject
+from django_pkiman.utils.pki_parser import read_x509
+from django_pkiman.utils.scheduler import plan_next_check
 
 USER_AGENT = 'PKIManager/0.1'
 HEADERS = {'user-agent': USER_AGENT}
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DEFAULT_PKIMAN_DOWNLOAD_MAX_SIZE = 100 * 1024 * 1024
+DEFAULT_PKIMAN_HTTP_TIMEOUT = (5, 30)
+DEFAULT_PKIMAN_HTTP_RETRIES = 3
+DEFAULT_PKIMAN_HTTP_BACKOFF = 0.5
+DEFAULT_PKIMAN_HTTP_POOL_SIZE = 16
+# количество серверов, соединения с которыми хранятся в сессии
+POOL_HOSTS = 64
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_BACKOFF_MAX = 30
+DEFAULT_PKIMAN_UPDATE_WORKERS = 16
+DEFAULT_PKIMAN_UPDATE_HOST_CONCURRENCY = 2
+DEFAULT_PKIMAN_UPDATE_PROXY_CONCURRENCY = 8
+
+
+class SessionPool:
+    """Сессии HTTP процесса по настройкам прокси-сервера. Сессия держит соединения keep-alive к серверам
+    (PKIMAN_HTTP_POOL_SIZE на сервер) и повторяет запросы при ошибках соединения и ответах RETRY_STATUSES
+    с экспоненциальной задержкой и случайной добавкой (PKIMAN_HTTP_RETRIES, PKIMAN_HTTP_BACKOFF)
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def get(self, proxy: 'str | dict | None' = None) -> requests.Session:
+        proxy = define_proxy(proxy)
+        key = tuple(sorted(proxy.items()))
+        with self._lock:
+            if self._pid != os.getpid():
+                # процесс создан fork: соединения родительского процесса не используются
+                self._sessions, self._pid = {}, os.getpid()
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = self.make_session(proxy)
+            return session
+
+    @staticmethod
+    def make_session(proxy: dict) -> requests.Session:
+        backoff = getattr(settings, 'PKIMAN_HTTP_BACKOFF', DEFAULT_PKIMAN_HTTP_BACKOFF)
+        retry = Retry(total=getattr(settings, 'PKIMAN_HTTP_RETRIES', DEFAULT_PKIMAN_HTTP_RETRIES),
+                      backoff_factor=backoff,
+                      backoff_jitter=backoff,
+                      backoff_max=RETRY_BACKOFF_MAX,
+                      status_forcelist=RETRY_STATUSES,
+                      allowed_methods=('GET', 'HEAD'),
+                      raise_on_status=False)
+        pool_size = getattr(settings, 'PKIMAN_HTTP_POOL_SIZE', DEFAULT_PKIMAN_HTTP_POOL_SIZE)
+        adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update(HEADERS)
+        session.proxies.update(proxy)
+        return session
+
+    def clear(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+session_pool = SessionPool()
 
 
 def validate_url(url: str) -> None:
@@ -54,8 +131,11 @@ def define_proxy(proxy) -> dict:
 
 
 def get_from_url(url: str, method: str = 'get', session=None, proxy: 'str | dict | None' = None,
-                 headers=None) -> ('InMemoryUploadedFile | TemporaryUploadedFile | None', 'requests.Response | None'):
-    """"""
+                 headers=None, log: bool = True) -> ('InMemoryUploadedFile | TemporaryUploadedFile | None',
+                                                     'requests.Response | None'):
+    """Ответ 304 на условный запрос (headers If-None-Match, If-Modified-Since) возвращается без файла.
+    log - запись в журнал о загрузке файла. Потоки загрузки refresh_crls не пишут в журнал сами
+    """
     # check it
     if method not in ('get', 'head'):
         raise PKIUrlError('Неверный метод', value=method)
@@ -63,49 +143,76 @@ def get_from_url(url: str, method: str = 'get', session=None, proxy: 'str | dict
     filename, content_type = define_filename_content_type(url)
     # set
     proxy = define_proxy(proxy)
-    headers = HEADERS if not headers else headers.update(HEADERS)
-    handler = session if session else requests
+    headers = {**HEADERS, **(headers or {})}
+    handler = session if session else session_pool.get(proxy)
     handler_method = getattr(handler, method)
+    timeout = getattr(settings, 'PKIMAN_HTTP_TIMEOUT', DEFAULT_PKIMAN_HTTP_TIMEOUT)
 
     try:
-        resp: requests.Response = handler_method(url, headers=headers, proxies=proxy)
+        resp: requests.Response = handler_method(url, headers=headers, proxies=proxy, timeout=timeout, stream=True)
     except requests.exceptions.RetryError:
         raise PKIUrlConnectionError(message="Превышено допустимое количество попыток соединения с сервером", value=url)
     except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
         raise PKIUrlConnectionError(value=e)
-    else:
+
+    with resp:
+        if resp.status_code == requests.codes.not_modified:
+            # ответ на условный запрос (If-None-Match, If-Modified-Since) - файл не изменился
+            return None, resp
         if not resp.status_code == requests.codes.ok:
             raise PKIUrlConnectionError(value=f'{resp.status_code}-{resp.reason}')
-
-    if method == 'head':
-        return None, resp
-
-    content_length = int(resp.headers['content-length'])
-
-    if content_length <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
-        fobj = BytesIO()
-        fobj.write(resp.content)
-        upfile = InMemoryUploadedFile(
-                file=fobj,
-                field_name=None,
-                name=filename,
-                content_type=content_type,
-                size=content_length,
-                charset=None,
-        )
-    else:
-        upfile = TemporaryUploadedFile(
-                name=filename,
-                content_type=content_type,
-                size=content_length,
-                charset='utf-8',
-        )
-        upfile.write(resp.content)
+        if method == 'head':
+            return None, resp
+        upfile = stream_to_file(resp, filename, content_type)
     upfile.seek(0)
-    logger.info(f'Загружен файл {url}, size={upfile.size}, elapsed={resp.elapsed}')
+    if log:
+        logger.info(f'Загружен файл {url}, size={upfile.size}, elapsed={resp.elapsed}')
     return upfile, resp
 
 
+def stream_to_file(resp: 'requests.Response', filename: str, content_type: str,
+                   max_size: int = None) -> 'InMemoryUploadedFile | TemporaryUploadedFile':
+    """Запись тела ответа в файл частями по мере получения. Файл держится в памяти до
+    FILE_UPLOAD_MAX_MEMORY_SIZE, затем переносится во временный файл на диске. Размер ограничен max_size
+    (PKIMAN_DOWNLOAD_MAX_SIZE) независимо от заголовка content-length, который может отсутствовать.
+    Дайджест содержимого (raw_digest) вычисляется при записи
+    """
+    max_size = max_size or getattr(settings, 'PKIMAN_DOWNLOAD_MAX_SIZE', DEFAULT_PKIMAN_DOWNLOAD_MAX_SIZE)
+    content_length = resp.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > max_size:
+        raise PKIUrlSizeError(value=f'{content_length} > {max_size}')
+    hasher = hashlib.sha256()
+    fobj = BytesIO()
+    upfile = None
+    size = 0
+    try:
+        for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise PKIUrlSizeError(value=f'> {max_size}')
+            hasher.update(chunk)
+            if upfile is None and size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+                upfile = TemporaryUploadedFile(name=filename, content_type=content_type, size=0, charset='utf-8')
+                upfile.write(fobj.getvalue())
+                fobj = None
+            (upfile or fobj).write(chunk)
+    except requests.exceptions.RequestException as e:
+        if upfile is not None:
+            upfile.close()
+        raise PKIUrlConnectionError(value=e)
+    except PKIUrlSizeError:
+        if upfile is not None:
+            upfile.close()
+        raise
+    if upfile is None:
+        upfile = InMemoryUploadedFile(file=fobj, field_name=None, name=filename, content_type=content_type,
+                                      size=size, charset=None)
+    upfile.size = size
+    upfile.raw_digest = hasher.hexdigest()
+    upfile.seek(0)
+    return upfile
+
+
 def get_from_url_list(urls_list: list, proxy=None) -> tuple:
     """Загрузка файла из первого удачного URl по списку"""
     last_error = None
@@ -121,72 +228,211 @@ def get_from_url_list(urls_list: list, proxy=None) -> tuple:
         raise last_error
 
 
-def update_crl(crl: 'Crl'):
-    proxy = crl.get_proxy()
-    has_updates = False
+class ConnectionLimiter:
+    """Ограничение количества одновременных запросов к одному серверу и через один прокси-сервер"""
+
+    def __init__(self, per_host: int = None, per_proxy: int = None):
+        self.per_host = per_host or getattr(settings, 'PKIMAN_UPDATE_HOST_CONCURRENCY',
+                                            DEFAULT_PKIMAN_UPDATE_HOST_CONCURRENCY)
+        self.per_proxy = per_proxy or getattr(settings, 'PKIMAN_UPDATE_PROXY_CONCURRENCY',
+                                              DEFAULT_PKIMAN_UPDATE_PROXY_CONCURRENCY)
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, key: tuple, value: int) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(key)
+            if semaphore is None:
+                semaphore = self._semaphores[key] = threading.BoundedSemaphore(value)
+            return semaphore
+
+    @contextmanager
+    def __call__(self, url: str, proxy: 'str | dict | None'):
+        parts = urlsplit(url)
+        semaphores = []
+        proxy_url = define_proxy(proxy).get(parts.scheme)
+        if proxy_url:
+            semaphores.append(self._semaphore(('proxy', proxy_url), self.per_proxy))
+        semaphores.append(self._semaphore(('host', parts.netloc.lower()), self.per_host))
+        with ExitStack() as stack:
+            for semaphore in semaphores:
+                stack.enter_context(semaphore)
+            yield
+
+
+# результат сетевой части обновления: url - адрес загруженного файла (None - изменений нет или ошибка),
+# pki - разобранный файл, messages - записи журнала (уровень, текст) для записи вызывающим потоком
+CrlFetch = namedtuple('CrlFetch', ('crl', 'url', 'pki', 'etag', 'date', 'error', 'messages', 'seconds'))
+CrlRefresh = namedtuple('CrlRefresh', ('crl', 'status', 'fetch_seconds', 'store_seconds', 'error'))
+
+REFRESH_UPDATED = 'updated'
+REFRESH_SYNCED = 'synced'
+REFRESH_UNCHANGED = 'unchanged'
+REFRESH_ERROR = 'error'
+
+
+def conditional_headers(crl: 'Crl') -> dict:
+    """Заголовки условного запроса по сохраненным ETag и Last-Modified загруженного файла"""
+    headers = {}
+    if crl.f_etag:
+        headers['If-None-Match'] = crl.f_etag
+    if crl.f_date:
+        headers['If-Modified-Since'] = http_date(crl.f_date.timestamp())
+    return headers
+
+
+def last_modified(resp: 'requests.Response') -> 'datetime | None':
+    value = resp.headers.get('last-modified')
+    if value:
+        try:
+            return parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+
+def fetch_crl(crl: 'Crl', proxy: 'str | None' = None, limit=None) -> CrlFetch:
+    """Загрузка файла списка отзыва условным запросом GET по первому доступному URL.
+    Ответ 304 - файл не изменился (url задан, pki - None).
+    Не обращается к БД и не пишет в журнал: может выполняться в потоке пула. proxy - адрес прокси-сервера
+    (crl.get_proxy()), limit - ConnectionLimiter. Запросы выполняются сессией session_pool прокси-сервера
+    """
+    started = time.monotonic()
+    messages = []
     last_error = None
-    with requests.Session() as session:
-        for url in crl.get_urls_list():
-            try:
-                # check updates on site by etag or size header
-                _, resp = get_from_url(url, 'head', session, proxy)
-                r_etag = resp.headers.get('etag')
-                r_date = timezone.datetime.strptime(resp.headers.get('date'), '%a, %d %b %Y %H:%M:%S %Z')
-                if r_etag and r_etag != crl.f_etag:
-                    has_updates = True
-                elif r_date and r_date != crl.f_date:
-                    has_updates = True
-
-                if has_updates:
-                    # get updated file
-                    try:
-                        up_file, _ = get_from_url(url, proxy=proxy, session=session)
-                        pki = PKIObject()
-                        pki.read_x509(up_file)
-
-                        with transaction.atomic():
-                            crl, _ = crl.__class__.objects.get_from_pki(pki)
-                            crl.f_etag = r_etag
-                            crl.f_date = r_date
-                            crl.f_sync = timezone.now()
-                            crl.save()
-
-                        if last_error:
-                            last_error = None
-                        break
-                    except PKIUrlConnectionError as e:
-                        logger.error(f'update_crl::get url:{url} {e}')
-                        last_error = e
-                        continue
-
-            except PKIUrlConnectionError as e:
-                logger.error(f'update_crl::head url:{url} {e}')
-                last_error = e
-                continue
+    for url in crl.get_urls_list() or []:
+        try:
+            with limit(url, proxy) if limit else nullcontext():
+                up_file, resp = get_from_url(url, proxy=proxy, headers=conditional_headers(crl), log=False)
+            pki = read_x509(up_file) if up_file else None
+        except (PKIError, ValueError) as e:
+            messages.append((JournalTypeChoices.ERROR, f'update_crl::get url:{url} {e}'))
+            last_error = e
+            continue
+        if up_file:
+            messages.append((JournalTypeChoices.INFO,
+                             f'Загружен файл {url}, size={up_file.size}, elapsed={resp.elapsed}'))
+        return CrlFetch(crl, url, pki, resp.headers.get('etag'), last_modified(resp), None, messages,
+                        time.monotonic() - started)
+    return CrlFetch(crl, None, None, None, None, last_error, messages, time.monotonic() - started)
 
-    if last_error:
-        raise last_error
 
+def store_crl(fetched: CrlFetch) -> ('Crl', str):
+    """Запись результата fetch_crl в БД. Возвращает список отзыва и статус REFRESH_*.
+    Ошибка загрузки пробрасывается
+    """
+    for level, message in fetched.messages:
+        logger.emit(level=level, message=message)
+    crl = fetched.crl
+    if fetched.error:
+        raise fetched.error
+    if fetched.pki is None:
+        # 304 или нет URL - отмечаются время синхронизации и следующей проверки
+        if fetched.url:
+            crl.f_sync = timezone.now()
+        crl.next_check = plan_next_check(crl)
+        crl.__class__.objects.filter(pk=crl.pk).update(f_sync=crl.f_sync, next_check=crl.next_check)
+        return crl, REFRESH_UNCHANGED
+    pki = fetched.pki
+    try:
+        check_raw_duplicate(pki.pki_type, pki.raw_digest)
+    except PKIDuplicateError:
+        # содержимое файла не изменилось - разбор не требуется
+        pki = None
+    with transaction.atomic():
+        # файл с тем же отпечатком не разбирается get_from_pki - обновляются только данные синхронизации
+        status = REFRESH_SYNCED
+        if pki is not None and pki.fingerprint != crl.fingerprint:
+            previous_update = crl.last_update
+            crl, _ = crl.__class__.objects.get_from_pki(pki)
+            if crl.last_update > previous_update:
+                crl.publish_interval = crl.last_update - previous_update
+            status = REFRESH_UPDATED
+        # без валидаторов в ответе следующий запрос будет безусловным
+        crl.f_etag = fetched.etag
+        crl.f_date = fetched.date
+        crl.f_sync = timezone.now()
+        crl.next_check = plan_next_check(crl)
+        crl.save()
+    return crl, status
+
+
+def update_crl(crl: 'Crl'):
+    crl, _ = store_crl(fetch_crl(crl, crl.get_proxy()))
     return crl
 
 
+class RefreshSummary:
+    """Итоги обновления списков отзыва: количество по статусам, общее время и задержка по спискам"""
+
+    def __init__(self, results: list, seconds: float):
+        self.results = results
+        self.seconds = seconds
+        self.counts = {status: 0 for status in (REFRESH_UPDATED, REFRESH_SYNCED, REFRESH_UNCHANGED, REFRESH_ERROR)}
+        for result in results:
+            self.counts[result.status] += 1
+
+    def latency(self) -> dict:
+        """Квантили времени обработки списка отзыва (загрузка и запись), секунды"""
+        values = sorted(result.fetch_seconds + result.store_seconds for result in self.results)
+        if not values:
+            return {}
+        return {'p50': values[len(values) // 2],
+                'p95': values[min(int(len(values) * 0.95), len(values) - 1)],
+                'max': values[-1]}
+
+    def slowest(self, count: int = 5) -> list:
+        return sorted(self.results, key=lambda result: result.fetch_seconds + result.store_seconds,
+                      reverse=True)[:count]
+
+    def __str__(self):
+        latency = ', '.join(f'{name} {value:.2f} с' for name, value in self.latency().items())
+        return (f'Обновление списков отзыва: всего {len(self.results)}, обновлено {self.counts[REFRESH_UPDATED]}, '
+                f'синхронизировано {self.counts[REFRESH_SYNCED]}, без изменений {self.counts[REFRESH_UNCHANGED]}, '
+                f'ошибок {self.counts[REFRESH_ERROR]} за {self.seconds:.1f} с. '
+                f'Время по спискам: {latency or "-"}')
+
+
+def refresh_crls(crl_list, workers: int = None, limit: ConnectionLimiter = None) -> RefreshSummary:
+    """Обновление списков отзыва: загрузка в пуле из workers потоков (PKIMAN_UPDATE_WORKERS) с ограничением
+    соединений к серверу и через прокси (ConnectionLimiter), запись в БД и журнал - только вызывающим потоком
+    по мере завершения загрузок
+    """
+    started = time.monotonic()
+    workers = workers or getattr(settings, 'PKIMAN_UPDATE_WORKERS', DEFAULT_PKIMAN_UPDATE_WORKERS)
+    limit = limit or ConnectionLimiter()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pkiman-crl') as executor:
+        # адрес прокси-сервера и наименование читаются из БД до передачи в пул
+        futures = {executor.submit(fetch_crl, crl, crl.get_proxy(), limit): (crl, str(crl)) for crl in crl_list}
+        for future in as_completed(futures):
+            # завершенная загрузка удаляется из словаря: разобранный файл не удерживается до конца обновления
+            crl, name = futures.pop(future)
+            store_started = time.monotonic()
+            fetch_seconds = 0.0
+            try:
+                fetched = future.result()
+                fetch_seconds = fetched.seconds
+                crl, status = store_crl(fetched)
+                error = None
+                logger.info(f'Cron update crl: <{name}>, {status}')
+            except Exception as e:
+                status, error = REFRESH_ERROR, e
+                logger.error(message=f'Cron update crl <{name}>, {e}')
+                crl.next_check = plan_next_check(crl, failed=True)
+                Crl.objects.filter(pk=crl.pk).update(next_check=crl.next_check)
+            fetched = future = None
+            results.append(CrlRefresh(crl, status, fetch_seconds, time.monotonic() - store_started, error))
+    summary = RefreshSummary(results, time.monotonic() - started)
+    if results:
+        logger.info(str(summary))
+    return summary
+
+
 def update_handle():
-    """Обработчик задачи обновления файлов CRL. Запускается crontab'ом по заданным настройкам в settings"""
-    task_qs = CrlUpdateSchedule.objects.get_tasks()
-    if not task_qs.exists():
+    """Обработчик задачи обновления файлов CRL. Запускается crontab'ом по заданным настройкам в settings.
+    Обновляются списки отзыва, время проверки которых наступило (plan_next_check)
+    """
+    crl_list = list(Crl.objects.due().select_related('issuer', 'proxy'))
+    if not crl_list:
         return
-    msg = f'Cron update crl: <{0}>, {1}'
-    for crl in itertools.chain(*[task.crl_list.all() for task in task_qs.all()]):
-        try:
-            up_file = update_crl(crl)
-            if not up_file:
-                continue
-            #
-            pki = PKIObject()
-            pki.read_x509(up_file)
-            object, _ = Crl.objects.get_from_pki(pki, up_file)
-            logger.info(msg.format(crl, 'success'))
-        except PKIDuplicateError as e:
-            logger.warn(message=f'Cron update crl <{crl}>, {e}')
-        except Exception as e:
-            logger.error(message=f'Cron update crl <{crl}>, {e}')
+    return refresh_crls(crl_list)
@@ -0,0 +1,48 @@
+from operator import attrgetter
+
+from django.conf import settings
+
+DEFAULT_PKIMAN_REESTR_PAGE_SIZE = 50
+
+
+class KeysetPage:
+    """Страница выборки по уникальному ключу сортировки (keyset).
+    Следующая страница - записи с ключом больше последнего ключа текущей (after), предыдущая - меньше первого
+    (before). Выборка страницы - один запрос по индексу ключа без OFFSET и COUNT, стоимость не зависит от
+    положения страницы и размера таблицы
+    """
+
+    def __init__(self, queryset, key: str, after: str = None, before: str = None, size: int = None):
+        self.key = key
+        self.size = size or getattr(settings, 'PKIMAN_REESTR_PAGE_SIZE', DEFAULT_PKIMAN_REESTR_PAGE_SIZE)
+        if before:
+            items = list(queryset.filter(**{f'{key}__lt': before}).order_by(f'-{key}')[:self.size + 1])
+            self.has_previous = len(items) > self.size
+            self.has_next = True
+            self.object_list = items[:self.size][::-1]
+        else:
+            if after:
+                queryset = queryset.filter(**{f'{key}__gt': after})
+            items = list(queryset.order_by(key)[:self.size + 1])
+            self.has_previous = bool(after)
+            self.has_next = len(items) > self.size
+            self.object_list = items[:self.size]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _cursor(self, item) -> str:
+        return attrgetter(self.key.replace('__', '.'))(item)
+
+    @property
+    def next_cursor(self) -> 'str|None':
+        if self.has_next and self.object_list:
+            return self._cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self) -> 'str|None':
+        if self.has_previous and self.object_list:
+            return self._cursor(self.object_list[0])
@@ -1,14 +1,100 @@
+import atexit
+import os
+import threading
+import time
+from collections import namedtuple
+
 from django.conf import settings
-from django.db import transaction
+from django.db import close_old_connections, transaction
 from django.utils import timezone
 
 from django_pkiman.models import Journal, JournalTypeChoices
 
 DEFAULT_PKIMAN_JOURNAL_STORE_PERIOD = 365
+DEFAULT_PKIMAN_JOURNAL_SYNC = False
+DEFAULT_PKIMAN_JOURNAL_BUFFER_SIZE = 100
+DEFAULT_PKIMAN_JOURNAL_FLUSH_INTERVAL = 1.0
+DEFAULT_PKIMAN_JOURNAL_CLEAN_CHUNK_SIZE = 1000
+DEFAULT_PKIMAN_JOURNAL_CLEAN_PAUSE = 0.05
+# предел буфера: записи, не записанные из-за ошибок, хранятся до повторной попытки; при превышении удаляются старые
+JOURNAL_MAX_PENDING = 10000
+
+CleanStats = namedtuple('CleanStats', ('deleted', 'seconds', 'per_second'))
+
+
+class JournalWriter:
+    """Буферизованная запись журнала. Записи накапливаются в памяти и записываются bulk_create фоновым потоком
+    при заполнении буфера (PKIMAN_JOURNAL_BUFFER_SIZE) или раз в PKIMAN_JOURNAL_FLUSH_INTERVAL секунд,
+    оставшиеся - при завершении процесса. Запись выполняется в отдельном соединении с БД вне транзакций
+    вызывающего кода. При PKIMAN_JOURNAL_SYNC запись синхронная, в текущей транзакции
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._event = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def write(self, level: 'JournalTypeChoices', message: str):
+        if getattr(settings, 'PKIMAN_JOURNAL_SYNC', DEFAULT_PKIMAN_JOURNAL_SYNC):
+            Journal.objects.create_record(level, message)
+            return
+        record = Journal(level=level, message=message, created_at=timezone.now())
+        buffer_size = getattr(settings, 'PKIMAN_JOURNAL_BUFFER_SIZE', DEFAULT_PKIMAN_JOURNAL_BUFFER_SIZE)
+        with self._lock:
+            if self._pid != os.getpid():
+                # процесс создан fork: буфер и поток родительского процесса не наследуются
+                self._buffer, self._thread, self._pid = [], None, os.getpid()
+            self._buffer.append(record)
+            del self._buffer[:-JOURNAL_MAX_PENDING]
+            pending = len(self._buffer)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='pkiman-journal', daemon=True)
+                self._thread.start()
+        if pending >= buffer_size:
+            self._event.set()
+
+    def flush(self) -> int:
+        """Запись накопленных записей. Возвращает количество записанных"""
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return 0
+            try:
+                Journal.objects.bulk_create(records)
+            except Exception:
+                with self._lock:
+                    self._buffer[:0] = records
+                    del self._buffer[:-JOURNAL_MAX_PENDING]
+                return 0
+            return len(records)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def _run(self):
+        while True:
+            interval = getattr(settings, 'PKIMAN_JOURNAL_FLUSH_INTERVAL', DEFAULT_PKIMAN_JOURNAL_FLUSH_INTERVAL)
+            self._event.wait(interval)
+            self._event.clear()
+            # ошибка записи не должна останавливать поток: записи остаются в буфере до следующей попытки
+            try:
+                self.flush()
+                close_old_connections()
+            except Exception:
+                pass
+
+
+journal_writer = JournalWriter()
 
 
 class PKILogger:
-    emit = Journal.objects.create_record
+    emit = journal_writer.write
 
     def __init__(self, level=JournalTypeChoices.INFO):
         self.level = level
@@ -22,17 +108,39 @@ class PKILogger:
     def error(self, message: str):
         self.emit(level=JournalTypeChoices.ERROR, message=message)
 
+    def flush(self):
+        journal_writer.flush()
+
 
 logger = PKILogger()
 
 
-@transaction.atomic
-def journal_clean():
+def journal_clean(chunk_size: int = None) -> CleanStats:
+    """Удаление записей журнала старше PKIMAN_JOURNAL_STORE_PERIOD дней порциями по chunk_size записей
+    (PKIMAN_JOURNAL_CLEAN_CHUNK_SIZE) в порядке created_at по индексу. Каждая порция удаляется в отдельной
+    транзакции, между порциями БД доступна для записи журнала и других операций
+    """
     period = getattr(settings, 'PKIMAN_JOURNAL_STORE_PERIOD', DEFAULT_PKIMAN_JOURNAL_STORE_PERIOD)
-    timedelta = timezone.timedelta(days=period)
-    last_date = timezone.now() - timedelta
-    queryset = Journal.objects.filter(created_at__lt=last_date)
-    count = queryset.count()
-    if count:
-        queryset.delete()
-        logger.info(f'Очистка журнала. Удалено записей: {count} старше {period} дней')
+    chunk_size = chunk_size or getattr(settings, 'PKIMAN_JOURNAL_CLEAN_CHUNK_SIZE',
+                                       DEFAULT_PKIMAN_JOURNAL_CLEAN_CHUNK_SIZE)
+    pause = getattr(settings, 'PKIMAN_JOURNAL_CLEAN_PAUSE', DEFAULT_PKIMAN_JOURNAL_CLEAN_PAUSE)
+    last_date = timezone.now() - timezone.timedelta(days=period)
+    started = time.monotonic()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            pk_list = list(Journal.objects.filter(created_at__lt=last_date)
+                           .order_by('created_at').values_list('pk', flat=True)[:chunk_size])
+            if pk_list:
+                Journal.objects.filter(pk__in=pk_list).delete()
+        deleted += len(pk_list)
+        if len(pk_list) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    seconds = time.monotonic() - started
+    stats = CleanStats(deleted, seconds, deleted / seconds if seconds else 0.0)
+    if deleted:
+        logger.info(f'Очистка журнала. Удалено записей: {deleted} старше {period} дней '
+                    f'за {seconds:.1f} с ({stats.per_second:.0f} записей/с)')
+    return stats
@@ -0,0 +1,285 @@
+"""OCSP ответчик по данным загруженных списков отзыва (RFC 6960, профиль RFC 5019).
+
+Статус определяется по индексу отозванных сертификатов списка отзыва издателя. Ответы подписываются
+ключом ответчика из настроек и хранятся в кэше Django по издателю и номеру до next_update списка отзыва.
+При загрузке новой версии списка удаляются только ответы по добавленным, удаленным и измененным номерам
+(сигнал revoked_serials_changed), ответы по остальным номерам остаются действительными.
+Расширение nonce не поддерживается - ответы подписываются заранее и используются повторно
+"""
+import datetime
+import hashlib
+import itertools
+import threading
+import time
+from functools import lru_cache, partial
+
+from cryptography import x509
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509 import ocsp
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from django_pkiman.errors import PKIOcspResponderError
+from django_pkiman.models import Crl, RevocationReasonChoices
+from django_pkiman.utils.pki_parser import load_x509
+
+DEFAULT_PKIMAN_OCSP_ISSUER_TTL = 60
+DEFAULT_PKIMAN_OCSP_SIGN_HASH = 'SHA256'
+OCSP_CACHE_PREFIX = 'pkiman:ocsp'
+OCSP_REQUEST_CONTENT_TYPE = 'application/ocsp-request'
+OCSP_RESPONSE_CONTENT_TYPE = 'application/ocsp-response'
+# количество сертификатов-заглушек по серийным номерам (_stub_certificate) в памяти процесса
+STUB_CACHE_SIZE = 1024
+# алгоритмы хеша CertID, ответы по которым удаляются из кэша при изменении статуса номера
+OCSP_HASH_ALGORITHMS = ('sha1', 'sha224', 'sha256', 'sha384', 'sha512')
+
+REVOCATION_REASON_FLAGS = {
+    RevocationReasonChoices.UNSPECIFIED: x509.ReasonFlags.unspecified,
+    RevocationReasonChoices.KEY_COMPROMISE: x509.ReasonFlags.key_compromise,
+    RevocationReasonChoices.CA_COMPROMISE: x509.ReasonFlags.ca_compromise,
+    RevocationReasonChoices.AFFILIATION_CHANGED: x509.ReasonFlags.affiliation_changed,
+    RevocationReasonChoices.SUPERSEDED: x509.ReasonFlags.superseded,
+    RevocationReasonChoices.CESSATION_OF_OPERATION: x509.ReasonFlags.cessation_of_operation,
+    RevocationReasonChoices.CERTIFICATE_HOLD: x509.ReasonFlags.certificate_hold,
+    RevocationReasonChoices.REMOVE_FROM_CRL: x509.ReasonFlags.remove_from_crl,
+    RevocationReasonChoices.PRIVILEGE_WITHDRAWN: x509.ReasonFlags.privilege_withdrawn,
+    RevocationReasonChoices.AA_COMPROMISE: x509.ReasonFlags.aa_compromise,
+}
+
+
+def _der_children(data: bytes, start: int, end: int):
+    """Элементы DER последовательности: (тег, начало элемента, начало значения, конец элемента)"""
+    offset = start
+    while offset < end:
+        tag, length, header = data[offset], data[offset + 1], 2
+        if length & 0x80:
+            size = length & 0x7F
+            length, header = int.from_bytes(data[offset + 2:offset + 2 + size], 'big'), 2 + size
+        yield tag, offset, offset + header, offset + header + length
+        offset += header + length
+
+
+def issuer_hashes(crt: x509.Certificate, algorithm: str) -> tuple:
+    """Хеши имени и открытого ключа издателя для CertID (RFC 6960 4.1.1). Данные берутся из DER
+    tbsCertificate, открытый ключ не загружается - подходит и для ключей, не поддерживаемых cryptography
+    """
+    tbs = crt.tbs_certificate_bytes
+    (_, _, content, end), = _der_children(tbs, 0, len(tbs))
+    fields = list(_der_children(tbs, content, end))
+    if fields[0][0] == 0xA0:  # version
+        fields = fields[1:]
+    _, subject_start, _, subject_end = fields[4]
+    _, _, spki_content, spki_end = fields[5]
+    _, (_, _, key_content, key_end) = _der_children(tbs, spki_content, spki_end)
+    # первый байт BIT STRING - количество неиспользуемых бит
+    return (hashlib.new(algorithm, tbs[subject_start:subject_end]).digest(),
+            hashlib.new(algorithm, tbs[key_content + 1:key_end]).digest())
+
+
+class Responder:
+    """Ключ и сертификат ответчика, загружаются при первом обращении"""
+
+    def __init__(self):
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def get(self) -> tuple:
+        config = (getattr(settings, 'PKIMAN_OCSP_RESPONDER_CERT', None),
+                  getattr(settings, 'PKIMAN_OCSP_RESPONDER_KEY', None),
+                  getattr(settings, 'PKIMAN_OCSP_RESPONDER_KEY_PASSWORD', None))
+        with self._lock:
+            if self._loaded is None or self._loaded[0] != config:
+                cert_path, key_path, password = config
+                if not (cert_path and key_path):
+                    raise PKIOcspResponderError
+                try:
+                    with open(cert_path, 'rb') as f:
+                        crt = load_x509(f.read(), 'crt')
+                    with open(key_path, 'rb') as f:
+                        key = serialization.load_pem_private_key(f.read(),
+                                                                 password.encode() if password else None)
+                except (OSError, ValueError, TypeError) as e:
+                    raise PKIOcspResponderError(value=e)
+                self._loaded = (config, crt, key)
+            return self._loaded[1:]
+
+
+responder = Responder()
+# алгоритм хеша -> (время окончания действия, таблица хешей издателей)
+_issuers = {}
+_issuers_lock = threading.Lock()
+# перестроение таблицы выполняется одним потоком
+_rebuild_lock = threading.Lock()
+# сертификаты издателей по отпечатку, загруженные при построении таблиц
+_issuer_certs = {}
+_stub_private_key = None
+
+
+def load_issuers(algorithm: str) -> dict:
+    """Таблица хешей CertID издателей со списками отзыва: {(name_hash, key_hash): (сертификат, pk списка отзыва)}.
+    Файл сертификата издателя читается только при первом появлении его отпечатка
+    """
+    global _issuer_certs
+    certs, table = {}, {}
+    for crl in Crl.objects.select_related('issuer').only('pk', 'issuer__fingerprint', 'issuer__file'):
+        fingerprint = crl.issuer.fingerprint
+        crt = _issuer_certs.get(fingerprint)
+        if crt is None:
+            try:
+                crt = load_x509(crl.issuer.file.read(), 'crt')
+                crl.issuer.file.close()
+            except (OSError, ValueError):
+                continue
+        certs[fingerprint] = crt
+        table[issuer_hashes(crt, algorithm)] = (crt, crl.pk)
+    _issuer_certs = certs
+    return table
+
+
+def get_issuer(algorithm: str, name_hash: bytes, key_hash: bytes) -> 'tuple|None':
+    """Сертификат издателя (x509.Certificate) и pk списка отзыва по хешам CertID.
+    Таблица хешей издателей строится по БД и хранится PKIMAN_OCSP_ISSUER_TTL секунд. Устаревшая таблица
+    перестраивается одним потоком вне блокировки чтения, остальные до замены используют прежнюю
+    """
+    table = _issuers.get(algorithm)
+    if table is None or table[0] <= time.monotonic():
+        if _rebuild_lock.acquire(blocking=table is None):
+            try:
+                table = _issuers.get(algorithm)
+                if table is None or table[0] <= time.monotonic():
+                    issuers = load_issuers(algorithm)
+                    table = (time.monotonic() + getattr(settings, 'PKIMAN_OCSP_ISSUER_TTL',
+                                                        DEFAULT_PKIMAN_OCSP_ISSUER_TTL), issuers)
+                    with _issuers_lock:
+                        _issuers[algorithm] = table
+            finally:
+                _rebuild_lock.release()
+    return table[1].get((name_hash, key_hash))
+
+
+def clear():
+    global _issuer_certs
+    with _issuers_lock:
+        _issuers.clear()
+        _issuer_certs = {}
+
+
+def check_serial(serial: int):
+    """Серийный номер из запроса в допустимом RFC 5280 4.1.2.2 диапазоне, вне его номер не может быть в хранилище"""
+    if serial <= 0 or serial.bit_length() >= 160:
+        raise ValueError(f'недопустимый серийный номер {serial}')
+
+
+def _stub_key() -> ec.EllipticCurvePrivateKey:
+    global _stub_private_key
+    if _stub_private_key is None:
+        _stub_private_key = ec.generate_private_key(ec.SECP256R1())
+    return _stub_private_key
+
+
+@lru_cache(maxsize=STUB_CACHE_SIZE)
+def _stub_certificate(serial: int) -> x509.Certificate:
+    """Сертификат с серийным номером запроса для OCSPResponseBuilder.add_response версий cryptography без
+    add_response_by_hash (до 45): CertID строится по номеру сертификата и данным издателя, а сам проверяемый сертификат
+    может отсутствовать в хранилище. Сертификат подписывается временным ключом процесса и в ответ не включается
+    """
+    check_serial(serial)
+    key = _stub_key()
+    now = datetime.datetime.utcnow()
+    return (x509.CertificateBuilder()
+            .subject_name(x509.Name([]))
+            .issuer_name(x509.Name([]))
+            .public_key(key.public_key())
+            .serial_number(serial)
+            .not_valid_before(now)
+            .not_valid_after(now)
+            .sign(key, hashes.SHA256()))
+
+
+def add_response(builder: ocsp.OCSPResponseBuilder, request: ocsp.OCSPRequest, issuer: x509.Certificate,
+                 *status) -> ocsp.OCSPResponseBuilder:
+    """Ответ по CertID запроса. status - аргументы add_response от cert_status"""
+    if hasattr(builder, 'add_response_by_hash'):
+        # cryptography >= 45: хеши издателя и номер берутся из запроса без сертификата
+        return builder.add_response_by_hash(request.issuer_name_hash, request.issuer_key_hash,
+                                            request.serial_number, request.hash_algorithm, *status)
+    return builder.add_response(_stub_certificate(request.serial_number), issuer, request.hash_algorithm, *status)
+
+
+def cache_key(issuer_id: int, algorithm: str, serial: 'int|str') -> str:
+    return f'{OCSP_CACHE_PREFIX}:{issuer_id}:{algorithm}:{serial}'
+
+
+def revoked_serials_changed_handler(sender, issuer, added, removed, changed, **kwargs):
+    """Обработчик revoked_serials_changed: удаление ответов по измененным номерам после фиксации транзакции"""
+    keys = [cache_key(issuer.pk, algorithm, entry.serial)
+            for entry in itertools.chain(added, removed, changed) for algorithm in OCSP_HASH_ALGORITHMS]
+    transaction.on_commit(partial(cache.delete_many, keys))
+
+
+def unsuccessful(status: ocsp.OCSPResponseStatus) -> bytes:
+    return ocsp.OCSPResponseBuilder.build_unsuccessful(status).public_bytes(serialization.Encoding.DER)
+
+
+def build_response(request: ocsp.OCSPRequest) -> tuple:
+    """Подписанный ответ (DER) и время, до которого ответ можно кэшировать (None - не кэшировать)"""
+    algorithm = request.hash_algorithm
+    found = get_issuer(algorithm.name, request.issuer_name_hash, request.issuer_key_hash)
+    if found is None:
+        return unsuccessful(ocsp.OCSPResponseStatus.UNAUTHORIZED), None
+    issuer, crl_pk = found
+    try:
+        crl = Crl.objects.only('pk', 'issuer_id', 'file', 'fingerprint', 'last_update', 'next_update').get(pk=crl_pk)
+    except Crl.DoesNotExist:
+        return unsuccessful(ocsp.OCSPResponseStatus.UNAUTHORIZED), None
+    if not crl.is_valid():
+        return unsuccessful(ocsp.OCSPResponseStatus.TRY_LATER), None
+
+    serial = request.serial_number
+    key = cache_key(crl.issuer_id, algorithm.name, serial)
+    response = cache.get(key)
+    if response is not None:
+        return response, crl.next_update
+
+    try:
+        responder_crt, responder_key = responder.get()
+    except PKIOcspResponderError:
+        return unsuccessful(ocsp.OCSPResponseStatus.INTERNAL_ERROR), None
+    try:
+        check_serial(serial)
+    except ValueError:
+        return unsuccessful(ocsp.OCSPResponseStatus.MALFORMED_REQUEST), None
+
+    entry = crl.get_revoked(serial)
+    builder = ocsp.OCSPResponseBuilder()
+    if entry is None:
+        builder = add_response(builder, request, issuer, ocsp.OCSPCertStatus.GOOD,
+                               crl.last_update, crl.next_update, None, None)
+    else:
+        _, revocation_date, reason = entry
+        builder = add_response(builder, request, issuer, ocsp.OCSPCertStatus.REVOKED,
+                               crl.last_update, crl.next_update, revocation_date,
+                               REVOCATION_REASON_FLAGS.get(reason))
+    sign_hash = getattr(hashes, getattr(settings, 'PKIMAN_OCSP_SIGN_HASH', DEFAULT_PKIMAN_OCSP_SIGN_HASH))()
+    response = (builder
+                .responder_id(ocsp.OCSPResponderEncoding.HASH, responder_crt)
+                .certificates([responder_crt])
+                .sign(responder_key, sign_hash)
+                .public_bytes(serialization.Encoding.DER))
+    timeout = (crl.next_update - timezone.now()).total_seconds()
+    if timeout > 0:
+        cache.set(key, response, timeout)
+    return response, crl.next_update
+
+
+def respond(der: bytes) -> tuple:
+    """Ответ на DER запрос: (DER ответа, время окончания кэширования или None)"""
+    try:
+        request = ocsp.load_der_ocsp_request(der)
+        return build_response(request)
+    except (ValueError, UnsupportedAlgorithm):
+        return unsuccessful(ocsp.OCSPResponseStatus.MALFORMED_REQUEST), None
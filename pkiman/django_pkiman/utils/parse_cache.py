@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+DEFAULT_PKIMAN_PARSE_CACHE_SIZE = 256
+DEFAULT_PKIMAN_PARSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'evictions', 'currsize', 'maxsize', 'currbytes', 'maxbytes'))
+
+
+class ParseCache:
+    """LRU кэш разобранных x509 объектов по дайджесту исходных байт файла.
+    Ограничен количеством записей и суммарным размером исходных данных
+    """
+
+    def __init__(self, maxsize: int, max_bytes: int):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, digest):
+        return digest in self._data
+
+    def get(self, digest: str):
+        with self._lock:
+            try:
+                value, _ = self._data[digest]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(digest)
+            self.hits += 1
+            return value
+
+    def put(self, digest: str, value, size: int = 0):
+        """Добавление объекта. size - размер исходных данных для учета ограничения max_bytes"""
+        if self.maxsize <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if digest in self._data:
+                self._bytes -= self._data.pop(digest)[1]
+            self._data[digest] = (value, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.evictions, len(self._data), self.maxsize, self._bytes,
+                         self.max_bytes)
+
+
+parse_cache = ParseCache(
+        maxsize=getattr(settings, 'PKIMAN_PARSE_CACHE_SIZE', DEFAULT_PKIMAN_PARSE_CACHE_SIZE),
+        max_bytes=getattr(settings, 'PKIMAN_PARSE_CACHE_MAX_BYTES', DEFAULT_PKIMAN_PARSE_CACHE_MAX_BYTES),
+)
@@ -1,16 +1,27 @@
+import abc
+import hashlib
+import re
+from collections import namedtuple
+from pathlib import Path
+
 from cryptography import x509
 from cryptography.hazmat._oid import _OID_NAMES, NameOID as _NameOID
 from cryptography.hazmat.bindings._rust import (
     ObjectIdentifier as ObjectIdentifier,
     )
-from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import Encoding, pkcs7
+from cryptography.x509.oid import ExtensionOID
+from django.core.files.base import ContentFile
 from django.utils.timezone import make_aware
 
 from django_pkiman import utils
+from django_pkiman.utils.parse_cache import parse_cache
 
-# первые два байта DER кодировки
+# первые два байта DER кодировки: тег SEQUENCE и длина в короткой (до 127 байт) или длинной (1-4 байта) форме
 DER_BYTE_1 = bytes(b'\x30')
-DER_BYTE_2 = (bytes(b'\x82'), bytes(b'\x83'))  # todo выяснить допустимый диапазон байт для ASN.1 и x509 полей
+DER_BYTE_2 = tuple(bytes([byte]) for byte in range(0x81, 0x85))
+# блоки PEM, из которых загружаются сертификаты и списки отзыва
+PEM_BLOCK_RE = re.compile(rb'-----BEGIN (CERTIFICATE|X509 CRL|PKCS7)-----.+?-----END \1-----', re.DOTALL)
 
 
 class NameOID(_NameOID):
@@ -25,191 +36,465 @@ _OID_NAMES.update({
 
 oid2name = _OID_NAMES
 
+# размер блока данных при вычислении отпечатков
+FINGERPRINT_CHUNK_SIZE = 64 * 1024
+# имена алгоритма ГОСТ Р 34.11-2012 (256) в hashlib при сборке OpenSSL с поддержкой ГОСТ
+GOST_HASHLIB_NAMES = ('streebog256', 'md_gost12_256')
+
+# шаблон сертификата Microsoft (szOID_ENROLL_CERTTYPE_EXTENSION)
+ENROLL_CERTTYPE_OID = ObjectIdentifier('1.3.6.1.4.1.311.20.2')
+
+# запись списка отзыва: серийный номер (str), дата отзыва, причина отзыва (ReasonFlags.value или None)
+RevokedEntry = namedtuple('RevokedEntry', ('serial', 'revocation_date', 'reason'))
+
 
-# @TODO - структура PKIObject - разделить на два класса - ParsedCertificate, ParsedCertificateRevocationList
-# @TODO - структуры ParsedCertificate, ParsedCertificateRevocationList - описания полей, хранение данных в dict, (см ДЗ)
 # @TODO - проверку сертификата при загрузке
 
-class PKIObject:
-    """"""
 
-    def __init__(self, x509obj: 'x509.Certificate|x509.CertificateRevocationList|None' = None):
-        self.pki_type = None
-        self._up_file = None
-        self._object = x509obj
-        self._parsed = {}
+def is_der(raw_data: bytes) -> bool:
+    """Данные в DER кодировке: SEQUENCE с длиной в короткой или длинной форме"""
+    if len(raw_data) < 2 or raw_data[:1] != DER_BYTE_1:
+        return False
+    return raw_data[1:2] in DER_BYTE_2 or raw_data[1] < 0x80
 
-        if x509obj:
-            if isinstance(x509obj, x509.Certificate):
-                self.pki_type = 'crt'
-            elif isinstance(x509obj, x509.CertificateRevocationList):
-                self.pki_type = 'crl'
-            else:
-                raise ValueError('Неверный тип объекта')
 
-        if x509obj:
-            self.parse()
+def load_x509(raw_data: bytes, suffix: 'str|None' = None) -> 'x509.Certificate|x509.CertificateRevocationList':
+    """Загрузка x509 объекта из DER или PEM. Тип объекта определяется по suffix ('crt', 'crl')"""
+    is_crl = suffix == 'crl'
+    if is_der(raw_data):
+        # DER
+        return x509.load_der_x509_crl(raw_data) if is_crl else x509.load_der_x509_certificate(raw_data)
+    # PEM
+    return x509.load_pem_x509_crl(raw_data) if is_crl else x509.load_pem_x509_certificate(raw_data)
+
+
+def iter_x509(raw_data: bytes, suffix: 'str|None' = None):
+    """Генератор x509 объектов из набора PEM блоков или PKCS#7 контейнера (DER или PEM).
+    Из PKCS#7 загружаются только сертификаты
+    """
+    if is_der(raw_data):
+        if suffix == 'p7b':
+            yield from pkcs7.load_der_pkcs7_certificates(raw_data)
+        else:
+            yield load_x509(raw_data, suffix)
+        return
+    for match in PEM_BLOCK_RE.finditer(raw_data):
+        label, block = match.group(1), match.group(0)
+        if label == b'CERTIFICATE':
+            yield x509.load_pem_x509_certificate(block)
+        elif label == b'X509 CRL':
+            yield x509.load_pem_x509_crl(block)
+        else:
+            yield from pkcs7.load_pem_pkcs7_certificates(block)
+
+
+def parse_x509(x509obj: 'x509.Certificate|x509.CertificateRevocationList',
+               up_file=None) -> 'ParsedCertificate|ParsedCertificateRevocationList':
+    """Обертка x509 объекта в класс разбора соответствующего типа"""
+    if isinstance(x509obj, x509.Certificate):
+        return ParsedCertificate(x509obj, up_file)
+    if isinstance(x509obj, x509.CertificateRevocationList):
+        return ParsedCertificateRevocationList(x509obj, up_file)
+    raise ValueError('Неверный тип объекта')
+
+
+def gost_hash():
+    """Объект хэширования ГОСТ Р 34.11-2012 (256) из hashlib или пакета pygost. None при отсутствии поддержки"""
+    for name in GOST_HASHLIB_NAMES:
+        try:
+            return hashlib.new(name)
+        except ValueError:
+            continue
+    try:
+        from pygost import gost34112012256
+    except ImportError:
+        return None
+    return gost34112012256.new()
+
+
+def fingerprints(der_data: bytes) -> dict:
+    """Отпечатки DER данных по алгоритмам SHA-1, SHA-256, MD5, ГОСТ за один проход по данным.
+    Отпечаток ГОСТ равен None, если алгоритм недоступен
+    """
+    hashers = {
+        'sha1': hashlib.sha1(),
+        'sha256': hashlib.sha256(),
+        'md5': hashlib.md5(),
+        'gost': gost_hash(),
+    }
+    active = [hasher for hasher in hashers.values() if hasher is not None]
+    data = memoryview(der_data)
+    for offset in range(0, len(data), FINGERPRINT_CHUNK_SIZE):
+        chunk = data[offset:offset + FINGERPRINT_CHUNK_SIZE]
+        for hasher in active:
+            hasher.update(chunk)
+    return {name: hasher.hexdigest() if hasher is not None else None for name, hasher in hashers.items()}
+
+
+def raw_digest(raw_data: bytes) -> str:
+    """Дайджест исходных байт файла (DER или PEM)"""
+    return hashlib.sha256(raw_data).hexdigest()
+
+
+def read_x509(up_file, use_cache: bool = True, precheck=None) -> 'ParsedCertificate|ParsedCertificateRevocationList':
+    """Чтение сертификата или списка отзыва из загруженного файла.
+    Повторно загружаемые файлы с тем же содержимым берутся из кэша разбора parse_cache.
+    precheck(suffix, digest) - проверка по дайджесту исходных байт, вызывается до разбора x509.
+    Дайджест, вычисленный при загрузке файла (атрибут raw_digest), не пересчитывается
+    """
+    suffix = utils.define_suffix(up_file.name, getattr(up_file, 'content_type', None))
+    raw_data = up_file.file.read()
+    digest = getattr(up_file, 'raw_digest', None) or raw_digest(raw_data)
+    if precheck is not None:
+        precheck(suffix, digest)
+    key = (suffix, digest)
+    cached = parse_cache.get(key) if use_cache else None
+    if cached is None:
+        # в кэше хранится объект без ссылки на загруженный файл
+        cached = parse_x509(load_x509(raw_data, suffix))
+        cached.raw_digest = digest
+        if use_cache:
+            parse_cache.put(key, cached, len(raw_data))
+    return cached.copy(up_file)
+
+
+def iter_x509_file(up_file):
+    """Чтение всех сертификатов и списков отзыва из загруженного PEM набора или PKCS#7 контейнера.
+    Каждый объект получает собственный DER файл для сохранения в хранилище
+    """
+    suffix = utils.define_suffix(up_file.name, getattr(up_file, 'content_type', None))
+    for num, x509obj in enumerate(iter_x509(up_file.file.read(), suffix)):
+        der_data = x509obj.public_bytes(Encoding.DER)
+        pki = parse_x509(x509obj)
+        pki._der = der_data
+        pki.up_file = ContentFile(der_data, name=f'{num}.{pki.pki_type}')
+        pki.raw_digest = raw_digest(der_data)
+        yield pki
+
+
+def name_to_dict(name: 'x509.Name') -> dict:
+    return {oid2name.get(obj_attr.oid, obj_attr.oid.dotted_string): obj_attr.value for obj_attr in name}
 
-    def __str__(self):
-        return f'PKI:<{self.subject_identifier}>'
 
-    def __getattribute__(self, item):
-        # проверка имен для предотвращения рекурсии
-        if item != '_parsed' and item in self._parsed:
-            return self._parsed.get(item)
-        return super().__getattribute__(item)
+class lazy_field:
+    """Поле разобранного объекта, вычисляемое при первом чтении.
+    Значение сохраняется в слот экземпляра с именем '_<имя поля>'
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.slot = f'_{func.__name__}'
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:
+            value = self.func(instance)
+            setattr(instance, self.slot, value)
+            return value
+
+
+def copy_value(value):
+    """Копия вложенных словарей и списков значения поля. Прочие значения (строки, даты, объекты
+    cryptography) неизменяемы и не копируются
+    """
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def lazy_slots(cls_fields: tuple) -> tuple:
+    """Имена слотов для хранения значений ленивых полей"""
+    return tuple(f'_{name}' for name in cls_fields)
+
+
+class ParsedPKI(abc.ABC):
+    """Базовый класс разобранного x509 объекта"""
+    __slots__ = ('_x509', '_der', 'up_file', 'raw_digest', '_extensions', '_fingerprints')
+    pki_type = None
+    fields = ()
+    # слоты ленивых полей вне fields, передаваемые при сериализации
+    extra_slots = ()
+
+    def __init__(self, x509obj, up_file=None):
+        self._x509 = x509obj
+        self._der = None
+        self.up_file = up_file
+        self.raw_digest = None
+
+    def __str__(self):
+        return f'PKI:<{self.identifier}>'
 
     @property
-    def parsed(self):
-        return self._parsed
+    def _object(self):
+        """x509 объект. Объект, восстановленный из pickle, загружается из DER при первом обращении"""
+        if self._x509 is None:
+            self._x509 = load_x509(self._der, self.pki_type)
+        return self._x509
 
     @property
     def object(self):
         return self._object
 
     @property
-    def up_file(self):
-        return self._up_file
-
-    def clean(self):
-        self.pki_type = None
-        self._up_file = None
-        self._object = None
-        self._parsed = {}
-
-    def read_x509(self, up_file):
-        """"""
-        if self._object:
-            self.clean()
-
-        self._up_file = up_file
-        suffix = utils.mime_content_type_map.get(up_file.content_type)
-        raw_data = up_file.file.read()
-        if raw_data[:1] == DER_BYTE_1 and raw_data[1:2] in DER_BYTE_2:
-            # DER
-            if suffix == 'crl':
-                self.pki_type = suffix
-                self._object = x509.load_der_x509_crl(raw_data)
-            else:
-                self.pki_type = 'crt'
-                self._object = x509.load_der_x509_certificate(raw_data)
-        else:
-            # PEM
-            if suffix == 'crl':
-                self.pki_type = suffix
-                self._object = x509.load_pem_x509_crl(raw_data)
-            else:
-                self.pki_type = 'crt'
-                self._object = x509.load_pem_x509_certificate(raw_data)
-        self.parse()
-
-    def parse(self):
-        """"""
-        if self._object is None:
-            raise ValueError('Объект x509 не определен или не загружен')
-        if self.pki_type == 'crt':
-            parser = self._parse_crt
-        elif self.pki_type == 'crl':
-            parser = self._parse_crl
-        else:
-            raise ValueError(f'Неопределенный тип объекта: {self.pki_type}')
-
-        self._parsed = parser(self._object)
-
-    def get_parsed(self):
-        if not self._parsed:
-            self.parse()
-        return self._parsed
-
-    @staticmethod
-    def _parse_crt(pki_obj):
-        """"""
-        subject_id = issuer_id = None
-        parsed = {
-            'version': {pki_obj.version.value: pki_obj.version.name},
-            'subject': {oid2name.get(obj_attr.oid, obj_attr.oid.dotted_string): obj_attr.value for obj_attr in
-                        pki_obj.subject},
-            'subject_identifier': None,
-            'subject_serial_number': str(pki_obj.serial_number) if pki_obj.serial_number else None,  # todo check for
-            # unsigned
-            'issuer': {oid2name.get(obj_attr.oid, obj_attr.oid.dotted_string): obj_attr.value for obj_attr in
-                       pki_obj.issuer},
-            'issuer_identifier': None,
-            'issuer_serial_number': None,
-            'not_valid_after': make_aware(pki_obj.not_valid_after),
-            'not_valid_before': make_aware(pki_obj.not_valid_before),
-            'CA': False,
-            'cdp_info': None,
-            'auth_info': None,
-            'fingerprint': pki_obj.fingerprint(algorithm=hashes.SHA1()).hex(),
-        }
-        #
-        for extension in pki_obj.extensions:
-            # CA=True or False
-            if extension.oid.dotted_string == '2.5.29.19':
-                parsed['CA'] = extension.value.ca
-            # SubjectKeyIdentifier
-            if extension.oid.dotted_string == '2.5.29.14':
-                parsed['subject_identifier'] = extension.value.key_identifier.hex()
-                subject_id = extension.value.key_identifier.hex()
-            #
-            if extension.oid.dotted_string == '1.3.6.1.4.1.311.20.2':
-                parsed['1.3.6.1.4.1.311.20.2'] = extension.value.value
-            # authorityKeyIdentifier
-            if extension.oid.dotted_string == '2.5.29.35':
-                # parsed['issuerKeyIdentifier'] = {
-                #     'authority_cert_serial_number': str(extension.value.authority_cert_serial_number),
-                #     'key_identifier': extension.value.key_identifier.hex()
-                # }
-                parsed['issuer_identifier'] = extension.value.key_identifier.hex()
-                parsed['issuer_serial_number'] = str(extension.value.authority_cert_serial_number)
-                issuer_id = extension.value.key_identifier.hex()
-            # CDP
-            if extension.oid.dotted_string == '2.5.29.31':
-                parsed['cdp_info'] = {num: [cdp.value for cdp in cdp_list.full_name] for num, cdp_list in
-                                      enumerate(extension.value)}
-            # authorityInfoAccess
-            if extension.oid.dotted_string == '1.3.6.1.5.5.7.1.1':
-                parsed['auth_info'] = {ia.access_method._name: ia.access_location.value for ia in
-                                       extension.value}
-
-        parsed['is_root'] = parsed['CA'] and (subject_id == issuer_id or parsed['subject'] == parsed['issuer'])
-        return parsed
+    def der(self) -> bytes:
+        if self._der is None:
+            self._der = self._x509.public_bytes(Encoding.DER)
+        return self._der
+
+    @property
+    @abc.abstractmethod
+    def identifier(self):
+        """Идентификатор ключа объекта: субъекта для сертификата, издателя для списка отзыва"""
+
+    def copy(self, up_file=None):
+        """Копия объекта с другим файлом. Уже вычисленные поля переносятся в копию, словари и списки
+        копируются: изменение полей копии не меняет объект в кэше разбора
+        """
+        obj = self.__class__(self._x509, up_file)
+        obj._der = self._der
+        for cls in self.__class__.__mro__[:-1]:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if slot not in ('_x509', '_der', 'up_file') and hasattr(self, slot):
+                    setattr(obj, slot, copy_value(getattr(self, slot)))
+        return obj
+
+    def __reduce__(self):
+        """Сериализация для передачи между процессами: DER данные и вычисленные значения полей.
+        Объекты cryptography не сериализуются: восстановленный объект загружает x509 из DER только при
+        обращении к полям, не переданным в состоянии, или к object
+        """
+        state = {slot: getattr(self, slot) for slot in self._state_slots() if hasattr(self, slot)}
+        return _restore_parsed, (self.__class__, self.der, state)
+
+    def _state_slots(self):
+        return ('up_file', 'raw_digest', '_fingerprints') + lazy_slots(self.fields) + self.extra_slots
+
+    @property
+    def parsed(self) -> dict:
+        """Значения всех полей. Вычисляет еще не прочитанные поля"""
+        return {name: getattr(self, name) for name in self.fields}
+
+    def evaluate(self) -> 'ParsedPKI':
+        """Вычисление всех полей, например перед передачей объекта в другой процесс"""
+        for name in self.fields:
+            getattr(self, name)
+        for slot in self.extra_slots:
+            getattr(self, slot[1:])
+        return self
+
+    @lazy_field
+    def fingerprints(self) -> dict:
+        return fingerprints(self.der)
 
-    @staticmethod
-    def _parse_crl(pki_obj):
-        """"""
-        parsed = {
-            'issuer': {oid2name.get(obj_attr.oid, obj_attr.oid.dotted_string): obj_attr.value for obj_attr in
-                       pki_obj.issuer},
-            'issuer_identifier': None,
-            'issuer_serial_number': None,
-            'crl_number': None,
-            'last_update': make_aware(pki_obj.last_update),
-            'next_update': make_aware(pki_obj.next_update),
-            'revoked_list': None,
-            'fingerprint': pki_obj.fingerprint(algorithm=hashes.SHA1()).hex(),
-        }
-        for extension in pki_obj.extensions:
-            # issuerKeyIdentifier
-            if extension.oid.dotted_string == '2.5.29.35':
-                parsed['issuer_identifier'] = extension.value.key_identifier.hex()
-                parsed['issuer_serial_number'] = extension.value.authority_cert_serial_number
-            # cRLNumber
-            if extension.oid.dotted_string == '2.5.29.20':
-                parsed['crl_number'] = str(extension.value.crl_number)
-        # RevokedList
-        parsed['revoked_list'] = {
-            str(revoked.serial_number): (make_aware(revoked.revocation_date),
-                                         [ext.value.reason.value for ext in revoked.extensions if hasattr(ext.value,
-                                                                                                          'reason'
-                                                                                                          )]) for
-            revoked in
-            pki_obj
-        }
+    @lazy_field
+    def extensions(self) -> dict:
+        return {extension.oid: extension.value for extension in self._object.extensions}
 
+    def _extension(self, oid: 'ObjectIdentifier'):
+        """Значение расширения x509 или None при его отсутствии"""
+        return self.extensions.get(oid)
+
+
+class ParsedCertificate(ParsedPKI):
+    """Разобранный сертификат"""
+    pki_type = 'crt'
+    fields = ('version', 'subject', 'subject_identifier', 'subject_serial_number', 'issuer', 'issuer_identifier',
+              'issuer_serial_number', 'not_valid_after', 'not_valid_before', 'CA', 'cdp_info', 'auth_info',
+              'fingerprint', 'is_root')
+    extra_slots = ('_enroll_cert_type',)
+    __slots__ = lazy_slots(fields) + ('_authority_key',) + extra_slots
+
+    @property
+    def identifier(self):
+        return self.subject_identifier
+
+    @property
+    def parsed(self) -> dict:
+        """Значения всех полей. Расширение шаблона сертификата Microsoft добавляется под своим OID при наличии"""
+        parsed = super().parsed
+        if self.enroll_cert_type is not None:
+            parsed[ENROLL_CERTTYPE_OID.dotted_string] = self.enroll_cert_type
         return parsed
 
+    @lazy_field
+    def enroll_cert_type(self) -> 'bytes|None':
+        """Значение расширения 1.3.6.1.4.1.311.20.2 (шаблон сертификата Microsoft), DER"""
+        value = self._extension(ENROLL_CERTTYPE_OID)
+        return value.value if value is not None else None
+
+    @lazy_field
+    def version(self):
+        return {self._object.version.value: self._object.version.name}
+
+    @lazy_field
+    def subject(self):
+        return name_to_dict(self._object.subject)
+
+    @lazy_field
+    def subject_identifier(self):
+        value = self._extension(ExtensionOID.SUBJECT_KEY_IDENTIFIER)
+        return value.key_identifier.hex() if value else None
+
+    @lazy_field
+    def subject_serial_number(self):
+        serial_number = self._object.serial_number
+        return str(serial_number) if serial_number else None
+
+    @lazy_field
+    def issuer(self):
+        return name_to_dict(self._object.issuer)
+
+    @lazy_field
+    def authority_key(self):
+        return self._extension(ExtensionOID.AUTHORITY_KEY_IDENTIFIER)
+
+    @lazy_field
+    def issuer_identifier(self):
+        value = self.authority_key
+        return value.key_identifier.hex() if value and value.key_identifier else None
+
+    @lazy_field
+    def issuer_serial_number(self):
+        value = self.authority_key
+        return str(value.authority_cert_serial_number) if value else None
+
+    @lazy_field
+    def not_valid_after(self):
+        return make_aware(self._object.not_valid_after)
+
+    @lazy_field
+    def not_valid_before(self):
+        return make_aware(self._object.not_valid_before)
+
+    @lazy_field
+    def CA(self):
+        value = self._extension(ExtensionOID.BASIC_CONSTRAINTS)
+        return value.ca if value else False
+
+    @lazy_field
+    def cdp_info(self):
+        value = self._extension(ExtensionOID.CRL_DISTRIBUTION_POINTS)
+        if value is not None:
+            return {num: [cdp.value for cdp in cdp_list.full_name] for num, cdp_list in enumerate(value)}
+
+    @lazy_field
+    def auth_info(self):
+        value = self._extension(ExtensionOID.AUTHORITY_INFORMATION_ACCESS)
+        if value is not None:
+            return {ia.access_method._name: ia.access_location.value for ia in value}
+
+    @lazy_field
+    def fingerprint(self):
+        return self.fingerprints['sha1']
+
+    @lazy_field
+    def is_root(self):
+        return self.CA and (self.subject_identifier == self.issuer_identifier or self.subject == self.issuer)
+
+
+class ParsedCertificateRevocationList(ParsedPKI):
+    """Разобранный список отзыва. Записи об отозванных сертификатах выдаются генератором iter_revoked()"""
+    pki_type = 'crl'
+    fields = ('issuer', 'issuer_identifier', 'issuer_serial_number', 'crl_number', 'last_update', 'next_update',
+              'revoked_count', 'fingerprint')
+    __slots__ = lazy_slots(fields) + ('_authority_key',)
+
+    @property
+    def identifier(self):
+        return self.issuer_identifier
+
+    @lazy_field
+    def issuer(self):
+        return name_to_dict(self._object.issuer)
+
+    @lazy_field
+    def authority_key(self):
+        return self._extension(ExtensionOID.AUTHORITY_KEY_IDENTIFIER)
+
+    @lazy_field
+    def issuer_identifier(self):
+        value = self.authority_key
+        return value.key_identifier.hex() if value and value.key_identifier else None
+
+    @lazy_field
+    def issuer_serial_number(self):
+        value = self.authority_key
+        return value.authority_cert_serial_number if value else None
+
+    @lazy_field
+    def crl_number(self):
+        value = self._extension(ExtensionOID.CRL_NUMBER)
+        return str(value.crl_number) if value else None
+
+    @lazy_field
+    def last_update(self):
+        return make_aware(self._object.last_update)
+
+    @lazy_field
+    def next_update(self):
+        return make_aware(self._object.next_update)
+
+    @lazy_field
+    def revoked_count(self):
+        return len(self._object)
+
+    @lazy_field
+    def fingerprint(self):
+        return self.fingerprints['sha1']
+
+    def iter_revoked(self):
+        return iter_revoked(self._object)
+
+
+def _restore_parsed(cls, der_data: bytes, state: dict) -> 'ParsedPKI':
+    obj = cls(None)
+    obj._der = der_data
+    for slot, value in state.items():
+        setattr(obj, slot, value)
+    return obj
+
+
+def read_x509_path(path: 'str|Path') -> list:
+    """Чтение всех объектов x509 из файла на диске с разбором всех полей.
+    Используется для разбора файлов в отдельных процессах: результат сериализуется pickle
+    """
+    path = Path(path)
+    raw_data = path.read_bytes()
+    suffix = utils.define_suffix(path.name, None)
+    if suffix in utils.bundle_suffixes:
+        pki_list = list(iter_x509_file(ContentFile(raw_data, name=path.name)))
+    else:
+        pki = parse_x509(load_x509(raw_data, suffix), ContentFile(raw_data, name=path.name))
+        pki.raw_digest = raw_digest(raw_data)
+        pki_list = [pki]
+    for pki in pki_list:
+        pki.evaluate()
+    return pki_list
+
+
+def revoked_reason(revoked: 'x509.RevokedCertificate') -> 'str|None':
+    """Причина отзыва из расширения CRLReason записи списка отзыва"""
+    try:
+        extension = revoked.extensions.get_extension_for_class(x509.CRLReason)
+    except x509.ExtensionNotFound:
+        return None
+    return extension.value.reason.value
+
+
+def iter_revoked(crl: 'x509.CertificateRevocationList'):
+    """Потоковый разбор записей списка отзыва"""
+    for revoked in crl:
+        yield RevokedEntry(str(revoked.serial_number),
+                           make_aware(revoked.revocation_date),
+                           revoked_reason(revoked))
+
+
 # def read_from_file(fp: 'str|Path') -> (bytes, str):
 #     """"""
 #     if isinstance(fp, str):
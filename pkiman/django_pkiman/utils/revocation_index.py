@@ -0,0 +1,291 @@
+"""Индекс отозванных сертификатов издателя - отсортированный файл записей фиксированной длины.
+
+Файл: заголовок HEADER (сигнатура, версия, длина записи, количество записей) и записи RECORD -
+серийный номер (20 байт big-endian со смещением SERIAL_BIAS, порядок байт совпадает с порядком номеров),
+время отзыва (секунды UTC) и код причины отзыва (NO_REASON - не указана).
+Новый индекс собирается внешней сортировкой во временном файле рядом с индексом и заменяет его целиком
+через os.replace, читатели открывают его через mmap и отслеживают замену по inode
+"""
+import datetime
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import weakref
+from collections import namedtuple
+
+INDEX_SUFFIX = 'rsi'
+INDEX_MAGIC = b'PKIRSI'
+INDEX_VERSION = 1
+HEADER = struct.Struct('>6sHHQ')
+RECORD = struct.Struct('>20sqB')
+SERIAL_SIZE = 20
+# RFC 5280 4.1.2.2: не более 20 октетов DER, включая знаковый бит
+SERIAL_BIAS = 1 << (SERIAL_SIZE * 8 - 1)
+NO_REASON = 0xFF
+# записей в памяти при внешней сортировке (sort_records), около 3 МБ
+SORT_CHUNK_RECORDS = 100000
+
+IndexEntry = namedtuple('IndexEntry', ('serial', 'revocation_date', 'reason'))
+
+
+class RevocationIndexError(ValueError):
+    pass
+
+
+def pack_serial(serial: int) -> bytes:
+    try:
+        return (serial + SERIAL_BIAS).to_bytes(SERIAL_SIZE, 'big')
+    except OverflowError:
+        raise RevocationIndexError(f'серийный номер {serial} длиннее {SERIAL_SIZE} байт')
+
+
+def pack_record(serial: int, revocation_date: 'datetime.datetime', reason: 'int|None') -> bytes:
+    """Запись индекса. Порядок упакованных записей совпадает с порядком номеров"""
+    return RECORD.pack(pack_serial(serial), int(revocation_date.timestamp()), NO_REASON if reason is None else reason)
+
+
+def unpack_record(data, offset: int = 0) -> IndexEntry:
+    key, timestamp, reason = RECORD.unpack_from(data, offset)
+    return IndexEntry(int.from_bytes(key, 'big') - SERIAL_BIAS,
+                      datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc),
+                      None if reason == NO_REASON else reason)
+
+
+def write_index(path: str, records):
+    """Запись индекса. records - отсортированные по номеру кортежи (serial: int, revocation_date, reason)"""
+    write_packed_index(path, (pack_record(*record) for record in records))
+
+
+def write_packed_index(path: str, packed):
+    """Запись индекса из отсортированных упакованных pack_record записей.
+    Данные пишутся во временный файл в том же каталоге, который затем атомарно заменяет индекс
+    """
+    tmp_path, _ = _write_temp_index(os.path.dirname(path), packed)
+    os.replace(tmp_path, path)
+
+
+def _write_temp_index(directory: str, packed) -> tuple:
+    """Временный файл индекса в каталоге directory. Возвращает путь и количество записей"""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix=f'.{INDEX_SUFFIX}')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # количество записей известно после записи, заголовок перезаписывается
+            f.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, RECORD.size, 0))
+            count = 0
+            for record in packed:
+                f.write(record)
+                count += 1
+            f.seek(0)
+            f.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, RECORD.size, count))
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path, count
+
+
+def _write_run(directory: str, packed: list) -> str:
+    fd, path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.run')
+    with os.fdopen(fd, 'wb') as f:
+        f.writelines(packed)
+    return path
+
+
+def _iter_run(path: str, chunk_records: int = 4096):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_records * RECORD.size)
+            if not chunk:
+                break
+            for offset in range(0, len(chunk), RECORD.size):
+                yield chunk[offset:offset + RECORD.size]
+
+
+class SortedRecords:
+    """Отсортированные записи во временном файле индекса (sort_records). Файл удаляется при удалении объекта,
+    если не был перенесен на место индекса replace - например, при откате транзакции, в которой
+    был запланирован перенос
+    """
+
+    def __init__(self, path: str, count: int):
+        self.path = path
+        self.count = count
+        self._finalizer = weakref.finalize(self, remove_index, path)
+
+    def __iter__(self):
+        # генератор удерживает объект, файл не удаляется до конца чтения
+        yield from iter_index(self.path)
+
+    def replace(self, path: str):
+        """Перенос файла на место индекса path"""
+        os.replace(self.path, path)
+        self._finalizer.detach()
+
+    def remove(self):
+        self._finalizer()
+
+
+def sort_records(packed, directory: str = None, chunk_records: int = SORT_CHUNK_RECORDS) -> SortedRecords:
+    """Внешняя сортировка упакованных pack_record записей во временный файл индекса в каталоге directory
+    (по умолчанию - каталог временных файлов). В памяти - не более chunk_records записей: отсортированные
+    порции пишутся во временные файлы и сливаются потоком
+    """
+    directory = directory or tempfile.gettempdir()
+    runs = []
+    try:
+        chunk = []
+        for record in packed:
+            chunk.append(record)
+            if len(chunk) >= chunk_records:
+                chunk.sort()
+                runs.append(_write_run(directory, chunk))
+                chunk = []
+        chunk.sort()
+        if runs:
+            if chunk:
+                runs.append(_write_run(directory, chunk))
+            chunk = None
+            merged = heapq.merge(*(_iter_run(run) for run in runs))
+        else:
+            merged = chunk
+        path, count = _write_temp_index(directory, merged)
+    finally:
+        for run in runs:
+            remove_index(run)
+    return SortedRecords(path, count)
+
+
+def unpack_header(path: str, data, size: int) -> int:
+    """Проверка заголовка индекса размером файла size. Возвращает количество записей"""
+    try:
+        magic, version, record_size, count = HEADER.unpack_from(data)
+    except struct.error:
+        raise RevocationIndexError(f'{path}: поврежден заголовок')
+    if (magic, version, record_size) != (INDEX_MAGIC, INDEX_VERSION, RECORD.size) or \
+            size != HEADER.size + count * RECORD.size:
+        raise RevocationIndexError(f'{path}: неизвестный формат')
+    return count
+
+
+def index_count(path: str) -> int:
+    """Количество записей индекса. FileNotFoundError - индекс не создан"""
+    with open(path, 'rb') as f:
+        return unpack_header(path, f.read(HEADER.size), os.fstat(f.fileno()).st_size)
+
+
+def iter_index(path: str, chunk_records: int = 4096):
+    """Последовательное чтение записей индекса блоками по chunk_records, без загрузки файла в память"""
+    with open(path, 'rb') as f:
+        count = unpack_header(path, f.read(HEADER.size), os.fstat(f.fileno()).st_size)
+        while count > 0:
+            chunk = f.read(min(count, chunk_records) * RECORD.size)
+            for offset in range(0, len(chunk), RECORD.size):
+                yield unpack_record(chunk, offset)
+            count -= chunk_records
+
+
+def remove_index(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class RevocationIndex:
+    """Поиск по индексу через mmap. Файл переоткрывается при замене"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._mmap = None
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> tuple:
+        """Переоткрытие файла при смене inode, размера или времени изменения. Возвращает отметку версии файла"""
+        with self._lock:
+            self._refresh()
+            return self._stat
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.close()
+            raise
+        stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if stat == self._stat:
+            return
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            count = unpack_header(self.path, mm, len(mm))
+        except RevocationIndexError:
+            mm.close()
+            raise
+        self.close()
+        self._mmap, self._stat, self.count = mm, stat, count
+
+    def _search(self, key: bytes) -> 'IndexEntry|None':
+        mm = self._mmap
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            value = mm[offset:offset + SERIAL_SIZE]
+            if value < key:
+                lo = mid + 1
+            elif value > key:
+                hi = mid
+            else:
+                return unpack_record(mm, offset)
+        return None
+
+    def get(self, serial: 'int|str') -> 'IndexEntry|None':
+        """Запись отозванного сертификата или None, если номера нет в индексе"""
+        return self.get_many([serial])[0]
+
+    def get_many(self, serials) -> list:
+        """Поиск набора номеров с одной проверкой замены файла"""
+        return self.search_keys([pack_serial(int(serial)) for serial in serials])
+
+    def search_keys(self, keys) -> list:
+        """Поиск набора упакованных pack_serial номеров"""
+        with self._lock:
+            self._refresh()
+            return [self._search(key) for key in keys]
+
+    def keys(self) -> tuple:
+        """Отметка версии файла и список упакованных номеров индекса"""
+        with self._lock:
+            self._refresh()
+            mm, size = self._mmap, RECORD.size
+            return self._stat, [mm[offset:offset + SERIAL_SIZE]
+                                for offset in range(HEADER.size, HEADER.size + self.count * size, size)]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap, self._stat, self.count = None, None, 0
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path: str) -> RevocationIndex:
+    """Открытый индекс процесса по пути файла"""
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = RevocationIndex(path)
+        return index
+
+
+def lookup(path: str, serial: 'int|str') -> 'IndexEntry|None':
+    """Поиск номера в индексе. FileNotFoundError - индекс не создан"""
+    return get_index(path).get(serial)
@@ -0,0 +1,220 @@
+"""Проверка статуса отзыва пакетов (идентификатор ключа издателя, серийный номер).
+
+Для каждого издателя в памяти процесса хранится фильтр Блума по файлу индекса отозванных сертификатов.
+Номера, добавленные новой версией списка отзыва, вносятся в фильтр по сигналу revoked_serials_changed,
+и замена индекса принимается без перестроения. Удалить номер из фильтра нельзя, поэтому при удаленных
+номерах и при замене индекса без сигнала фильтр перестраивается. Номера, отсутствующие в фильтре,
+считаются действующими без обращения к индексу, остальные проверяются по индексу (при отсутствии
+индекса - по БД)
+"""
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+
+from django_pkiman.models import Crl, RevocationReasonChoices, RevokedSerial
+from django_pkiman.utils.bloom import BloomFilter
+from django_pkiman.utils.revocation_index import RevocationIndexError, get_index, pack_serial
+
+DEFAULT_PKIMAN_STATUS_BLOOM_ERROR_RATE = 0.001
+DEFAULT_PKIMAN_STATUS_ISSUER_TTL = 60
+# запас емкости фильтра для добавляемых номеров: доля от количества и не менее BLOOM_RESERVE_MIN
+BLOOM_RESERVE = 0.1
+BLOOM_RESERVE_MIN = 1024
+
+STATUS_GOOD = 'good'
+STATUS_REVOKED = 'revoked'
+STATUS_UNKNOWN = 'unknown'
+
+StatusStats = namedtuple('StatusStats', ('requests', 'items', 'seconds', 'per_second', 'bloom_negatives',
+                                         'index_lookups', 'filter_builds'))
+
+
+class IssuerStatus:
+    """Фильтр Блума и индекс отозванных сертификатов издателя"""
+
+    def __init__(self, crl: Crl):
+        self.crl = crl
+        self.index = get_index(crl.index_path())
+        self.bloom = None
+        self.stamp = None
+        # количество номеров в фильтре и ожидание замены индекса с добавленными номерами
+        self.keys_count = 0
+        self.pending = False
+        self._lock = threading.Lock()
+
+    def _bloom(self) -> BloomFilter:
+        stamp = self.index.refresh()
+        with self._lock:
+            if stamp != self.stamp:
+                if self.pending and self.index.count == self.keys_count:
+                    # новый индекс - прежний с номерами, уже внесенными в фильтр apply_changes
+                    self.stamp = stamp
+                else:
+                    stamp, keys = self.index.keys()
+                    error_rate = getattr(settings, 'PKIMAN_STATUS_BLOOM_ERROR_RATE',
+                                         DEFAULT_PKIMAN_STATUS_BLOOM_ERROR_RATE)
+                    capacity = len(keys) + max(int(len(keys) * BLOOM_RESERVE), BLOOM_RESERVE_MIN)
+                    self.bloom = BloomFilter.from_keys(keys, error_rate, capacity)
+                    self.stamp, self.keys_count = stamp, len(keys)
+                    stats.add(filter_builds=1)
+                self.pending = False
+            return self.bloom
+
+    def apply_changes(self, added: list, removed: list):
+        """Разница новой версии списка отзыва (models.RevokedRecord). Добавленные номера вносятся в фильтр,
+        при удаленных номерах или исчерпании емкости фильтр перестраивается по новому индексу
+        """
+        with self._lock:
+            if self.bloom is None:
+                return
+            if removed or self.bloom.count + len(added) > self.bloom.capacity:
+                self.stamp, self.pending = None, False
+                return
+            for entry in added:
+                self.bloom.add(pack_serial(int(entry.serial)))
+            self.keys_count += len(added)
+            self.pending = True
+
+    def check(self, serials: list) -> list:
+        """Записи отозванных сертификатов (IndexEntry/RevokedRecord) или None по списку номеров"""
+        try:
+            keys = [pack_serial(serial) for serial in serials]
+            bloom = self._bloom()
+            result = [None] * len(keys)
+            candidates = [num for num, key in enumerate(keys) if key in bloom]
+            stats.add(bloom_negatives=len(keys) - len(candidates), index_lookups=len(candidates))
+            for num, entry in zip(candidates, self.index.search_keys([keys[num] for num in candidates])):
+                result[num] = entry
+            return result
+        except (OSError, RevocationIndexError):
+            return self.check_db(serials)
+
+    def check_db(self, serials: list) -> list:
+        revoked = {int(serial): (revocation_date, reason) for serial, revocation_date, reason in
+                   RevokedSerial.objects.filter(issuer_id=self.crl.issuer_id,
+                                                serial__in=[str(serial) for serial in serials]).values_list(
+                       'serial', 'revocation_date', 'reason')}
+        return [(serial, *revoked[serial]) if serial in revoked else None for serial in serials]
+
+
+class StatusCounters:
+    """Счетчики проверок процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.requests = self.items = self.bloom_negatives = self.index_lookups = self.filter_builds = 0
+        self.seconds = 0.0
+
+    def add(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def info(self) -> StatusStats:
+        per_second = self.items / self.seconds if self.seconds else 0.0
+        return StatusStats(self.requests, self.items, self.seconds, per_second, self.bloom_negatives,
+                           self.index_lookups, self.filter_builds)
+
+
+stats = StatusCounters()
+_issuers = {}
+_issuers_lock = threading.Lock()
+
+
+def get_issuers(identifiers: set) -> dict:
+    """IssuerStatus по идентификаторам ключа издателя. Неизвестные издатели - None.
+    Соответствие хранится PKIMAN_STATUS_ISSUER_TTL секунд
+    """
+    now = time.monotonic()
+    result, missing = {}, set()
+    with _issuers_lock:
+        for identifier in identifiers:
+            item = _issuers.get(identifier)
+            if item and item[0] > now:
+                result[identifier] = item[1]
+            else:
+                missing.add(identifier)
+    if missing:
+        found = {}
+        queryset = Crl.objects.select_related('issuer').filter(
+            issuer__subject_identifier__in=missing).order_by('last_update')
+        for crl in queryset:
+            found[crl.issuer.subject_identifier] = crl
+        expires = now + getattr(settings, 'PKIMAN_STATUS_ISSUER_TTL', DEFAULT_PKIMAN_STATUS_ISSUER_TTL)
+        with _issuers_lock:
+            for identifier in missing:
+                crl = found.get(identifier)
+                item = _issuers.get(identifier)
+                if crl is not None and item and item[1] and item[1].crl.pk == crl.pk:
+                    issuer = item[1]
+                    issuer.crl = crl
+                else:
+                    issuer = IssuerStatus(crl) if crl is not None else None
+                _issuers[identifier] = (expires, issuer)
+                result[identifier] = issuer
+    return result
+
+
+def clear():
+    with _issuers_lock:
+        _issuers.clear()
+
+
+def apply_changes(issuer_id: int, identifier: str, added: list, removed: list):
+    with _issuers_lock:
+        item = _issuers.get(identifier)
+    if item and item[1] and item[1].crl.issuer_id == issuer_id:
+        item[1].apply_changes(added, removed)
+
+
+def revoked_serials_changed_handler(sender, issuer, added, removed, **kwargs):
+    """Обработчик revoked_serials_changed: разница вносится в фильтр издателя после фиксации транзакции"""
+    transaction.on_commit(partial(apply_changes, issuer.pk, issuer.subject_identifier, added, removed))
+
+
+def parse_serial(value: 'int|str') -> int:
+    """Серийный номер - целое, десятичная строка или шестнадцатеричная с префиксом 0x"""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, int):
+        return value
+    value = value.strip()
+    return int(value, 16) if value.lower().startswith('0x') else int(value)
+
+
+def check_status(items: list) -> list:
+    """Статус отзыва по списку пар (идентификатор ключа издателя, серийный номер: int)"""
+    started = time.perf_counter()
+    by_issuer = {}
+    for num, (identifier, serial) in enumerate(items):
+        by_issuer.setdefault(identifier, []).append(num)
+    issuers = get_issuers(set(by_issuer))
+
+    result = [None] * len(items)
+    for identifier, numbers in by_issuer.items():
+        issuer = issuers.get(identifier)
+        if issuer is None:
+            for num in numbers:
+                result[num] = {'status': STATUS_UNKNOWN}
+            continue
+        entries = issuer.check([items[num][1] for num in numbers])
+        next_update = issuer.crl.next_update.isoformat()
+        for num, entry in zip(numbers, entries):
+            if entry is None:
+                result[num] = {'status': STATUS_GOOD, 'next_update': next_update}
+            else:
+                _, revocation_date, reason = entry
+                result[num] = {'status': STATUS_REVOKED,
+                               'revocation_date': revocation_date.isoformat(),
+                               'reason': RevocationReasonChoices(reason).name.lower() if reason is not None else None,
+                               'next_update': next_update}
+
+    stats.add(requests=1, items=len(items), seconds=time.perf_counter() - started)
+    return result
@@ -0,0 +1,100 @@
+"""Планирование обновления списков отзыва.
+
+Время следующей проверки (Crl.next_check) назначается после каждой загрузки: не позже next_update
+за вычетом запаса PKIMAN_REFRESH_MARGIN и ожидаемого выпуска новой версии по интервалу публикации.
+Проверка сдвигается раньше на случайную долю задержки (PKIMAN_REFRESH_JITTER), чтобы списки отзыва
+одного УЦ не запрашивались с точки распространения одновременно. Индекс next_check - очередь для
+update_handle, RefreshScheduler - очередь в памяти для постоянно работающего процесса
+"""
+import datetime
+import heapq
+import random
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from django_pkiman.models import Crl
+
+DEFAULT_PKIMAN_REFRESH_MARGIN = 3600
+DEFAULT_PKIMAN_REFRESH_RETRY = 900
+DEFAULT_PKIMAN_REFRESH_MAX_INTERVAL = 86400
+DEFAULT_PKIMAN_REFRESH_JITTER = 0.1
+DEFAULT_PKIMAN_REFRESH_RELOAD = 300
+
+
+def seconds_setting(name: str, default: float) -> datetime.timedelta:
+    return datetime.timedelta(seconds=getattr(settings, name, default))
+
+
+def plan_next_check(crl: 'Crl', now: 'datetime.datetime' = None, failed: bool = False) -> datetime.datetime:
+    """Время следующей проверки списка отзыва. failed - загрузка завершилась ошибкой"""
+    now = now or timezone.now()
+    retry = seconds_setting('PKIMAN_REFRESH_RETRY', DEFAULT_PKIMAN_REFRESH_RETRY)
+    if failed:
+        due = now + retry
+    else:
+        due = crl.next_update - seconds_setting('PKIMAN_REFRESH_MARGIN', DEFAULT_PKIMAN_REFRESH_MARGIN)
+        if crl.publish_interval:
+            due = min(due, crl.last_update + crl.publish_interval)
+        # новая версия ожидалась, но еще не опубликована - повтор через PKIMAN_REFRESH_RETRY
+        due = max(due, now + retry)
+        due = min(due, now + seconds_setting('PKIMAN_REFRESH_MAX_INTERVAL', DEFAULT_PKIMAN_REFRESH_MAX_INTERVAL))
+    jitter = getattr(settings, 'PKIMAN_REFRESH_JITTER', DEFAULT_PKIMAN_REFRESH_JITTER)
+    return due - (due - now) * random.uniform(0, jitter)
+
+
+class RefreshScheduler:
+    """Очередь списков отзыва по времени проверки (heapq). refresh(crl_list) - обновление наступивших
+    (download.refresh_crls). Очередь перечитывается из БД раз в PKIMAN_REFRESH_RELOAD секунд, чтобы учесть
+    добавленные списки отзыва и изменения расписаний
+    """
+
+    def __init__(self, refresh):
+        self.refresh = refresh
+        self._heap = []
+        self._loaded_at = None
+
+    def load(self, now: 'datetime.datetime' = None):
+        now = now or timezone.now()
+        self._heap = [(next_check or now, pk) for pk, next_check in
+                      Crl.objects.scheduled(now).values_list('pk', 'next_check')]
+        heapq.heapify(self._heap)
+        self._loaded_at = now
+
+    def __len__(self):
+        return len(self._heap)
+
+    def next_time(self) -> 'datetime.datetime | None':
+        if self._heap:
+            return self._heap[0][0]
+
+    def pop_due(self, now: 'datetime.datetime') -> list:
+        pk_list = []
+        while self._heap and self._heap[0][0] <= now:
+            pk_list.append(heapq.heappop(self._heap)[1])
+        return pk_list
+
+    def run_pending(self, now: 'datetime.datetime' = None):
+        """Обновление наступивших списков отзыва. Возвращает итоги refresh или None"""
+        now = now or timezone.now()
+        reload = seconds_setting('PKIMAN_REFRESH_RELOAD', DEFAULT_PKIMAN_REFRESH_RELOAD)
+        if self._loaded_at is None or now - self._loaded_at >= reload:
+            self.load(now)
+        pk_list = self.pop_due(now)
+        if not pk_list:
+            return None
+        summary = self.refresh(list(Crl.objects.filter(pk__in=pk_list).select_related('issuer', 'proxy')))
+        for pk, next_check in Crl.objects.filter(pk__in=pk_list).values_list('pk', 'next_check'):
+            heapq.heappush(self._heap, (next_check or now, pk))
+        return summary
+
+    def run(self, stop: threading.Event = None):
+        """Цикл обновления до установки stop"""
+        stop = stop or threading.Event()
+        reload = seconds_setting('PKIMAN_REFRESH_RELOAD', DEFAULT_PKIMAN_REFRESH_RELOAD)
+        while not stop.is_set():
+            self.run_pending()
+            now = timezone.now()
+            wakeup = min(filter(None, (self.next_time(), self._loaded_at + reload)))
+            stop.wait(max((wakeup - now).total_seconds(), 1))
@@ -0,0 +1,194 @@
+"""Полнотекстовый поиск сертификатов и списков отзыва.
+
+Индекс - виртуальная таблица SQLite FTS5 SEARCH_TABLE с одной колонкой слов: значения атрибутов DN,
+идентификаторы ключа субъекта и издателя, серийный номер (десятичный и шестнадцатеричный), отпечатки.
+rowid записи - pk объекта, умноженный на 2, плюс тип (KIND_CRT, KIND_CRL). Индекс обновляется
+обработчиками сигналов моделей и при пакетной загрузке. Поиск - подзапрос к индексу в условии выборки,
+поэтому постраничный вывод (KeysetPage) работает по всем найденным объектам. Для БД, отличных от SQLite,
+и при отсутствии FTS5 поиск выполняется фильтрами ORM по полям моделей
+"""
+import re
+
+from django.db import DatabaseError, connections
+from django.db.models import Q, TextField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+SEARCH_TABLE = 'django_pkiman_search'
+CREATE_SQL = (f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(terms, detail=none, '
+              f'prefix=\'2 3 4\', tokenize="unicode61 remove_diacritics 2")')
+DROP_SQL = f'DROP TABLE IF EXISTS {SEARCH_TABLE}'
+KIND_CRT = 0
+KIND_CRL = 1
+BATCH_SIZE = 500
+# наибольшая длина префикса с отдельным индексом (prefix в CREATE_SQL)
+PREFIX_INDEX_MAX = 4
+
+# шестнадцатеричное значение с разделителями байт (AA:BB:CC, не менее четырех байт через пробел) или префиксом 0x
+HEX_BYTES_RE = re.compile(r'\b[0-9a-f]{2}(?:(?::[0-9a-f]{2})+|(?:-[0-9a-f]{2})+|(?:\s[0-9a-f]{2}){3,})\b',
+                          re.IGNORECASE)
+HEX_PREFIX_RE = re.compile(r'\b0x(?=[0-9a-f])', re.IGNORECASE)
+HEX_RE = re.compile(r'^[0-9a-f]+$', re.IGNORECASE)
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+_available = {}
+
+
+def is_available(using: str = 'default') -> bool:
+    """Индекс FTS5 создан в БД"""
+    if using not in _available:
+        connection = connections[using]
+        _available[using] = connection.vendor == 'sqlite' and \
+            SEARCH_TABLE in connection.introspection.table_names(include_views=True)
+    return _available[using]
+
+
+def create_index(connection) -> bool:
+    """Создание таблицы индекса. Возвращает False, если БД не поддерживает FTS5"""
+    _available.clear()
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_SQL)
+    except DatabaseError:
+        return False
+    return True
+
+
+def drop_index(connection):
+    _available.clear()
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(DROP_SQL)
+
+
+def serial_terms(serial: 'str|None') -> list:
+    if not serial:
+        return []
+    return [serial, f'{int(serial):x}']
+
+
+def dn_terms(dn: 'dict|None') -> list:
+    return [str(value) for value in (dn or {}).values()]
+
+
+def crt_terms(crt) -> str:
+    """Слова индекса сертификата"""
+    return ' '.join(filter(None, [*dn_terms(crt.subject_dn), crt.subject_identifier, crt.issuer_identifier,
+                                  *serial_terms(crt.serial), crt.fingerprint, crt.fingerprint_sha256,
+                                  crt.fingerprint_md5, crt.fingerprint_gost]))
+
+
+def crl_terms(crl) -> str:
+    """Слова индекса списка отзыва: данные издателя, номер и отпечатки списка отзыва"""
+    issuer = crl.issuer
+    return ' '.join(filter(None, [*dn_terms(issuer.subject_dn), issuer.subject_identifier,
+                                  *serial_terms(issuer.serial), crl.crl_number, crl.fingerprint,
+                                  crl.fingerprint_sha256, crl.fingerprint_md5, crl.fingerprint_gost]))
+
+
+def rowid(kind: int, pk: int) -> int:
+    return pk * 2 + kind
+
+
+def index_objects(kind: int, objects, using: str = 'default'):
+    """Добавление или замена записей индекса объектов"""
+    if not is_available(using):
+        return
+    terms = crt_terms if kind == KIND_CRT else crl_terms
+    rows = [(rowid(kind, obj.pk), terms(obj)) for obj in objects]
+    with connections[using].cursor() as cursor:
+        for num in range(0, len(rows), BATCH_SIZE):
+            batch = rows[num:num + BATCH_SIZE]
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(batch))})',
+                           [row[0] for row in batch])
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (%s, %s)', batch)
+
+
+def remove_objects(kind: int, pk_list, using: str = 'default'):
+    if not is_available(using):
+        return
+    rowids = [rowid(kind, pk) for pk in pk_list]
+    with connections[using].cursor() as cursor:
+        for num in range(0, len(rowids), BATCH_SIZE):
+            batch = rowids[num:num + BATCH_SIZE]
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch)
+
+
+def rebuild(crt_queryset, crl_queryset, using: str = 'default') -> int:
+    """Перестроение индекса по всем объектам. Возвращает количество записей"""
+    connection = connections[using]
+    drop_index(connection)
+    if not create_index(connection):
+        return 0
+    count = 0
+    for kind, queryset in ((KIND_CRT, crt_queryset), (KIND_CRL, crl_queryset)):
+        batch = []
+        for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                index_objects(kind, batch, using)
+                count, batch = count + len(batch), []
+        index_objects(kind, batch, using)
+        count += len(batch)
+    return count
+
+
+def query_tokens(text: str) -> list:
+    """Слова запроса. Разделители байт и префикс 0x шестнадцатеричных значений удаляются"""
+    text = HEX_BYTES_RE.sub(lambda match: re.sub(r'[:\s-]', '', match.group()), text)
+    text = HEX_PREFIX_RE.sub('', text)
+    return TOKEN_RE.findall(text)
+
+
+def match_expression(tokens: list, prefix: bool = True) -> str:
+    """Выражение MATCH FTS5: все слова запроса должны присутствовать. При prefix последнее слово и короткие
+    слова, для которых есть индекс префиксов, ищутся как префиксы. Префикс длиннее PREFIX_INDEX_MAX без
+    индекса префиксов перебирает все слова индекса с этим началом, поэтому остальные слова ищутся целиком
+    """
+    parts = []
+    for num, token in enumerate(tokens):
+        part = '"{}"'.format(token.replace('"', '""'))
+        if prefix and (num == len(tokens) - 1 or len(token) <= PREFIX_INDEX_MAX):
+            part += '*'
+        parts.append(part)
+    return ' AND '.join(parts)
+
+
+def match_subquery(kind: int, tokens: list) -> RawSQL:
+    """Подзапрос pk объектов типа kind, соответствующих словам запроса"""
+    return RawSQL(f'SELECT rowid / 2 FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid %% 2 = %s',
+                  [match_expression(tokens), kind])
+
+
+def fallback_filter(kind: int, tokens: list) -> Q:
+    """Условие поиска полями ORM: каждое слово - префикс одного из полей или часть значения DN"""
+    prefix = '' if kind == KIND_CRT else 'issuer__'
+    fingerprint_fields = ('fingerprint', 'fingerprint_sha256', 'fingerprint_md5', 'fingerprint_gost')
+    condition = Q()
+    for token in tokens:
+        token_condition = Q(search_dn__icontains=token) | \
+            Q(**{f'{prefix}subject_identifier__istartswith': token}) | \
+            Q(**{f'{prefix}serial__startswith': token})
+        for field in fingerprint_fields:
+            token_condition |= Q(**{f'{field}__istartswith': token})
+        if kind == KIND_CRT:
+            token_condition |= Q(issuer_identifier__istartswith=token)
+        else:
+            token_condition |= Q(crl_number=token)
+        if HEX_RE.match(token):
+            token_condition |= Q(**{f'{prefix}serial': str(int(token, 16))})
+        condition &= token_condition
+    return condition
+
+
+def search_queryset(queryset, kind: int, text: str):
+    """Выборка объектов queryset, соответствующих строке поиска"""
+    tokens = query_tokens(text)
+    if not tokens:
+        return queryset.none()
+    if is_available(queryset.db):
+        return queryset.filter(pk__in=match_subquery(kind, tokens))
+    field = 'subject_dn' if kind == KIND_CRT else 'issuer__subject_dn'
+    return queryset.annotate(search_dn=Cast(field, TextField())).filter(fallback_filter(kind, tokens))
@@ -1,38 +1,95 @@
+import base64
+import binascii
+import hmac
+import ipaddress
+import json
+import time
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.db import IntegrityError
+from django.http import HttpResponse, JsonResponse
 from django.middleware import csrf
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import ListView, RedirectView, TemplateView
 from django.views.generic.detail import SingleObjectMixin
 
 from django_pkiman import forms, models
-from django_pkiman.errors import PKIError, PKIUrlError
+from django_pkiman.errors import PKIDuplicateError, PKIError, PKIUrlError
 from django_pkiman.models import Proxy
+from django_pkiman.utils import bundle_suffixes, define_suffix, ocsp, revocation_status, search
 from django_pkiman.utils.download import get_from_url, get_from_url_list, update_crl
+from django_pkiman.utils.keyset import KeysetPage
 from django_pkiman.utils.logger import logger
-from django_pkiman.utils.pki_parser import PKIObject
+from django_pkiman.utils.pki_parser import iter_x509_file, read_x509
+
+DEFAULT_PKIMAN_STATUS_BATCH_MAX = 10000
+DEFAULT_PKIMAN_STATUS_API_TOKENS = ()
+DEFAULT_PKIMAN_STATUS_ALLOWED_IPS = ()
 
 
 class IndexView(ListView):
+    """Реестр: корневые узлы дерева сертификатов или списки отзыва постранично по пути в дереве.
+    Подчиненные сертификаты загружаются по запросу через CrtChildrenView. Параметр q - строка поиска
+    """
     template_name = 'django-pkiman/index.html'
     url = '/'
+    keyset_keys = {'crt': 'path', 'crl': 'issuer__path'}
 
     def setup(self, request, *args, **kwargs):
         self.pki_type = request.GET.get('pki', 'crt')
+        if self.pki_type not in self.keyset_keys:
+            self.pki_type = 'crt'
+        self.query = request.GET.get('q', '').strip()
         super().setup(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         kwargs['url_path'] = self.url
         kwargs['pki_type'] = self.pki_type
+        kwargs['query'] = self.query
+        page = KeysetPage(self.object_list, self.keyset_keys[self.pki_type],
+                          after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        kwargs['page'] = page
+        kwargs['object_list'] = page.object_list
         return super().get_context_data(**kwargs)
 
     def get_queryset(self):
-        """"""
+        """Корневые узлы дерева или списки отзыва, при заданной строке поиска - найденные объекты"""
         if self.pki_type == 'crt':
-            return models.Crt.objects.all()
+            if self.query:
+                return search.search_queryset(models.Crt.objects.select_related('crl'), search.KIND_CRT, self.query)
+            return models.Crt.get_root_nodes().select_related('crl')
         elif self.pki_type == 'crl':
-            return models.Crl.objects.all()
+            queryset = models.Crl.objects.select_related('issuer', 'schedule')
+            if self.query:
+                return search.search_queryset(queryset, search.KIND_CRL, self.query)
+            return queryset
+
+
+class CrtChildrenView(SingleObjectMixin, TemplateView):
+    """Строки подчиненных сертификатов узла (фрагмент таблицы реестра) постранично по пути в дереве"""
+    template_name = 'django-pkiman/includes/crt_children.html'
+    model = models.Crt
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        page = KeysetPage(self.object.get_children().select_related('crl'), 'path',
+                          after=self.request.GET.get('after'))
+        kwargs['parent'] = self.object
+        kwargs['page'] = page
+        kwargs['object_list'] = page.object_list
+        kwargs['pki_type'] = 'crt'
+        kwargs['mgmt'] = bool(self.request.GET.get('mgmt')) and self.request.user.is_authenticated
+        return super().get_context_data(**kwargs)
 
 
 class ManagementModeMixin:
@@ -106,9 +163,12 @@ class ManagementUploadsView(LoginRequiredMixin, ManagementModeMixin, TemplateVie
             return self.render_to_response(self.get_context_data())
 
     def _handel_uploaded_file(self, request, up_file):
-        pki = PKIObject()
-        pki.read_x509(up_file)
+        if define_suffix(up_file.name, up_file.content_type) in bundle_suffixes:
+            return self._handel_uploaded_bundle(request, up_file)
+        pki = None
         try:
+            # файл с уже загруженным содержимым отклоняется по дайджесту до разбора и записи в БД
+            pki = read_x509(up_file, precheck=models.check_raw_duplicate)
             if pki.pki_type == 'crt':
                 model = models.Crt
             else:
@@ -128,6 +188,11 @@ class ManagementUploadsView(LoginRequiredMixin, ManagementModeMixin, TemplateVie
             messages.success(request, message)
             return self.render_to_response(self.get_context_data())
 
+        except PKIDuplicateError as e:
+            message = f'Файл "{up_file.name}" был загружен ранее. {e}'
+            logger.warn(message)
+            messages.warning(request, message)
+            return self.render_to_response(self.get_context_data())
         except (PKIError, FileExistsError) as e:
             message = e
         except IntegrityError as e:
@@ -140,6 +205,29 @@ class ManagementUploadsView(LoginRequiredMixin, ManagementModeMixin, TemplateVie
         messages.error(request, message)
         return self.render_to_response(self.get_context_data())
 
+    def _handel_uploaded_bundle(self, request, up_file):
+        """Загрузка всех сертификатов и списков отзыва из PEM набора или PKCS#7 контейнера одним пакетом"""
+        try:
+            result = models.get_from_pki_list(list(iter_x509_file(up_file)))
+        except (PKIError, ValueError) as e:
+            message = f'Ошибка загрузки файла "{up_file.name}": {e}'
+            logger.error(message)
+            messages.error(request, message)
+            return self.render_to_response(self.get_context_data())
+
+        for pki, error in result.errors:
+            message = f'Файл "{up_file.name}", {pki.pki_type}::{pki}: {error}'
+            logger.error(message)
+            messages.error(request, message)
+        message = (f'Файл "{up_file.name}": загружено объектов {len(result.created)}, '
+                   f'загружено ранее {len(result.exists)}, ошибок {len(result.errors)}')
+        logger.info(message)
+        if result.created:
+            messages.success(request, message)
+        else:
+            messages.warning(request, message)
+        return self.render_to_response(self.get_context_data())
+
 
 class ManagementUpdateCrl(LoginRequiredMixin, PermissionRequiredMixin, ManagementModeMixin, RedirectView):
     permission_required = 'crl:change_crl'
@@ -178,8 +266,7 @@ class ManagementGetParentCrt(LoginRequiredMixin, PermissionRequiredMixin, Single
             try:
                 url_list = object.auth_info.values()
                 up_file = get_from_url_list(url_list, proxy=proxy)
-                pki = PKIObject()
-                pki.read_x509(up_file)
+                pki = read_x509(up_file)
                 parent_crt, _ = self.model.objects.get_from_pki(pki)
                 message = f'Сертификат "ID:{parent_crt.subject_identifier}" успешно загружен'
                 logger.info(message)
@@ -189,7 +276,7 @@ class ManagementGetParentCrt(LoginRequiredMixin, PermissionRequiredMixin, Single
                 if object.cdp_info and parent_crt:
                     url_list = [cdp[0] for cdp in object.cdp_info.values()]
                     up_file = get_from_url_list(url_list, proxy=proxy)
-                    pki.read_x509(up_file)
+                    pki = read_x509(up_file)
                     parent_crl, _ = models.Crl.objects.get_from_pki(pki)
                     parent_crl.urls = ','.join(url_list)
                     parent_crl.save()
@@ -217,6 +304,88 @@ class ManagementScheduleView(LoginRequiredMixin, ManagementModeMixin, ListView):
     paginate_by = 25
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class RevocationStatusView(View):
+    """Пакетная проверка статуса отзыва.
+    POST {"items": [{"issuer": "<идентификатор ключа издателя>", "serial": "<серийный номер>"}, ...]}
+    GET - счетчики проверок процесса.
+    Доступ - по токену из PKIMAN_STATUS_API_TOKENS (заголовок Authorization: Bearer <токен>) или с адресов
+    из PKIMAN_STATUS_ALLOWED_IPS. Без настроек доступ запрещен
+    """
+    http_method_names = ['get', 'post']
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.has_access(request):
+            return JsonResponse({'error': 'Доступ запрещен'}, status=403)
+        return super().dispatch(request, *args, **kwargs)
+
+    @staticmethod
+    def has_access(request) -> bool:
+        scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() == 'bearer' and token:
+            tokens = getattr(settings, 'PKIMAN_STATUS_API_TOKENS', DEFAULT_PKIMAN_STATUS_API_TOKENS)
+            if any(hmac.compare_digest(token.strip().encode(), str(value).encode()) for value in tokens):
+                return True
+        networks = getattr(settings, 'PKIMAN_STATUS_ALLOWED_IPS', DEFAULT_PKIMAN_STATUS_ALLOWED_IPS)
+        if not networks:
+            return False
+        try:
+            address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+        except ValueError:
+            return False
+        return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'stats': revocation_status.stats.info()._asdict()})
+
+    def post(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            items = [(item['issuer'].replace(':', '').lower(), revocation_status.parse_serial(item['serial']))
+                     for item in json.loads(request.body)['items']]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return JsonResponse({'error': f'Неверный формат запроса: {e!r}'}, status=400)
+        batch_max = getattr(settings, 'PKIMAN_STATUS_BATCH_MAX', DEFAULT_PKIMAN_STATUS_BATCH_MAX)
+        if len(items) > batch_max:
+            return JsonResponse({'error': f'Превышен размер пакета: {batch_max}'}, status=400)
+
+        results = revocation_status.check_status(items)
+        for (issuer, serial), result in zip(items, results):
+            result.update(issuer=issuer, serial=str(serial))
+        elapsed = time.perf_counter() - started
+        return JsonResponse({'results': results,
+                             'stats': {'count': len(items),
+                                       'elapsed_ms': round(elapsed * 1000, 3),
+                                       'per_second': round(len(items) / elapsed) if elapsed else None}})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class OCSPView(View):
+    """OCSP ответчик. POST - DER запрос в теле, GET - запрос в base64 в пути URL (RFC 6960 A.1)"""
+    http_method_names = ['get', 'post']
+
+    def get(self, request, *args, **kwargs):
+        data = kwargs.get('data', '')
+        try:
+            der = base64.b64decode(data.replace('-', '+').replace('_', '/') + '=' * (-len(data) % 4))
+        except (binascii.Error, ValueError):
+            der = b''
+        response, expires = ocsp.respond(der)
+        http_response = HttpResponse(response, content_type=ocsp.OCSP_RESPONSE_CONTENT_TYPE)
+        if expires is not None:
+            # RFC 5019 6.2
+            max_age = max(int((expires - timezone.now()).total_seconds()), 0)
+            http_response['Cache-Control'] = f'max-age={max_age}, public, no-transform, must-revalidate'
+            http_response['Expires'] = http_date(expires.timestamp())
+        return http_response
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type != ocsp.OCSP_REQUEST_CONTENT_TYPE:
+            return HttpResponse(status=415)
+        response, _ = ocsp.respond(request.body)
+        return HttpResponse(response, content_type=ocsp.OCSP_RESPONSE_CONTENT_TYPE)
+
+
 class DocsView(TemplateView):
     """"""
     template_name = 'django-pkiman/docs.html'
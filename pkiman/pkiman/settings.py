@@ -135,11 +135,67 @@ FIRST_DAY_OF_WEEK = 1
 # --- PKIMAN ---
 # Период хранения записей журнала в БД (дни)
 # PKIMAN_JOURNAL_STORE_PERIOD = 365
-
-# Периодический запуск функции обновления CRL
+# Запись журнала: синхронная в транзакции вызывающего кода или пакетами из фонового потока
+# при накоплении PKIMAN_JOURNAL_BUFFER_SIZE записей или раз в PKIMAN_JOURNAL_FLUSH_INTERVAL секунд
+# PKIMAN_JOURNAL_SYNC = False
+# PKIMAN_JOURNAL_BUFFER_SIZE = 100
+# PKIMAN_JOURNAL_FLUSH_INTERVAL = 1.0
+# Очистка журнала: количество записей, удаляемых одной транзакцией, и пауза между транзакциями (секунды)
+# PKIMAN_JOURNAL_CLEAN_CHUNK_SIZE = 1000
+# PKIMAN_JOURNAL_CLEAN_PAUSE = 0.05
+
+# Периодический запуск функции обновления CRL. Загружаются только списки отзыва, время проверки которых
+# наступило, поэтому запуск может быть частым. Вместо crontab можно использовать команду pkiman_refresh --loop
 # MIN HOURS DAY MONTH WEEKDAY
 CRONJOBS = [
     # ('*/15 12-18 * * *', 'django_pkiman.utils.download.update_handle'),
-    ('1 0-23 * * *', 'django_pkiman.utils.download.update_handle'),
+    ('*/5 * * * *', 'django_pkiman.utils.download.update_handle'),
     # ('0 0 1 * *', 'django_pkiman.utils.logger.journal_clean')
 ]
+
+# Обновление списков отзыва (update_handle): количество потоков загрузки, одновременных запросов к одному
+# серверу и через один прокси-сервер
+# PKIMAN_UPDATE_WORKERS = 16
+# PKIMAN_UPDATE_HOST_CONCURRENCY = 2
+# PKIMAN_UPDATE_PROXY_CONCURRENCY = 8
+# Планирование проверки (секунды): запас до next_update, повтор после ошибки или неопубликованной ожидаемой
+# версии, наибольший интервал между проверками, доля задержки для случайного сдвига проверки раньше,
+# период перечитывания очереди pkiman_refresh --loop
+# PKIMAN_REFRESH_MARGIN = 3600
+# PKIMAN_REFRESH_RETRY = 900
+# PKIMAN_REFRESH_MAX_INTERVAL = 86400
+# PKIMAN_REFRESH_JITTER = 0.1
+# PKIMAN_REFRESH_RELOAD = 300
+# Максимальный размер загружаемого по URL файла (байт)
+# PKIMAN_DOWNLOAD_MAX_SIZE = 100 * 1024 * 1024
+# Загрузка по URL: таймауты соединения и чтения (секунды), количество повторов и множитель задержки между
+# повторами (секунды), количество соединений keep-alive к одному серверу в сессии прокси-сервера
+# PKIMAN_HTTP_TIMEOUT = (5, 30)
+# PKIMAN_HTTP_RETRIES = 3
+# PKIMAN_HTTP_BACKOFF = 0.5
+# PKIMAN_HTTP_POOL_SIZE = 16
+
+# Кэш разбора x509 файлов по содержимому: количество записей и суммарный размер исходных данных (байт)
+# PKIMAN_PARSE_CACHE_SIZE = 256
+# PKIMAN_PARSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Количество записей на странице реестра и в подгружаемом списке подчиненных сертификатов
+# PKIMAN_REESTR_PAGE_SIZE = 50
+
+# Пакетная проверка статуса отзыва (/api/status/): максимальный размер пакета, вероятность ложного
+# срабатывания фильтра Блума, время хранения соответствия издатель - список отзыва (секунды)
+# PKIMAN_STATUS_BATCH_MAX = 10000
+# PKIMAN_STATUS_BLOOM_ERROR_RATE = 0.001
+# PKIMAN_STATUS_ISSUER_TTL = 60
+# Доступ к /api/status/: токены клиентов (заголовок Authorization: Bearer <токен>) и адреса или сети клиентов,
+# которым доступ разрешен без токена. Без настроек доступ запрещен
+# PKIMAN_STATUS_API_TOKENS = []
+# PKIMAN_STATUS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# OCSP ответчик (/ocsp/): сертификат и закрытый ключ (PEM) ответчика, хеш подписи ответов,
+# время хранения таблицы издателей (секунды)
+# PKIMAN_OCSP_RESPONDER_CERT = BASE_DIR / 'ocsp' / 'responder.crt'
+# PKIMAN_OCSP_RESPONDER_KEY = BASE_DIR / 'ocsp' / 'responder.key'
+# PKIMAN_OCSP_RESPONDER_KEY_PASSWORD = None
+# PKIMAN_OCSP_SIGN_HASH = 'SHA256'
+# PKIMAN_OCSP_ISSUER_TTL = 60